@@ -0,0 +1,45 @@
+"""Save benchmark results as a baseline and show the difference with a previous one"""
+
+import json
+import os
+
+
+def metric(value: float, unit: str, better: str = "lower") -> dict:
+    return { "value": value, "unit": unit, "better": better }
+
+
+def save_baseline(path: str, results: dict[str, dict]) -> None:
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w") as baseline:
+        json.dump(results, baseline, indent=2, sort_keys=True)
+        baseline.write("\n")
+
+
+def compare_with_baseline(path: str, results: dict[str, dict], tolerance: float = 0.10) -> bool:
+    """Print one line per metric and return False if one of them regressed by more than tolerance"""
+    with open(path) as baseline_file:
+        baseline = json.load(baseline_file)
+
+    passed = True
+    print(f"{'metric':<50} {'baseline':>14} {'current':>14} {'change':>9}")
+    for name, current in sorted(results.items()):
+        previous = baseline.get(name)
+        if previous is None or previous["value"] == 0:
+            print(f"{name:<50} {'-':>14} {current['value']:>14.2f} {'new':>9}")
+            continue
+
+        change = (current["value"] - previous["value"]) / previous["value"]
+        regressed = change > tolerance if current["better"] == "lower" else change < -tolerance
+        passed = passed and not regressed
+
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{name:<50} {previous['value']:>14.2f} {current['value']:>14.2f} {change:>+9.1%}{flag}")
+
+    return passed
+
+
+def print_results(results: dict[str, dict]) -> None:
+    for name, current in sorted(results.items()):
+        print(f"{name:<50} {current['value']:>14.2f} {current['unit']}")
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+    Cold start benchmark of the command line.
+
+    - `python -X importtime` of the signing path and of the command line module
+    - end-to-end latency of a shadow GET through the command line, against a local stub server
+
+    Usage : python benchmarks/bench_startup.py [-n 20] [--save <baseline.json>] [--compare <baseline.json>]
+"""
+
+import os
+import sys
+import math
+import time
+import argparse
+import threading
+import statistics
+import subprocess
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from baseline import metric, save_baseline, compare_with_baseline, print_results
+
+
+SRC_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+# Modules which must never be loaded to sign a request
+FORBIDDEN_ON_SIGNING_PATH = ["requests", "pytz", "argparse", "ssl", "http.client"]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_request(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        content = b'{"state":{"reported":{}},"version":1}'
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    do_GET = do_POST = do_DELETE = do_request
+
+    def log_message(self, format, *args):
+        pass
+
+
+def run_python(args: list[str]) -> subprocess.CompletedProcess:
+    env = { **os.environ, "PYTHONPATH": SRC_PATH }
+    return subprocess.run([sys.executable, *args], env=env, capture_output=True, text=True, check=True)
+
+
+def import_time(module: str) -> tuple[float, list[str]]:
+    """Return the cumulative import time of module in ms, and the modules it imported"""
+    stderr = run_python(["-X", "importtime", "-c", f"import {module}"]).stderr
+
+    total_us = 0
+    imported = []
+    after_site = False
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        imported.append(name.strip())
+        # Root entries after 'site' are the ones imported by the -c statement
+        if not name.startswith("  "):
+            if after_site:
+                total_us += int(cumulative)
+            after_site = after_site or name.strip() == "site"
+
+    return total_us / 1000, imported
+
+
+def cli_latency(endpoint: str) -> float:
+    start = time.perf_counter_ns()
+    run_python(["-m", "aws_create_request.app", "-t", "my-thing", "-m", "get", "-a", "key_id", "-k", "secret", "-e", endpoint])
+    return (time.perf_counter_ns() - start) / 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Cold start benchmark of the command line")
+    parser.add_argument("-n", "--runs", type=int, default=20, help="Runs per measure. Default to 20")
+    parser.add_argument("--save", help="Save the results as a baseline in this file")
+    parser.add_argument("--compare", help="Compare the results with the baseline of this file")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed regression. Default to 0.10")
+    args = parser.parse_args()
+
+    results = {}
+
+    for module in ["aws_create_request.string_to_sign", "aws_create_request.app"]:
+        durations = []
+        for _ in range(args.runs):
+            duration, imported = import_time(module)
+            durations.append(duration)
+        results[f"import {module}"] = metric(statistics.median(durations), "ms")
+
+        if module == "aws_create_request.string_to_sign":
+            loaded = [name for name in FORBIDDEN_ON_SIGNING_PATH if name in imported]
+            if loaded:
+                print(f"WARNING: the signing path imports {', '.join(loaded)}", file=sys.stderr)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    endpoint = f"http://127.0.0.1:{server.server_address[1]}"
+
+    latencies = sorted(cli_latency(endpoint) for _ in range(args.runs))
+    results["cli get median"] = metric(statistics.median(latencies), "ms")
+    # Nearest rank : never below the median, even for a few runs
+    results["cli get p95"] = metric(latencies[min(len(latencies) - 1, math.ceil(len(latencies) * 0.95) - 1)], "ms")
+
+    server.shutdown()
+    server.server_close()
+
+    print_results(results)
+
+    if args.save:
+        save_baseline(args.save, results)
+    if args.compare:
+        if not compare_with_baseline(args.compare, results, args.tolerance):
+            sys.exit(1)
+
+
+if __name__.__eq__("__main__"):
+    main()
@@ -8,6 +8,7 @@
 
 PATH_TO_APP="src/aws_create_request"
 APP_NAME="app.py"
+DAEMON_CLIENT_NAME="daemon_client.py"
 
 
 
@@ -78,7 +79,37 @@ fi
 # load variables
 source "$CONF_FILE"
 
-PARAMS="-t $THING_NAME -m $METHOD -a $AWS_ACCESS_KEY_ID -k $AWS_SECRET_ACCESS_KEY"
+# A running daemon (aws_shadows_daemon) already holds the credentials, the region and the connections
+if [ "$DAEMON_SOCKET" ] && [ -S "$DAEMON_SOCKET" ]
+then 
+    DAEMON_PARAMS=(--socket "$DAEMON_SOCKET" -t "$THING_NAME" -m "$METHOD")
+    if [ "$SHADOW_NAME" ]
+    then 
+        DAEMON_PARAMS+=(-s "$SHADOW_NAME")
+    fi 
+    if [ "$PATH_TO_STATE_DOCUMENT" ]
+    then 
+        DAEMON_PARAMS+=(-d "$PATH_TO_STATE_DOCUMENT")
+    fi 
+
+    exec python3 -S $PATH_TO_APP/$DAEMON_CLIENT_NAME "${DAEMON_PARAMS[@]}"
+fi 
+
+PARAMS="-t $THING_NAME -m $METHOD"
+
+# Without them, the app looks for credentials in the environment, then in ~/.aws/credentials
+if [ "$AWS_ACCESS_KEY_ID" ] && [ "$AWS_SECRET_ACCESS_KEY" ]
+then 
+    PARAMS="$PARAMS -a $AWS_ACCESS_KEY_ID -k $AWS_SECRET_ACCESS_KEY"
+fi 
+if [ "$AWS_SESSION_TOKEN" ]
+then 
+    PARAMS="$PARAMS --session-token $AWS_SESSION_TOKEN"
+fi 
+if [ "$AWS_PROFILE" ]
+then 
+    PARAMS="$PARAMS --profile $AWS_PROFILE"
+fi 
 
 if [ "$REGION" ]
 then 
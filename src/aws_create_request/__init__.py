@@ -4,7 +4,27 @@ __license__ = "MIT"
 
 __version__ = "0.0.1"
 
-from aws_create_request.app import get_response_from_request
+import importlib
 
-def main() -> dict:
-    return get_response_from_request()
+# Loaded on first access, so that importing the package (or running the command
+# line) only pays for the modules actually used
+__lazy_attributes = {
+    "get_response_from_request": "aws_create_request.app",
+    "Credentials": "aws_create_request.app",
+    "ShadowClient": "aws_create_request.client",
+    "ShadowResponse": "aws_create_request.client",
+    "SignedRequest": "aws_create_request.client",
+}
+
+__all__ = ["main", *__lazy_attributes]
+
+def __getattr__(name: str):
+    if name in __lazy_attributes:
+        return getattr(importlib.import_module(__lazy_attributes[name]), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def main() -> None:
+    from aws_create_request.app import get_response_from_request
+
+    # The response is already written : the console script exits with the returned value
+    get_response_from_request()
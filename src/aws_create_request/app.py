@@ -1,20 +1,36 @@
 #!/usr/bin/env python3
 
+from __future__ import annotations
+
 import sys
-import requests
-import argparse
 import json
-import os
+import time
+
+from typing import TYPE_CHECKING
 
 from aws_create_request.canonical_request import CanonicalRequest
 from aws_create_request.string_to_sign import StringToSign
-from aws_create_request.constants import HTTPMethod, AVAILABLE_REGION
+from aws_create_request.constants import HTTPMethod, AVAILABLE_REGION, LIST_NAMED_SHADOWS, RESENDABLE_METHODS, SERVICE
+from aws_create_request.metrics import PhaseTimer, latency_metrics
+
+# The signing path only needs the modules above : argparse and the transports
+# are imported when the command line is parsed or a request is sent
+if TYPE_CHECKING:
+    import argparse
+    import datetime
+
+    from aws_create_request.payload import StatePayload
+    from aws_create_request.retry import RetryPolicy
+    from aws_create_request.transport import Transport, TransportResponse
 
 
 class Credentials:
-    def __init__(self, aws_access_key_id = "", aws_secret_access_key = "") -> None:
+    def __init__(self, aws_access_key_id = "", aws_secret_access_key = "", aws_session_token = "", expiration: datetime.datetime | None = None) -> None:
         self.aws_access_key_id: str = aws_access_key_id
         self.aws_secret_access_key: str = aws_secret_access_key
+        # Temporary credentials only
+        self.aws_session_token: str = aws_session_token
+        self.expiration: datetime.datetime | None = expiration
 
     def get_aws_access_key_id(self) -> str:
         return self.aws_access_key_id
@@ -22,23 +38,41 @@ class Credentials:
     def get_aws_secret_access_key(self) -> str:
         return self.aws_secret_access_key
 
-    def set_credentials(self, aws_access_key_id, aws_secret_access_key) -> None:
+    def get_aws_session_token(self) -> str:
+        return self.aws_session_token
+
+    def set_credentials(self, aws_access_key_id, aws_secret_access_key, aws_session_token = "") -> None:
         self.aws_access_key_id = aws_access_key_id
         self.aws_secret_access_key = aws_secret_access_key
+        self.aws_session_token = aws_session_token
+
+    def get_frozen_credentials(self) -> Credentials:
+        """Credentials to sign one request with : the key id, the secret and the token always go together"""
+        return self
+
+    def close(self) -> None:
+        """Nothing to release : only refreshed credentials have a background refresh to stop"""
 
 class CreateRequest:
     """Class to generate http request with authorization header"""
 
     def __init__(self) -> None:
-        self.service: str = "iotdata"
+        self.service: str = SERVICE
 
         self.thing_name: str = ""
         self.region: str = ""
         self.shadow_method: str = ""
         self.credentials: Credentials = Credentials()
-        self.payload: str = ""
+        self.payload: str | StatePayload = ""
         self.shadow_name: str | None = None
-
+        self.transport: Transport | None = None
+        self.delta_store: str | None = None
+        self.metrics_format: str | None = None
+        self.retry_policy: RetryPolicy | None = None
+        self.output_format: str = "pretty"
+        self.gzip_path: str | None = None
+
+        self.frozen_credentials = None
         self.canonical_request = None
         self.canonical_request_hash = None
         self.string_to_sign = None
@@ -57,6 +91,11 @@ class CreateRequest:
         return args
 
     def __init_argparse(self) -> argparse.ArgumentParser:
+        import argparse
+
+        from aws_create_request.output import OUTPUT_FORMATS
+        from aws_create_request.transport import TRANSPORTS
+
         parser = argparse.ArgumentParser(
             "ShadowHttpApi", 
             description="Manipulating AWS shadow using HTTP API and only natives python's modules",
@@ -75,7 +114,7 @@ class CreateRequest:
             "-m", 
             "--method", 
             dest="method",
-            help="The shadow method. It is can be either GET, DELETE and UPDATE.",
+            help="The shadow method. It is can be either GET, DELETE and UPDATE, or LIST for the names of the named shadows of the thing.",
             required=True
         )
 
@@ -91,7 +130,7 @@ class CreateRequest:
             "-d", 
             "--state-document", 
             dest="state_document",
-            help="Path to the shadow request state document. Required only if shadow method is update.",
+            help="Path to the shadow request state document, or '-' to read it from the standard input. Required only if shadow method is update.",
             required=False
         )
 
@@ -108,8 +147,8 @@ class CreateRequest:
             "-a", 
             "--aws-access-key-id", 
             dest="aws_access_key_id",
-            help="AWS access key id that you can find in ~/.aws/credentials",
-            required=True
+            help="AWS access key id that you can find in ~/.aws/credentials. Default to the AWS_ACCESS_KEY_ID environment variable, the credentials endpoint, then ~/.aws/credentials",
+            required=False
         )
         
         parser.add_argument(
@@ -117,7 +156,116 @@ class CreateRequest:
             "--aws-secret-access-key", 
             dest="aws_secret_access_key",
             help="AWS secret access key that you can find in ~/.aws/credentials",
-            required=True
+            required=False
+        )
+
+        parser.add_argument(
+            "--session-token", 
+            dest="aws_session_token",
+            help="AWS session token of temporary credentials, signed in the X-Amz-Security-Token header",
+            required=False
+        )
+
+        parser.add_argument(
+            "--profile", 
+            dest="profile",
+            help="Read the credentials from this profile of ~/.aws/credentials",
+            required=False
+        )
+
+        parser.add_argument(
+            "--credentials-endpoint", 
+            dest="credentials_endpoint",
+            help="Get temporary credentials from this URL, and get them again before they expire",
+            required=False
+        )
+
+        parser.add_argument(
+            "--cert", 
+            dest="certfile",
+            help="X.509 certificate of the thing. The request is sent to port 8443 with this client certificate, without SigV4 signature nor AWS credentials.",
+            required=False
+        )
+
+        parser.add_argument(
+            "--key", 
+            dest="keyfile",
+            help="Private key of the certificate, if it is not in the --cert file",
+            required=False
+        )
+
+        parser.add_argument(
+            "--ca", 
+            dest="cafile",
+            help="CA certificates to verify the server with (e.g. AmazonRootCA1.pem) instead of the default ones",
+            required=False
+        )
+
+        parser.add_argument(
+            "--transport", 
+            default="http.client",
+            choices=list(TRANSPORTS),
+            dest="transport",
+            help="The HTTP client used to send the request. Default to 'http.client'. 'requests' needs the requests module, 'http2' the h2 module.",
+            required=False
+        )
+
+        parser.add_argument(
+            "-e", 
+            "--endpoint", 
+            dest="endpoint",
+            help="Send the request to this endpoint (e.g. http://127.0.0.1:8080) instead of data-ats.iot.<region>.amazonaws.com. The signed host is unchanged.",
+            required=False
+        )
+
+        parser.add_argument(
+            "--delta-store", 
+            dest="delta_store",
+            help="Directory where the last acknowledged state of each shadow is kept. With it, an UPDATE only sends what changed since then, with the shadow version.",
+            required=False
+        )
+
+        parser.add_argument(
+            "--retries", 
+            default=3,
+            type=int,
+            dest="retries",
+            help="Retries of a request throttled (429), failed on the AWS side (5xx) or whose connection failed, each one signed again. Default to 3",
+            required=False
+        )
+
+        parser.add_argument(
+            "--timeout", 
+            default=10.0,
+            type=float,
+            dest="timeout",
+            help="Seconds to wait for the connection or the response of each attempt. Default to 10",
+            required=False
+        )
+
+        parser.add_argument(
+            "-o", 
+            "--output", 
+            default="pretty",
+            choices=list(OUTPUT_FORMATS),
+            dest="output_format",
+            help="'pretty' (default) indents the response, 'compact' writes it on one line, 'raw' writes the bytes of the response unchanged and 'ndjson' one line per response without decoding it.",
+            required=False
+        )
+
+        parser.add_argument(
+            "--gzip", 
+            dest="gzip_path",
+            help="Write the response compressed with gzip in this file instead of the standard output.",
+            required=False
+        )
+
+        parser.add_argument(
+            "--metrics", 
+            choices=["prometheus", "json"],
+            dest="metrics_format",
+            help="Print the latency of each phase of the request (signing, DNS, TCP connect, TLS handshake, time to first byte, JSON decoding) on the standard error.",
+            required=False
         )
 
         return parser
@@ -127,7 +275,17 @@ class CreateRequest:
         try:
             self.thing_name = args.thing_name
             self.shadow_method = args.method
-            self.credentials.set_credentials(aws_access_key_id=args.aws_access_key_id, aws_secret_access_key=args.aws_secret_access_key)
+            # The client certificate authenticates the request instead of the credentials
+            if args.certfile is None:
+                from aws_create_request.credentials import resolve_credentials
+
+                self.credentials = resolve_credentials(
+                    aws_access_key_id=args.aws_access_key_id,
+                    aws_secret_access_key=args.aws_secret_access_key,
+                    aws_session_token=args.aws_session_token,
+                    profile=args.profile,
+                    endpoint=args.credentials_endpoint
+                )
         except Exception as e:
             sys.exit(e)
 
@@ -142,33 +300,62 @@ class CreateRequest:
                 self.region = args.region
         if args.shadow_name:
             self.shadow_name = args.shadow_name
+        if args.delta_store:
+            self.delta_store = args.delta_store
+        if args.metrics_format:
+            self.metrics_format = args.metrics_format
+        self.output_format = args.output_format
+        self.gzip_path = args.gzip_path
+
+        try:
+            if args.certfile is not None:
+                from aws_create_request.transport import MutualTLSTransport
+
+                self.transport = MutualTLSTransport(args.certfile, args.keyfile, args.cafile, endpoint=args.endpoint, timeout=args.timeout)
+            else:
+                from aws_create_request.transport import create_transport
+
+                self.transport = create_transport(args.transport, endpoint=args.endpoint, timeout=args.timeout)
+            if args.retries > 0:
+                from aws_create_request.retry import RetryPolicy
+
+                self.retry_policy = RetryPolicy(max_attempts=args.retries + 1)
+        except Exception as e:
+            sys.exit(e)
         
         try:
-            if getattr(HTTPMethod, self.shadow_method.upper()) == HTTPMethod.UPDATE:
+            # LIST has no state document
+            if self.shadow_method.upper() != LIST_NAMED_SHADOWS and getattr(HTTPMethod, self.shadow_method.upper()) == HTTPMethod.UPDATE:
                 if args.state_document:
-                    self.payload = self.__get_payload_from_state_document(args.state_document)
+                    from aws_create_request.payload import check_state_payload, read_state_document
+
+                    self.payload = read_state_document(args.state_document)
+                    check_state_payload(self.payload)
                 else:
-                    raise argparse.ArgumentError("Argument missing", "With an UPDATE shadow method, a path to the state document have to be passed")
+                    raise ValueError("With an UPDATE shadow method, a path to the state document have to be passed")
         except AttributeError as a_err:
             sys.exit(a_err)
         except Exception as e:
             sys.exit(e)
 
-    def __get_payload_from_state_document(self, state_document_path):
-        if not os.path.exists(state_document_path):
-            raise FileExistsError(f"Path {state_document_path} does not exist")
-        else:
-            try:
-                with open(state_document_path) as state_document:
-                    state_document_content: str = str(json.load(state_document)).replace("'", "\"")
-                    return state_document_content
-            except Exception:
-                raise Exception("Error while reading request state document")
-
     def init_context_request(self) -> None:
         args = self.__parser_cmd_line()
         self.__init_parameters(args)
 
+    def set_context_request(self, thing_name: str, shadow_method: str, credentials: Credentials, region: str, shadow_name: str | None = None, payload: str | StatePayload = "") -> None:
+        """Initialize the request without the command line, e.g. for each line of a batch"""
+        if region not in AVAILABLE_REGION:
+            raise ValueError(f"'{region}' is not an available region")
+        if not hasattr(HTTPMethod, shadow_method.upper()):
+            raise ValueError(f"'{shadow_method}' is not a shadow method. It is can be either GET, DELETE and UPDATE.")
+
+        self.thing_name = thing_name
+        self.shadow_method = shadow_method
+        self.credentials = credentials
+        self.region = region
+        self.shadow_name = shadow_name if shadow_name else None
+        self.payload = payload
+
 
 
     ######################################
@@ -176,13 +363,18 @@ class CreateRequest:
     ######################################
 
     def __create_canonical_request(self) -> None:
+        self.frozen_credentials = self.credentials.get_frozen_credentials()
         self.canonical_request = CanonicalRequest()
         self.canonical_request.complete_canonical_request(
             shadow_method=self.shadow_method,
             thing_name=self.thing_name,
             shadow_name=self.shadow_name,
             region=self.region,
-            payload=self.payload
+            payload=self.payload if isinstance(self.payload, str) else "",
+            # A streamed state document was hashed while it was read
+            hashed_payload=None if isinstance(self.payload, str) else self.payload.hashed_payload,
+            security_token=self.frozen_credentials.aws_session_token,
+            host_header=self.transport.host_header if self.transport is not None else "host"
         )
 
     def __hash_canonical_request(self) -> None:
@@ -198,22 +390,29 @@ class CreateRequest:
         )
 
     def __calculate_signature(self) -> None:
-        self.signature = self.string_to_sign.calculate_signature(self.credentials.aws_secret_access_key)
+        self.signature = self.string_to_sign.calculate_signature(self.frozen_credentials.aws_secret_access_key)
 
     def __generate_authorization_header(self) -> None:
         auth_list = ["AWS4-HMAC-SHA256"]
-        auth_list.append(f"Credential={self.credentials.aws_access_key_id}/{self.string_to_sign.credential_scope}")
+        auth_list.append(f"Credential={self.frozen_credentials.aws_access_key_id}/{self.string_to_sign.credential_scope}")
         auth_list.append(f"SignedHeaders={self.canonical_request.signed_headers}")
         auth_list.append(f"Signature={self.signature}")
 
         self.authorization = { "Authorization": " ".join(auth_list) }
 
     def generate_authorization(self):
+        timer = PhaseTimer(latency_metrics, getattr(HTTPMethod, self.shadow_method.upper(), self.shadow_method), self.region)
+
         self.__create_canonical_request()
+        timer.lap("canonical_request")
         self.__hash_canonical_request()
+        timer.lap("hash_canonical_request")
         self.__create_string_to_sign()
+        timer.lap("string_to_sign")
         self.__calculate_signature()
+        timer.lap("signature")
         self.__generate_authorization_header()
+        timer.lap("authorization_header")
 
 
 
@@ -221,31 +420,125 @@ class CreateRequest:
     # EXECUTE REQUEST
     ######################################
 
-    def execute_request(self) -> requests.Response:
+    def prepare_request(self) -> tuple[str, str, str, dict[str, str], bytes | memoryview]:
+        """Return the method, host, path, headers and body of the signed request"""
         host = f"data-ats.iot.{self.region}.amazonaws.com"
-        url = f"https://{host}{self.canonical_request.canonical_uri}"
+        path = self.canonical_request.canonical_uri
 
         if len(self.canonical_request.canonical_query_string) > 0:
-            url = f"{url}?{self.canonical_request.canonical_query_string}"
+            path = f"{path}?{self.canonical_request.canonical_query_string}"
+
+        body = self.payload.encode("utf-8") if isinstance(self.payload, str) else self.payload.body
 
         headers = self.authorization
         headers.update({
             "X-Amz-Date": self.string_to_sign.request_date_time,
-            "Content-Length": str(len(self.payload))
+            "Content-Length": str(len(body))
         })
+        if self.frozen_credentials.aws_session_token:
+            headers["X-Amz-Security-Token"] = self.frozen_credentials.aws_session_token
+
+        return self.canonical_request.http_method, host, path, headers, body
+
+    def execute_request(self, transport: Transport | None = None) -> TransportResponse:
+        if transport is None:
+            transport = self.transport
+        if transport is None:
+            from aws_create_request.transport import create_transport
+
+            transport = create_transport()
+            self.transport = transport
+
+        if self.retry_policy is None:
+            return transport.request(*self.prepare_request())
 
-        return requests.request(self.canonical_request.http_method, url, headers=headers, data=self.payload)
+        attempts = 0
+        def send() -> TransportResponse:
+            nonlocal attempts
+            if attempts > 0:
+                # A retry is signed again, with a new X-Amz-Date
+                self.generate_authorization()
+            attempts += 1
+            return transport.request(*self.prepare_request())
 
+        return self.retry_policy.call(send, getattr(HTTPMethod, self.shadow_method.upper(), None) in RESENDABLE_METHODS)
+
+    def execute_certificate_request(self):
+        """Send the request without SigV4 : the client certificate of the transport authenticates it"""
+        from aws_create_request.client import ShadowClient
+
+        client = ShadowClient(None, self.region, transport=self.transport, retry_policy=self.retry_policy)
+        return client.request(self.shadow_method, self.thing_name, self.shadow_name, self.payload)
+
+    def execute_list_request(self) -> TransportResponse:
+        """Names of every named shadow of the thing, all the pages of ListNamedShadowsForThing in one response"""
+        from aws_create_request.client import ShadowClient
+        from aws_create_request.exceptions import ShadowResponseError
+        from aws_create_request.transport import TransportResponse
+
+        client = ShadowClient(None if self.transport.authenticates else self.credentials, self.region, transport=self.transport, retry_policy=self.retry_policy)
+        try:
+            results = list(client.list_named_shadows(self.thing_name))
+        except ShadowResponseError as s_err:
+            return TransportResponse(s_err.status_code, {}, s_err.content)
+        return TransportResponse(200, {}, json.dumps({ "results": results }, separators=(",", ":")).encode("utf-8"))
+
+    def execute_delta_request(self):
+        """Execute the request through a DeltaUpdater using the delta store directory"""
+        from aws_create_request.client import ShadowClient
+        from aws_create_request.delta import DeltaUpdater, FileShadowStateStore
+
+        client = ShadowClient(None if self.transport.authenticates else self.credentials, self.region, transport=self.transport, retry_policy=self.retry_policy)
+        delta_updater = DeltaUpdater(client, FileShadowStateStore(self.delta_store))
+        shadow_method = getattr(HTTPMethod, self.shadow_method.upper())
+
+        if shadow_method == HTTPMethod.UPDATE:
+            state_document = json.loads(self.payload if isinstance(self.payload, str) else bytes(self.payload.body))
+            return delta_updater.update(self.thing_name, state_document, self.shadow_name)
+
+        response = client.request(self.shadow_method, self.thing_name, self.shadow_name)
+        if shadow_method == HTTPMethod.DELETE and response.ok:
+            delta_updater.forget(self.thing_name, self.shadow_name)
+        return response
+
+
+def get_response_from_request() -> bytes:
+    """Execute the request of the command line and return the bytes written to the output"""
+    from aws_create_request.output import ResponseOutput, format_document, format_response
 
-def get_response_from_request() -> dict:
     create_request = CreateRequest()
     create_request.init_context_request()
-    create_request.generate_authorization()
-    res_execution = create_request.execute_request()
-
-    response = json.dumps(res_execution.json(), indent=2)
 
-    print(response)
+    if create_request.shadow_method.upper() == LIST_NAMED_SHADOWS:
+        res_execution = create_request.execute_list_request()
+    elif create_request.delta_store is not None:
+        res_execution = create_request.execute_delta_request()
+    elif create_request.transport.authenticates:
+        res_execution = create_request.execute_certificate_request()
+    else:
+        create_request.generate_authorization()
+        res_execution = create_request.execute_request()
+
+    # None : nothing changed since the last acknowledged state, so nothing was sent
+    content = res_execution.content if res_execution is not None else b"{}"
+
+    if create_request.output_format in ("raw", "ndjson"):
+        response = format_response(content, create_request.output_format)
+    else:
+        decoding_at = time.perf_counter()
+        document = json.loads(content) if content.strip() else {}
+        latency_metrics.observe("json_decode", getattr(HTTPMethod, create_request.shadow_method.upper(), HTTPMethod.GET), create_request.region, time.perf_counter() - decoding_at)
+        response = format_document(document, create_request.output_format)
+
+    try:
+        with ResponseOutput(create_request.gzip_path) as output:
+            output.write(response)
+    except OSError as o_err:
+        sys.exit(o_err)
+    if create_request.metrics_format == "prometheus":
+        print(latency_metrics.to_prometheus(), end="", file=sys.stderr)
+    elif create_request.metrics_format == "json":
+        print(latency_metrics.to_json(), file=sys.stderr)
     return response
 
 
@@ -0,0 +1,221 @@
+
+import ssl
+import time
+import asyncio
+
+from types import MappingProxyType
+
+from aws_create_request.app import Credentials
+from aws_create_request.client import ShadowResponse, SignedRequest, encode_state_document, sign_request
+from aws_create_request.constants import AVAILABLE_REGION, RESENDABLE_METHODS, HTTPMethod
+from aws_create_request.metrics import LatencyMetrics, get_region_from_host, latency_metrics
+from aws_create_request.payload import StatePayload
+from aws_create_request.ratelimit import RateLimiter
+from aws_create_request.retry import RetryPolicy
+from aws_create_request.transport import TransportResponse, parse_endpoint
+
+
+class AsyncShadowClient:
+    """
+        Shadow client driven by asyncio : every method is a coroutine, so thousands of
+        operations can be awaited together with asyncio.gather.
+        At most max_concurrency requests are in flight per host, each one on its own
+        keep-alive TLS stream.
+    """
+
+    def __init__(self, credentials: Credentials, region: str = "eu-west-1", max_concurrency: int = 100, timeout: float = 10.0, endpoint: str | None = None, ssl_context: ssl.SSLContext | None = None, metrics: LatencyMetrics | None = None, rate_limiter: RateLimiter | None = None, retry_policy: RetryPolicy | None = None) -> None:
+        if region not in AVAILABLE_REGION:
+            raise ValueError(f"'{region}' is not an available region")
+
+        self.credentials: Credentials = credentials
+        self.region: str = region
+        self.max_concurrency: int = max_concurrency
+        self.timeout: float = timeout
+        self.metrics: LatencyMetrics = metrics if metrics is not None else latency_metrics
+        self.rate_limiter: RateLimiter | None = rate_limiter
+        self.retry_policy: RetryPolicy | None = retry_policy
+
+        self.__use_tls, self.__address, self.__port = parse_endpoint(endpoint)
+        self.__ssl_context = ssl_context
+        if self.__use_tls and self.__ssl_context is None:
+            self.__ssl_context = ssl.create_default_context()
+
+        self.__semaphores: dict[str, asyncio.Semaphore] = {}
+        self.__idle: dict[str, list[tuple[asyncio.StreamReader, asyncio.StreamWriter]]] = {}
+
+    async def __aenter__(self) -> "AsyncShadowClient":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+
+
+    ######################################
+    # SHADOW METHODS
+    ######################################
+
+    async def get(self, thing_name: str, shadow_name: str | None = None) -> ShadowResponse:
+        return await self.request("get", thing_name, shadow_name)
+
+    async def update(self, thing_name: str, state_document: dict | str | StatePayload, shadow_name: str | None = None) -> ShadowResponse:
+        return await self.request("update", thing_name, shadow_name, encode_state_document(state_document))
+
+    async def delete(self, thing_name: str, shadow_name: str | None = None) -> ShadowResponse:
+        return await self.request("delete", thing_name, shadow_name)
+
+    async def request(self, shadow_method: str, thing_name: str, shadow_name: str | None = None, payload: str | StatePayload = "") -> ShadowResponse:
+        if self.retry_policy is None:
+            return await self.__attempt(shadow_method, thing_name, shadow_name, payload)
+        resendable = getattr(HTTPMethod, shadow_method.upper(), None) in RESENDABLE_METHODS
+        return await self.retry_policy.call_async(lambda: self.__attempt(shadow_method, thing_name, shadow_name, payload), resendable)
+
+    async def __attempt(self, shadow_method: str, thing_name: str, shadow_name: str | None, payload: str | StatePayload) -> ShadowResponse:
+        if self.rate_limiter is not None:
+            # Wait for the tokens before taking a slot
+            wait = self.rate_limiter.reserve(thing_name)
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+        host = f"data-ats.iot.{self.region}.amazonaws.com"
+        async with self.__get_semaphore(host):
+            # Sign once a slot is free, so X-Amz-Date is not stale when the request is sent
+            signed_request = sign_request(self.credentials, self.region, shadow_method, thing_name, shadow_name, payload, metrics=self.metrics)
+            response = await asyncio.wait_for(self.send(signed_request), self.timeout)
+
+        if response.status_code == 429 and self.rate_limiter is not None:
+            self.rate_limiter.throttled(thing_name)
+        return response
+
+    async def send(self, signed_request: SignedRequest) -> ShadowResponse:
+        response = await self.__send(
+            signed_request.method,
+            signed_request.host,
+            signed_request.path,
+            dict(signed_request.headers),
+            signed_request.body
+        )
+        return ShadowResponse(response.status_code, MappingProxyType(response.headers), response.content, signed_request, self.metrics)
+
+
+
+    ######################################
+    # HTTP/1.1 OVER ASYNCIO STREAMS
+    ######################################
+
+    def __get_semaphore(self, host: str) -> asyncio.Semaphore:
+        semaphore = self.__semaphores.get(host)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+            self.__semaphores[host] = semaphore
+        return semaphore
+
+    async def __open_connection(self, method: str, host: str) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        connecting_at = time.perf_counter()
+        connection = await asyncio.open_connection(
+            self.__address or host,
+            self.__port or 443,
+            ssl=self.__ssl_context if self.__use_tls else None,
+            server_hostname=host if self.__use_tls else None
+        )
+        # asyncio resolves, connects and handshakes in one call : a single 'connect' phase
+        self.metrics.observe("connect", method, get_region_from_host(host), time.perf_counter() - connecting_at)
+        return connection
+
+    async def __send(self, method: str, host: str, path: str, headers: dict[str, str], body: bytes | memoryview) -> TransportResponse:
+        idle = self.__idle.setdefault(host, [])
+
+        while True:
+            reused = len(idle) > 0
+            reader, writer = idle.pop() if reused else await self.__open_connection(method, host)
+            sent = False
+            try:
+                sent_at = time.perf_counter()
+                writer.write(self.__serialize_head(method, host, path, headers))
+                if len(body) > 0:
+                    writer.write(body)
+                await writer.drain()
+                sent = True
+                response, keep_alive, first_byte_at = await self.__read_response(reader, method)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                writer.close()
+                # The server closed a kept-alive connection : retry on another one,
+                # unless the request was sent and resending it is not safe
+                if reused and (not sent or method in RESENDABLE_METHODS):
+                    continue
+                raise
+            except BaseException:
+                writer.close()
+                raise
+
+            self.metrics.observe("ttfb", method, get_region_from_host(host), first_byte_at - sent_at)
+            if keep_alive:
+                idle.append((reader, writer))
+            else:
+                writer.close()
+            return response
+
+    def __serialize_head(self, method: str, host: str, path: str, headers: dict[str, str]) -> bytes:
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {host}"]
+        lines.extend(f"{name}: {value}" for name, value in headers.items())
+        lines.extend(["", ""])
+        return "\r\n".join(lines).encode("latin-1")
+
+    async def __read_response(self, reader: asyncio.StreamReader, method: str) -> tuple[TransportResponse, bool, float]:
+        """Return the response, whether the connection can be kept alive and when its first byte came"""
+        first_byte_at = None
+        while True:
+            status_line = await reader.readline()
+            if not status_line:
+                raise ConnectionResetError("Connection closed by the server")
+            first_byte_at = first_byte_at or time.perf_counter()
+            version, status_code = status_line.decode("latin-1").split(" ", 2)[:2]
+            status_code = int(status_code)
+            headers = await self.__read_headers(reader)
+            # An interim response (100 Continue, 103 Early Hints) is followed by the final one
+            if not 100 <= status_code < 200 or status_code == 101:
+                break
+        lower_headers = { name.lower(): value.lower() for name, value in headers.items() }
+
+        keep_alive = version == "HTTP/1.1" and lower_headers.get("connection") != "close" and status_code != 101
+
+        if method == "HEAD" or 100 <= status_code < 200 or status_code in (204, 304):
+            # No body by definition, whatever the headers say
+            content = b""
+        elif lower_headers.get("transfer-encoding") == "chunked":
+            content = await self.__read_chunks(reader)
+        elif "content-length" in lower_headers:
+            content = await reader.readexactly(int(lower_headers["content-length"]))
+        else:
+            content = await reader.read()
+            keep_alive = False
+
+        return TransportResponse(status_code, headers, content), keep_alive, first_byte_at
+
+    async def __read_headers(self, reader: asyncio.StreamReader) -> dict[str, str]:
+        headers: dict[str, str] = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                return headers
+            name, value = line.decode("latin-1").split(":", 1)
+            headers[name.strip()] = value.strip()
+
+    async def __read_chunks(self, reader: asyncio.StreamReader) -> bytes:
+        chunks = []
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            if size == 0:
+                # Trailers until the empty line
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                return b"".join(chunks)
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)
+
+    async def close(self) -> None:
+        for idle in self.__idle.values():
+            while idle:
+                _, writer = idle.pop()
+                writer.close()
+        self.__idle.clear()
@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+
+import sys
+import csv
+import gzip
+import json
+import argparse
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, TextIO
+
+from aws_create_request.app import Credentials
+from aws_create_request.client import ShadowClient
+from aws_create_request.constants import HTTPMethod
+from aws_create_request.credentials import resolve_credentials
+from aws_create_request.output import format_result_line
+from aws_create_request.payload import encode_shadow_document
+from aws_create_request.ratelimit import RateLimiter
+from aws_create_request.retry import RetryPolicy
+from aws_create_request.transport import MutualTLSTransport, Transport, create_transport
+
+
+class ManifestEntry:
+    """One shadow operation of a manifest"""
+
+    def __init__(self, thing_name: str, shadow_method: str, shadow_name: str | None = None, state_document: dict | None = None) -> None:
+        self.thing_name: str = thing_name
+        self.shadow_method: str = shadow_method
+        self.shadow_name: str | None = shadow_name if shadow_name else None
+        self.state_document: dict | None = state_document
+
+    def get_payload(self) -> str:
+        if self.state_document is None:
+            return ""
+        return encode_shadow_document(self.state_document)
+
+    def to_dict(self) -> dict:
+        return {
+            "thing_name": self.thing_name,
+            "shadow_name": self.shadow_name,
+            "method": self.shadow_method
+        }
+
+
+class InvalidManifestEntry(ManifestEntry):
+    """A line of a manifest which could not be read : it gets an error line instead of being run"""
+
+    def __init__(self, line_number: int, error: Exception) -> None:
+        super().__init__(thing_name="", shadow_method="")
+        self.line_number: int = line_number
+        self.error: Exception = error
+
+    def to_dict(self) -> dict:
+        return { "line": self.line_number }
+
+
+
+######################################
+# MANIFEST
+######################################
+
+def _entry_from_row(row: dict) -> ManifestEntry:
+    state_document = row.get("state_document")
+    # CSV cells hold the state document as a JSON string
+    if isinstance(state_document, str):
+        state_document = json.loads(state_document) if state_document.strip() else None
+
+    return ManifestEntry(
+        thing_name=row["thing_name"],
+        shadow_method=row["method"],
+        shadow_name=row.get("shadow_name"),
+        state_document=state_document
+    )
+
+def read_manifest(manifest: TextIO, manifest_format: str = "jsonl") -> Iterator[ManifestEntry]:
+    """
+        Lazily read a manifest, one entry per JSONL line or CSV row.
+        Columns/keys : thing_name, method, shadow_name (optional), state_document (optional)
+        A line which cannot be read gives an InvalidManifestEntry, so that the next ones are still read.
+    """
+    if manifest_format == "csv":
+        reader = csv.DictReader(manifest)
+        rows = ((reader.line_num, row) for row in reader)
+    elif manifest_format == "jsonl":
+        rows = ((line_number, line) for line_number, line in enumerate(manifest, 1) if line.strip())
+    else:
+        raise ValueError(f"'{manifest_format}' is not a manifest format. It is can be either jsonl and csv.")
+
+    for line_number, row in rows:
+        try:
+            entry = _entry_from_row(row if manifest_format == "csv" else json.loads(row))
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            entry = InvalidManifestEntry(line_number, e)
+        yield entry
+
+
+
+######################################
+# EXECUTION
+######################################
+
+class BatchRunner:
+    """Run the entries of a manifest on a bounded pool of workers and stream one JSON line per operation"""
+
+    def __init__(self, credentials: Credentials | None, region: str, max_workers: int = 16, output: TextIO = sys.stdout, transport: Transport | None = None, rate_limiter: RateLimiter | None = None, retry_policy: RetryPolicy | None = None) -> None:
+        self.max_workers: int = max_workers
+        self.output: TextIO = output
+        # Workers share the client, and so the keep-alive connections of its transport and its rate limits
+        self.client: ShadowClient = ShadowClient(
+            credentials,
+            region,
+            transport=transport if transport is not None else create_transport(pool_size=max_workers),
+            rate_limiter=rate_limiter,
+            retry_policy=retry_policy
+        )
+
+        self.succeeded: int = 0
+        self.failed: int = 0
+
+        self.__output_lock = threading.Lock()
+
+    def __execute(self, entry: ManifestEntry) -> tuple[dict, bytes | None]:
+        """The result of the entry, and the content of its response if it was sent"""
+        result = entry.to_dict()
+        if isinstance(entry, InvalidManifestEntry):
+            result["error"] = f"Invalid manifest line : {entry.error!r}"
+            return result, None
+        try:
+            if getattr(HTTPMethod, entry.shadow_method.upper(), None) == HTTPMethod.UPDATE and entry.state_document is None:
+                raise ValueError("With an UPDATE shadow method, a state document have to be passed")
+
+            response = self.client.request(entry.shadow_method, entry.thing_name, entry.shadow_name, entry.get_payload())
+        except Exception as e:
+            result["error"] = str(e)
+            return result, None
+
+        result["status_code"] = response.status_code
+        return result, response.content
+
+    def execute_entry(self, entry: ManifestEntry) -> dict:
+        result, content = self.__execute(entry)
+        if content is not None:
+            try:
+                result["response"] = json.loads(content)
+            except ValueError:
+                result["response"] = content.decode("utf-8", errors="replace")
+        return result
+
+    def __write_result(self, result: dict, content: bytes | None) -> None:
+        # The response is written in the line as it came, without decoding it
+        line = format_result_line(result, content)
+        with self.__output_lock:
+            self.output.write(line)
+            self.output.flush()
+            # Counted once written : an entry whose line failed is counted by the error line
+            if "error" in result or result.get("status_code", 500) >= 400:
+                self.failed += 1
+            else:
+                self.succeeded += 1
+
+    def __run_entry(self, entry: ManifestEntry, slots: threading.BoundedSemaphore) -> None:
+        try:
+            try:
+                self.__write_result(*self.__execute(entry))
+            except Exception as e:
+                # The future of the worker would hide it : the entry still gets its line, counted as failed
+                self.__write_result({ **entry.to_dict(), "error": str(e) }, None)
+        finally:
+            slots.release()
+
+    def run(self, entries: Iterator[ManifestEntry]) -> dict:
+        # Bound the number of queued entries, so a large manifest is never fully loaded
+        slots = threading.BoundedSemaphore(self.max_workers * 2)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for entry in entries:
+                slots.acquire()
+                executor.submit(self.__run_entry, entry, slots)
+
+        return { "succeeded": self.succeeded, "failed": self.failed }
+
+
+
+######################################
+# COMMAND LINE
+######################################
+
+def _init_argparse() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        "ShadowHttpApiBatch",
+        description="Run shadow operations for every thing of a JSONL or CSV manifest",
+        add_help=True
+    )
+
+    parser.add_argument(
+        "-f",
+        "--manifest",
+        dest="manifest",
+        help="Path to the manifest. '-' to read it from the standard input.",
+        required=True
+    )
+
+    parser.add_argument(
+        "--format",
+        dest="manifest_format",
+        choices=["jsonl", "csv"],
+        help="Format of the manifest. Default to the extension of the manifest, or 'jsonl'.",
+        required=False
+    )
+
+    parser.add_argument(
+        "-w",
+        "--workers",
+        default=16,
+        type=int,
+        dest="workers",
+        help="Number of operations executed at the same time. Default to 16",
+        required=False
+    )
+
+    parser.add_argument(
+        "-r",
+        "--region",
+        default="eu-west-1",
+        dest="region",
+        help="The region where the things are register in AWS. Default to 'eu-west-1'",
+        required=False
+    )
+
+    parser.add_argument(
+        "-e",
+        "--endpoint",
+        dest="endpoint",
+        help="Send the requests to this endpoint (e.g. http://127.0.0.1:8080) instead of data-ats.iot.<region>.amazonaws.com",
+        required=False
+    )
+
+    parser.add_argument(
+        "--gzip",
+        dest="gzip_path",
+        help="Write the results compressed with gzip in this file instead of the standard output",
+        required=False
+    )
+
+    parser.add_argument(
+        "--rate-limit",
+        type=float,
+        dest="rate_limit",
+        help="Requests per second for the whole account, e.g. just below the quota of the account",
+        required=False
+    )
+
+    parser.add_argument(
+        "--thing-rate-limit",
+        type=float,
+        dest="thing_rate_limit",
+        help="Requests per second for each thing",
+        required=False
+    )
+
+    parser.add_argument(
+        "--retries",
+        default=3,
+        type=int,
+        dest="retries",
+        help="Retries of an operation throttled (429), failed on the AWS side (5xx) or whose connection failed. Default to 3",
+        required=False
+    )
+
+    parser.add_argument(
+        "-a",
+        "--aws-access-key-id",
+        dest="aws_access_key_id",
+        help="AWS access key id that you can find in ~/.aws/credentials. Default to the AWS_ACCESS_KEY_ID environment variable, the credentials endpoint, then ~/.aws/credentials",
+        required=False
+    )
+
+    parser.add_argument(
+        "-k",
+        "--aws-secret-access-key",
+        dest="aws_secret_access_key",
+        help="AWS secret access key that you can find in ~/.aws/credentials",
+        required=False
+    )
+
+    parser.add_argument(
+        "--cert",
+        dest="certfile",
+        help="X.509 certificate of the thing, to send the operations to port 8443 without SigV4 signature nor AWS credentials",
+        required=False
+    )
+
+    parser.add_argument(
+        "--key",
+        dest="keyfile",
+        help="Private key of the certificate, if it is not in the --cert file",
+        required=False
+    )
+
+    parser.add_argument(
+        "--ca",
+        dest="cafile",
+        help="CA certificates to verify the server with instead of the default ones",
+        required=False
+    )
+
+    parser.add_argument(
+        "--session-token",
+        dest="aws_session_token",
+        help="AWS session token of temporary credentials",
+        required=False
+    )
+
+    parser.add_argument(
+        "--profile",
+        dest="profile",
+        help="Read the credentials from this profile of ~/.aws/credentials",
+        required=False
+    )
+
+    parser.add_argument(
+        "--credentials-endpoint",
+        dest="credentials_endpoint",
+        help="Get temporary credentials from this URL, and get them again before they expire",
+        required=False
+    )
+
+    return parser
+
+def main() -> int:
+    """Exit code 0 when every operation succeeded, 1 otherwise"""
+    args = _init_argparse().parse_args()
+
+    manifest_format = args.manifest_format
+    if manifest_format is None:
+        manifest_format = "csv" if args.manifest.endswith(".csv") else "jsonl"
+
+    try:
+        output = gzip.open(args.gzip_path, "wt", encoding="utf-8") if args.gzip_path else sys.stdout
+        runner = BatchRunner(
+            credentials=resolve_credentials(args.aws_access_key_id, args.aws_secret_access_key, args.aws_session_token, args.profile, args.credentials_endpoint) if args.certfile is None else None,
+            region=args.region,
+            max_workers=args.workers,
+            output=output,
+            transport=create_transport(pool_size=args.workers, endpoint=args.endpoint) if args.certfile is None else MutualTLSTransport(args.certfile, args.keyfile, args.cafile, pool_size=args.workers, endpoint=args.endpoint),
+            rate_limiter=RateLimiter(args.rate_limit, thing_rate=args.thing_rate_limit) if args.rate_limit or args.thing_rate_limit else None,
+            retry_policy=RetryPolicy(max_attempts=args.retries + 1) if args.retries > 0 else None
+        )
+
+        if args.manifest == "-":
+            summary = runner.run(read_manifest(sys.stdin, manifest_format))
+        else:
+            with open(args.manifest, newline="") as manifest:
+                summary = runner.run(read_manifest(manifest, manifest_format))
+        runner.client.close()
+        if output is not sys.stdout:
+            output.close()
+    except Exception as e:
+        sys.exit(e)
+
+    print(json.dumps(summary), file=sys.stderr)
+    return 1 if summary["failed"] > 0 else 0
+
+
+if __name__.__eq__("__main__"):
+    sys.exit(main())
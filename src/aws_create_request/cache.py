@@ -0,0 +1,183 @@
+
+import re
+import time
+import threading
+
+from collections import OrderedDict
+
+from aws_create_request.client import ShadowClient, ShadowResponse
+from aws_create_request.payload import BACKSLASH, CLOSING_BYTES, NON_WHITESPACE, OPENING_BYTES, QUOTE, STRUCTURAL_BYTES
+
+
+# The version of a shadow document, looked for at the end of the document, where the service writes it
+VERSION_PATTERN = re.compile(rb'"version"\s*:\s*(\d+)')
+VERSION_TAIL_LENGTH = 256
+
+
+def is_top_level_member(content: bytes, position: int) -> bool:
+    """Whether the member of an object ending at position belongs to the root object : the rest of the document closes exactly one object"""
+    depth = 0
+    in_string = False
+    skip = -1
+    for match in STRUCTURAL_BYTES.finditer(content, position):
+        index = match.start()
+        if index == skip:
+            continue
+        byte = content[index]
+
+        if in_string:
+            if byte == BACKSLASH:
+                skip = index + 1
+            elif byte == QUOTE:
+                in_string = False
+        elif byte == QUOTE:
+            in_string = True
+        elif byte in OPENING_BYTES:
+            depth += 1
+        elif byte in CLOSING_BYTES:
+            depth -= 1
+            if depth < 0:
+                return byte == ord("}") and NON_WHITESPACE.search(content, index + 1) is None
+    return False
+
+
+def find_version(content: bytes) -> int | None:
+    """
+        Version of a shadow document without decoding it : the last "version" member of the root object,
+        not a "version" key of the state. Only the end of the document after each candidate is scanned.
+    """
+    tail_start = max(0, len(content) - VERSION_TAIL_LENGTH)
+    for start in dict.fromkeys((tail_start, 0)):
+        for match in reversed(list(VERSION_PATTERN.finditer(content, start))):
+            if is_top_level_member(content, match.end()):
+                return int(match.group(1))
+    return None
+
+
+class CachedShadow:
+
+    __slots__ = ("document", "version", "size", "expires_at")
+
+    def __init__(self, document: dict, version: int | None, size: int, expires_at: float) -> None:
+        self.document: dict = document
+        self.version: int | None = version
+        self.size: int = size
+        self.expires_at: float = expires_at
+
+
+class ShadowCache:
+    """
+        Read-through cache in front of the shadow GETs, keyed by (thing name, shadow name).
+        An entry lives ttl seconds ; the least recently used entries are evicted above max_bytes
+        of documents. UPDATE and DELETE through the cache invalidate the entry, and a GET in flight
+        when its shadow is invalidated does not store its response.
+        When an entry expires, the shadow is fetched again but only decoded if its version changed.
+        Returned documents are shared with the cache and must not be modified.
+    """
+
+    def __init__(self, client: ShadowClient, ttl: float = 5.0, max_bytes: int = 16 * 1024 * 1024) -> None:
+        self.client: ShadowClient = client
+        self.ttl: float = ttl
+        self.max_bytes: int = max_bytes
+
+        self.hits: int = 0
+        self.misses: int = 0
+        self.unchanged_refreshes: int = 0
+        self.evictions: int = 0
+        self.invalidations: int = 0
+        self.size: int = 0
+
+        self.__entries: OrderedDict[tuple[str, str | None], CachedShadow] = OrderedDict()
+        # Bumped by clear, and for a shadow by its invalidation
+        self.__generation: int = 0
+        self.__generations: dict[tuple[str, str | None], int] = {}
+        self.__lock = threading.Lock()
+
+    def get(self, thing_name: str, shadow_name: str | None = None) -> dict:
+        key = (thing_name, shadow_name if shadow_name else None)
+        now = time.monotonic()
+
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None and entry.expires_at > now:
+                self.__entries.move_to_end(key)
+                self.hits += 1
+                return entry.document
+            self.misses += 1
+            generation = (self.__generation, self.__generations.get(key, 0))
+
+        response = self.client.get(thing_name, shadow_name).raise_for_status()
+        version = find_version(response.content)
+
+        if entry is not None and version is not None and version == entry.version:
+            # Same version : the cached document is still the shadow
+            document = entry.document
+            with self.__lock:
+                self.unchanged_refreshes += 1
+        else:
+            document = response.json()
+            version = document.get("version", version)
+
+        self.__store(key, CachedShadow(document, version, len(response.content), time.monotonic() + self.ttl), generation)
+        return document
+
+    def __store(self, key: tuple[str, str | None], entry: CachedShadow, generation: tuple[int, int]) -> None:
+        with self.__lock:
+            if generation != (self.__generation, self.__generations.get(key, 0)):
+                # Invalidated while it was fetched : the response may be older than the UPDATE
+                return
+
+            previous = self.__entries.pop(key, None)
+            if previous is not None:
+                self.size -= previous.size
+
+            if entry.size > self.max_bytes:
+                return
+
+            self.__entries[key] = entry
+            self.size += entry.size
+
+            while self.size > self.max_bytes:
+                _, evicted = self.__entries.popitem(last=False)
+                self.size -= evicted.size
+                self.evictions += 1
+
+    def invalidate(self, thing_name: str, shadow_name: str | None = None) -> None:
+        key = (thing_name, shadow_name if shadow_name else None)
+        with self.__lock:
+            self.__generations[key] = self.__generations.get(key, 0) + 1
+            entry = self.__entries.pop(key, None)
+            if entry is not None:
+                self.size -= entry.size
+                self.invalidations += 1
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__entries.clear()
+            self.size = 0
+            self.__generation += 1
+            self.__generations.clear()
+
+    def update(self, thing_name: str, state_document: dict | str, shadow_name: str | None = None) -> ShadowResponse:
+        response = self.client.update(thing_name, state_document, shadow_name)
+        self.invalidate(thing_name, shadow_name)
+        return response
+
+    def delete(self, thing_name: str, shadow_name: str | None = None) -> ShadowResponse:
+        response = self.client.delete(thing_name, shadow_name)
+        self.invalidate(thing_name, shadow_name)
+        return response
+
+    def get_stats(self) -> dict:
+        with self.__lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "unchanged_refreshes": self.unchanged_refreshes,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "entries": len(self.__entries),
+                "size": self.size
+            }
@@ -1,8 +1,8 @@
 
 import sys
 import datetime
-import pytz
 import hashlib
+import functools
 
 from aws_create_request.constants import HTTPMethod
 
@@ -32,13 +32,13 @@ class CanonicalRequest:
             date = ""
         return date
 
-    def complete_canonical_request(self, shadow_method: str, thing_name: str, shadow_name: str | None, region: str, payload: str):
+    def complete_canonical_request(self, shadow_method: str, thing_name: str, shadow_name: str | None, region: str, payload: str, hashed_payload: str | None = None, security_token: str | None = None, host_header: str = "host"):
         self.__set_http_method(shadow_method)
         self.__set_canonical_uri(thing_name)
         self.__set_canonical_query_string(shadow_name)
-        self.__set_canonical_headers(region)
-        self.__set_signed_headers()
-        self.__set_hashed_payload(payload)
+        self.__set_canonical_headers(region, security_token, host_header)
+        self.__set_signed_headers(host_header)
+        self.__set_hashed_payload(payload, hashed_payload)
 
     def __set_http_method(self, shadow_method: str) -> None:
         try:
@@ -52,32 +52,40 @@ class CanonicalRequest:
     def __set_canonical_query_string(self, shadow_name: str | None) -> None:
         query_string = ""
 
-        if shadow_name is not None or len(shadow_name) == 0:
+        if shadow_name is not None and len(shadow_name) > 0:
             query_string = f"name={shadow_name}"
 
         self.canonical_query_string = query_string
 
-    def __set_canonical_headers(self, region: str) -> None:
-        host: str = f"host:data-ats.iot.{region}.amazonaws.com"
-        date: str = f"x-amz-date:{datetime.datetime.now(tz=pytz.timezone('UTC')).strftime('%Y%m%dT%H%M%SZ')}"
+    def __set_canonical_headers(self, region: str, security_token: str | None = None, host_header: str = "host") -> None:
+        # 'host' with HTTP/1.1, ':authority' with HTTP/2
+        host: str = f"{host_header}:data-ats.iot.{region}.amazonaws.com"
+        date: str = f"x-amz-date:{datetime.datetime.now(tz=datetime.timezone.utc).strftime('%Y%m%dT%H%M%SZ')}"
 
         headers: list[str] = [host, date]
+        # Temporary credentials sign their session token too
+        if security_token:
+            headers.append(f"x-amz-security-token:{security_token}")
         headers.sort()
         headers.append("")
 
         self.canonical_headers = headers
 
-    def __set_signed_headers(self) -> str:
+    def __set_signed_headers(self, host_header: str = "host") -> str:
         signed_headers: list[str] = []
-        canonical_headers_filter = filter(lambda header : header.startswith(("x-amz", "host")), self.canonical_headers)
+        canonical_headers_filter = filter(lambda header : header.startswith(("x-amz", f"{host_header}:")), self.canonical_headers)
         for header in list(canonical_headers_filter):
-            if len(header.split(":")) > 0:
-                signed_headers.append(header.split(":")[0])
+            # The name of ':authority' starts with its separator
+            name = header[:header.index(":", 1)]
+            signed_headers.append(name)
             
         self.signed_headers = ";".join(signed_headers)
 
-    def __set_hashed_payload(self, payload: str) -> str:
-        self.hashed_payload = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    def __set_hashed_payload(self, payload: str, hashed_payload: str | None = None) -> str:
+        if hashed_payload is not None:
+            self.hashed_payload = hashed_payload
+        else:
+            self.hashed_payload = hashlib.sha256(payload.encode("utf-8")).hexdigest()
 
 
     def hash_canonical_request(self) -> str:
@@ -94,3 +102,76 @@ class CanonicalRequest:
 
         return "\n".join(canonical_list)
     
+
+
+EMPTY_PAYLOAD_HASH = hashlib.sha256(b"").hexdigest()
+# Signed instead of 'host' when the request is sent over HTTP/2
+AUTHORITY_HEADER = ":authority"
+
+class CanonicalRequestTemplate:
+    """
+        Fast path of CanonicalRequest, byte-identical to it.
+        Everything but the date and the payload hash is static for a (region, method, thing URI),
+        so it is computed once and the two variable parts are written in place in a copy of it.
+    """
+
+    __slots__ = ("http_method", "canonical_uri", "canonical_query_string", "host", "host_header", "signed_headers", "__signed_headers_with_security_token", "__template", "__date_offset", "__payload_offset")
+
+    DATE_LENGTH = len("YYYYMMDDThhmmssZ")
+    HASH_LENGTH = len(EMPTY_PAYLOAD_HASH)
+
+    def __init__(self, shadow_method: str, thing_name: str, shadow_name: str | None, region: str, host_header: str = "host") -> None:
+        http_method = getattr(HTTPMethod, shadow_method.upper(), None)
+        if http_method is None:
+            raise ValueError(f"'{shadow_method}' is not a shadow method. It is can be either GET, DELETE and UPDATE.")
+
+        self.http_method: str = http_method
+        self.canonical_uri: str = f"/things/{thing_name}/shadow"
+        self.canonical_query_string: str = f"name={shadow_name}" if shadow_name else ""
+        self.host: str = f"data-ats.iot.{region}.amazonaws.com"
+        self.host_header: str = host_header
+        # 'host' and ':authority' are always sorted before 'x-amz-date'
+        self.signed_headers: str = f"{host_header};x-amz-date"
+        self.__signed_headers_with_security_token: str = f"{host_header};x-amz-date;x-amz-security-token"
+
+        prefix = f"{self.http_method}\n{self.canonical_uri}\n{self.canonical_query_string}\n{host_header}:{self.host}\nx-amz-date:".encode("utf-8")
+        middle = f"\n\n{self.signed_headers}\n".encode("utf-8")
+
+        self.__date_offset: int = len(prefix)
+        self.__payload_offset: int = self.__date_offset + self.DATE_LENGTH + len(middle)
+        self.__template: bytes = prefix + b"0" * self.DATE_LENGTH + middle + b"0" * self.HASH_LENGTH
+
+    def get_signed_headers(self, security_token: str | None = None) -> str:
+        return self.__signed_headers_with_security_token if security_token else self.signed_headers
+
+    def build(self, request_date_time: str, hashed_payload: str = EMPTY_PAYLOAD_HASH, security_token: str | None = None) -> bytearray:
+        """Canonical request bytes for a date formatted as YYYYMMDDThhmmssZ"""
+        if security_token:
+            # 'x-amz-security-token' is sorted after 'x-amz-date', and its length varies
+            return bytearray(b"".join((
+                self.__template[:self.__date_offset],
+                request_date_time.encode("ascii"),
+                b"\nx-amz-security-token:",
+                security_token.encode("utf-8"),
+                f"\n\n{self.__signed_headers_with_security_token}\n".encode("utf-8"),
+                hashed_payload.encode("ascii")
+            )))
+
+        buffer = bytearray(self.__template)
+        buffer[self.__date_offset:self.__date_offset + self.DATE_LENGTH] = request_date_time.encode("ascii")
+        buffer[self.__payload_offset:] = hashed_payload.encode("ascii")
+        return buffer
+
+    def hash_canonical_request(self, request_date_time: str, hashed_payload: str = EMPTY_PAYLOAD_HASH, security_token: str | None = None) -> str:
+        return hashlib.sha256(self.build(request_date_time, hashed_payload, security_token)).hexdigest()
+
+    @property
+    def path(self) -> str:
+        if self.canonical_query_string:
+            return f"{self.canonical_uri}?{self.canonical_query_string}"
+        return self.canonical_uri
+
+
+@functools.lru_cache(maxsize=4096)
+def get_canonical_request_template(shadow_method: str, thing_name: str, shadow_name: str | None, region: str, host_header: str = "host") -> CanonicalRequestTemplate:
+    return CanonicalRequestTemplate(shadow_method, thing_name, shadow_name, region, host_header)
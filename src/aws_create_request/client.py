@@ -0,0 +1,314 @@
+
+import json
+import time
+import hashlib
+import datetime
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Callable, Iterable, Iterator, Mapping
+
+from aws_create_request.app import Credentials
+from aws_create_request.canonical_request import EMPTY_PAYLOAD_HASH, get_canonical_request_template
+from aws_create_request.constants import AVAILABLE_REGION, RESENDABLE_METHODS, SERVICE, HTTPMethod
+from aws_create_request.exceptions import ShadowResponseError
+from aws_create_request.metrics import LatencyMetrics, get_region_from_host, latency_metrics
+from aws_create_request.payload import StatePayload, encode_shadow_document
+from aws_create_request.presign import encode_query_string
+from aws_create_request.ratelimit import RateLimiter
+from aws_create_request.retry import RetryPolicy
+from aws_create_request.string_to_sign import StringToSign
+from aws_create_request.transport import Transport, create_transport
+
+
+# Named shadows of a thing, listed page by page
+LIST_NAMED_SHADOWS_PATH = "/api/things/shadow/ListNamedShadowsForThing/{thing_name}"
+
+
+@dataclass(frozen=True)
+class SignedRequest:
+    """A signed shadow request, ready to be sent by any transport. Unsigned for a transport which authenticates it"""
+    method: str
+    host: str
+    path: str
+    headers: Mapping[str, str]
+    body: bytes | memoryview = b""
+    thing_name: str = ""
+    shadow_name: str | None = None
+
+    @property
+    def url(self) -> str:
+        return f"https://{self.host}{self.path}"
+
+
+@dataclass(frozen=True)
+class ShadowResponse:
+    """The answer to a SignedRequest"""
+    status_code: int
+    headers: Mapping[str, str]
+    content: bytes
+    request: SignedRequest = field(repr=False)
+    # Metrics of the client which sent the request, the module ones by default
+    metrics: LatencyMetrics | None = field(default=None, repr=False, compare=False)
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code < 400
+
+    @property
+    def text(self) -> str:
+        return self.content.decode("utf-8")
+
+    def json(self):
+        decoding_at = time.perf_counter()
+        document = json.loads(self.content)
+        metrics = self.metrics if self.metrics is not None else latency_metrics
+        metrics.observe("json_decode", self.request.method, get_region_from_host(self.request.host), time.perf_counter() - decoding_at)
+        return document
+
+    def raise_for_status(self) -> "ShadowResponse":
+        if not self.ok:
+            raise ShadowResponseError(self.status_code, self.content)
+        return self
+
+
+def encode_state_document(state_document: dict | str | StatePayload) -> str | StatePayload:
+    if isinstance(state_document, (str, StatePayload)):
+        return state_document
+    return encode_shadow_document(state_document)
+
+def sign_request(credentials: Credentials, region: str, shadow_method: str, thing_name: str, shadow_name: str | None = None, payload: str | StatePayload = "", host_header: str = "host", metrics: LatencyMetrics | None = None) -> SignedRequest:
+    """Sign one shadow request. Raise ValueError instead of exiting on a bad argument. host_header is ':authority' over HTTP/2"""
+    if region not in AVAILABLE_REGION:
+        raise ValueError(f"'{region}' is not an available region")
+
+    signing_at = time.perf_counter()
+    credentials = credentials.get_frozen_credentials()
+    template = get_canonical_request_template(shadow_method, thing_name, shadow_name if shadow_name else None, region, host_header)
+    request_date_time = datetime.datetime.now(tz=datetime.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    if isinstance(payload, StatePayload):
+        # Hashed while it was read
+        body, hashed_payload = payload.body, payload.hashed_payload
+    else:
+        body = payload.encode("utf-8")
+        hashed_payload = hashlib.sha256(body).hexdigest() if body else EMPTY_PAYLOAD_HASH
+
+    string_to_sign = StringToSign()
+    string_to_sign.complete_string_to_sign_from_date(
+        request_date_time=request_date_time,
+        canonical_request_hash=template.hash_canonical_request(request_date_time, hashed_payload, credentials.aws_session_token),
+        region=region,
+        service=SERVICE
+    )
+    signature = string_to_sign.calculate_signature(credentials.aws_secret_access_key)
+
+    authorization = f"AWS4-HMAC-SHA256 Credential={credentials.aws_access_key_id}/{string_to_sign.credential_scope} SignedHeaders={template.get_signed_headers(credentials.aws_session_token)} Signature={signature}"
+    (metrics if metrics is not None else latency_metrics).observe("sign", template.http_method, region, time.perf_counter() - signing_at)
+
+    headers = {
+        "Authorization": authorization,
+        "X-Amz-Date": request_date_time,
+        "Content-Length": str(len(body))
+    }
+    if credentials.aws_session_token:
+        headers["X-Amz-Security-Token"] = credentials.aws_session_token
+
+    return SignedRequest(
+        method=template.http_method,
+        host=template.host,
+        path=template.path,
+        headers=MappingProxyType(headers),
+        body=body,
+        thing_name=thing_name,
+        shadow_name=shadow_name if shadow_name else None
+    )
+
+
+def prepare_unsigned_request(region: str, shadow_method: str, thing_name: str, shadow_name: str | None = None, payload: str | StatePayload = "") -> SignedRequest:
+    """Shadow request for a transport which authenticates it itself, with the certificate of the thing"""
+    if region not in AVAILABLE_REGION:
+        raise ValueError(f"'{region}' is not an available region")
+
+    template = get_canonical_request_template(shadow_method, thing_name, shadow_name if shadow_name else None, region)
+    body = payload.body if isinstance(payload, StatePayload) else payload.encode("utf-8")
+
+    return SignedRequest(
+        method=template.http_method,
+        host=template.host,
+        path=template.path,
+        headers=MappingProxyType({ "Content-Length": str(len(body)) }),
+        body=body,
+        thing_name=thing_name,
+        shadow_name=shadow_name if shadow_name else None
+    )
+
+
+def sign_api_request(credentials: Credentials | None, region: str, method: str, path: str, query: dict[str, str] | None = None, thing_name: str = "", host_header: str = "host") -> SignedRequest:
+    """
+        Sign a body-less request to another path of the data plane, e.g. ListNamedShadowsForThing.
+        Unsigned when credentials is None, for a transport which authenticates it.
+    """
+    if region not in AVAILABLE_REGION:
+        raise ValueError(f"'{region}' is not an available region")
+
+    host = f"data-ats.iot.{region}.amazonaws.com"
+    query_string = encode_query_string(query or {})
+    headers = { "Content-Length": "0" }
+
+    if credentials is not None:
+        credentials = credentials.get_frozen_credentials()
+        request_date_time = datetime.datetime.now(tz=datetime.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        canonical_headers = [f"{host_header}:{host}", f"x-amz-date:{request_date_time}"]
+        if credentials.aws_session_token:
+            canonical_headers.append(f"x-amz-security-token:{credentials.aws_session_token}")
+        # The name of ':authority' starts with its separator
+        signed_headers = ";".join(header[:header.index(":", 1)] for header in canonical_headers)
+        canonical_request = "\n".join([method, path, query_string, *canonical_headers, "", signed_headers, EMPTY_PAYLOAD_HASH])
+
+        string_to_sign = StringToSign()
+        string_to_sign.complete_string_to_sign_from_date(
+            request_date_time=request_date_time,
+            canonical_request_hash=hashlib.sha256(canonical_request.encode("utf-8")).hexdigest(),
+            region=region,
+            service=SERVICE
+        )
+        signature = string_to_sign.calculate_signature(credentials.aws_secret_access_key)
+
+        headers["Authorization"] = f"AWS4-HMAC-SHA256 Credential={credentials.aws_access_key_id}/{string_to_sign.credential_scope} SignedHeaders={signed_headers} Signature={signature}"
+        headers["X-Amz-Date"] = request_date_time
+        if credentials.aws_session_token:
+            headers["X-Amz-Security-Token"] = credentials.aws_session_token
+
+    return SignedRequest(
+        method=method,
+        host=host,
+        path=f"{path}?{query_string}" if query_string else path,
+        headers=MappingProxyType(headers),
+        thing_name=thing_name
+    )
+
+
+class ShadowClient:
+    """
+        Long-lived shadow client, built once per process and safe to share between threads.
+        Every call signs a new request : the client itself holds no per-request state.
+        With a rate limiter, each attempt waits for its tokens ; with a retry policy, each
+        retry is signed again, with a new X-Amz-Date.
+        credentials can be None with a transport which authenticates the requests (MutualTLSTransport).
+    """
+
+    def __init__(self, credentials: Credentials | None, region: str = "eu-west-1", transport: Transport | None = None, endpoint: str | None = None, rate_limiter: RateLimiter | None = None, retry_policy: RetryPolicy | None = None) -> None:
+        if region not in AVAILABLE_REGION:
+            raise ValueError(f"'{region}' is not an available region")
+
+        self.credentials: Credentials | None = credentials
+        self.region: str = region
+        self.transport: Transport = transport if transport is not None else create_transport(endpoint=endpoint)
+        if credentials is None and not self.transport.authenticates:
+            raise ValueError("Credentials are required, unless the transport authenticates the requests with a client certificate")
+        self.rate_limiter: RateLimiter | None = rate_limiter
+        self.retry_policy: RetryPolicy | None = retry_policy
+
+    def __enter__(self) -> "ShadowClient":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def sign(self, shadow_method: str, thing_name: str, shadow_name: str | None = None, payload: str | StatePayload = "") -> SignedRequest:
+        if self.transport.authenticates:
+            return prepare_unsigned_request(self.region, shadow_method, thing_name, shadow_name, payload)
+        return sign_request(self.credentials, self.region, shadow_method, thing_name, shadow_name, payload, self.transport.host_header, self.transport.metrics)
+
+    def send(self, signed_request: SignedRequest) -> ShadowResponse:
+        response = self.transport.request(
+            signed_request.method,
+            signed_request.host,
+            signed_request.path,
+            dict(signed_request.headers),
+            signed_request.body
+        )
+        return ShadowResponse(response.status_code, MappingProxyType(response.headers), response.content, signed_request, self.transport.metrics)
+
+    def request(self, shadow_method: str, thing_name: str, shadow_name: str | None = None, payload: str | StatePayload = "") -> ShadowResponse:
+        resendable = getattr(HTTPMethod, shadow_method.upper(), None) in RESENDABLE_METHODS
+        return self.__call(thing_name, lambda: self.sign(shadow_method, thing_name, shadow_name, payload), resendable)
+
+    def __call(self, thing_name: str, sign: Callable[[], SignedRequest], resendable: bool = True) -> ShadowResponse:
+        if self.retry_policy is None:
+            return self.__attempt(thing_name, sign)
+        return self.retry_policy.call(lambda: self.__attempt(thing_name, sign), resendable)
+
+    def __attempt(self, thing_name: str, sign: Callable[[], SignedRequest]) -> ShadowResponse:
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(thing_name)
+
+        response = self.send(sign())
+
+        if response.status_code == 429 and self.rate_limiter is not None:
+            self.rate_limiter.throttled(thing_name)
+        return response
+
+    def get(self, thing_name: str, shadow_name: str | None = None) -> ShadowResponse:
+        return self.request("get", thing_name, shadow_name)
+
+    def update(self, thing_name: str, state_document: dict | str | StatePayload, shadow_name: str | None = None) -> ShadowResponse:
+        return self.request("update", thing_name, shadow_name, encode_state_document(state_document))
+
+    def delete(self, thing_name: str, shadow_name: str | None = None) -> ShadowResponse:
+        return self.request("delete", thing_name, shadow_name)
+
+
+
+    ######################################
+    # NAMED SHADOWS
+    ######################################
+
+    def list_named_shadows_page(self, thing_name: str, next_token: str | None = None, page_size: int | None = None) -> ShadowResponse:
+        """One page of ListNamedShadowsForThing : { "results": [...], "nextToken": ..., "timestamp": ... }"""
+        query = {}
+        if next_token:
+            query["nextToken"] = next_token
+        if page_size is not None:
+            query["pageSize"] = str(page_size)
+
+        path = LIST_NAMED_SHADOWS_PATH.format(thing_name=thing_name)
+        credentials = None if self.transport.authenticates else self.credentials
+        return self.__call(thing_name, lambda: sign_api_request(credentials, self.region, "GET", path, query, thing_name, self.transport.host_header))
+
+    def list_named_shadows(self, thing_name: str, page_size: int | None = None) -> Iterator[str]:
+        """
+            Names of the named shadows of a thing. Lazy : the next page is only requested
+            once the names of the previous one are consumed. Raise ShadowResponseError on an error page.
+        """
+        next_token = None
+        while True:
+            page = self.list_named_shadows_page(thing_name, next_token, page_size).raise_for_status().json()
+            yield from page.get("results", [])
+            next_token = page.get("nextToken")
+            if not next_token:
+                return
+
+    def get_named_shadows(self, thing_names: str | Iterable[str], max_workers: int = 16) -> dict[str, dict[str, ShadowResponse]]:
+        """
+            Every named shadow of a thing, or of each thing of a list : { thing: { shadow name: response } }.
+            The things are listed concurrently, and each shadow is fetched as soon as its page arrived,
+            on at most max_workers threads.
+        """
+        if isinstance(thing_names, str):
+            thing_names = [thing_names]
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            def fetch_thing(thing_name: str) -> list[tuple[str, Future]]:
+                # Only submits the GETs : a worker never waits for another one
+                return [(shadow_name, executor.submit(self.get, thing_name, shadow_name)) for shadow_name in self.list_named_shadows(thing_name)]
+
+            listings = [(thing_name, executor.submit(fetch_thing, thing_name)) for thing_name in dict.fromkeys(thing_names)]
+            return {
+                thing_name: { shadow_name: future.result() for shadow_name, future in listing.result() }
+                for thing_name, listing in listings
+            }
+
+    def close(self) -> None:
+        self.transport.close()
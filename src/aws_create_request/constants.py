@@ -1,11 +1,20 @@
 
 
+SERVICE = "iotdata"
+
+# Not a shadow method of the command line : the names of the named shadows of the thing
+LIST_NAMED_SHADOWS = "LIST"
+
 class HTTPMethod:
     """Method HTTP used based on the shadow request"""
     GET     = "GET"
     UPDATE  = "POST"
     DELETE  = "DELETE"
 
+# Methods sent once again when a connection failed after the request was sent :
+# the server may have applied it, and an UPDATE must not be applied twice
+RESENDABLE_METHODS = (HTTPMethod.GET, HTTPMethod.DELETE)
+
 AVAILABLE_REGION = [
     "us-east-1",
     "us-east-2",
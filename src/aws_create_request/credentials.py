@@ -0,0 +1,315 @@
+
+import os
+import json
+import datetime
+import threading
+import configparser
+
+from aws_create_request.app import Credentials
+
+
+# Refresh in the background when the credentials expire in less than ADVISORY_REFRESH seconds,
+# and block the requests until it is done when they expire in less than MANDATORY_REFRESH seconds
+ADVISORY_REFRESH = 300
+MANDATORY_REFRESH = 60
+# Delay before the background refresh is tried again after a failure, doubled after each one
+REFRESH_RETRY_DELAY = 5
+
+
+
+######################################
+# PROVIDERS
+######################################
+
+class CredentialProvider:
+    """Where credentials are read from. load returns None when the source has none"""
+
+    name: str = ""
+
+    def load(self) -> Credentials | None:
+        raise NotImplementedError
+
+
+class StaticProvider(CredentialProvider):
+    """Credentials given on the command line"""
+
+    name = "static"
+
+    def __init__(self, aws_access_key_id: str | None, aws_secret_access_key: str | None, aws_session_token: str | None = None) -> None:
+        self.aws_access_key_id: str | None = aws_access_key_id
+        self.aws_secret_access_key: str | None = aws_secret_access_key
+        self.aws_session_token: str | None = aws_session_token
+
+    def load(self) -> Credentials | None:
+        if not self.aws_access_key_id or not self.aws_secret_access_key:
+            return None
+        return Credentials(self.aws_access_key_id, self.aws_secret_access_key, self.aws_session_token or "")
+
+
+class EnvironmentProvider(CredentialProvider):
+    """AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY and AWS_SESSION_TOKEN"""
+
+    name = "environment"
+
+    def __init__(self, environ: dict[str, str] | None = None) -> None:
+        self.environ = environ if environ is not None else os.environ
+
+    def load(self) -> Credentials | None:
+        aws_access_key_id = self.environ.get("AWS_ACCESS_KEY_ID")
+        aws_secret_access_key = self.environ.get("AWS_SECRET_ACCESS_KEY")
+        if not aws_access_key_id or not aws_secret_access_key:
+            return None
+        return Credentials(aws_access_key_id, aws_secret_access_key, self.environ.get("AWS_SESSION_TOKEN", ""))
+
+
+class SharedCredentialsProvider(CredentialProvider):
+    """
+        A profile of ~/.aws/credentials. The path and the profile default to
+        AWS_SHARED_CREDENTIALS_FILE and AWS_PROFILE, then to ~/.aws/credentials and 'default'.
+    """
+
+    name = "shared-credentials-file"
+
+    def __init__(self, profile: str | None = None, path: str | None = None) -> None:
+        self.profile: str = profile or os.environ.get("AWS_PROFILE") or "default"
+        self.path: str = os.path.expanduser(path or os.environ.get("AWS_SHARED_CREDENTIALS_FILE") or "~/.aws/credentials")
+
+    def load(self) -> Credentials | None:
+        parser = configparser.RawConfigParser()
+        try:
+            if not parser.read(self.path):
+                return None
+        except configparser.Error as c_err:
+            raise ValueError(f"Unable to parse {self.path} : {c_err}") from None
+
+        if not parser.has_section(self.profile):
+            return None
+        section = parser[self.profile]
+        aws_access_key_id = section.get("aws_access_key_id")
+        aws_secret_access_key = section.get("aws_secret_access_key")
+        if not aws_access_key_id or not aws_secret_access_key:
+            return None
+        return Credentials(aws_access_key_id, aws_secret_access_key, section.get("aws_session_token", ""))
+
+
+class TemporaryCredentialsProvider(CredentialProvider):
+    """
+        Temporary credentials served as JSON by an endpoint, like the container credentials endpoint :
+        { "AccessKeyId": ..., "SecretAccessKey": ..., "Token": ..., "Expiration": "2026-01-01T00:00:00Z" }.
+        The endpoint and its authorization token default to AWS_CONTAINER_CREDENTIALS_FULL_URI
+        and AWS_CONTAINER_AUTHORIZATION_TOKEN.
+    """
+
+    name = "temporary-credentials"
+
+    def __init__(self, endpoint: str | None = None, authorization_token: str | None = None, timeout: float = 2.0) -> None:
+        self.endpoint: str | None = endpoint or os.environ.get("AWS_CONTAINER_CREDENTIALS_FULL_URI")
+        self.authorization_token: str | None = authorization_token or os.environ.get("AWS_CONTAINER_AUTHORIZATION_TOKEN")
+        self.timeout: float = timeout
+
+    def load(self) -> Credentials | None:
+        if not self.endpoint:
+            return None
+
+        # Only needed with this provider
+        import urllib.request
+
+        request = urllib.request.Request(self.endpoint)
+        if self.authorization_token:
+            request.add_header("Authorization", self.authorization_token)
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            document = json.loads(response.read())
+
+        return parse_temporary_credentials(document)
+
+
+def parse_temporary_credentials(document: dict) -> Credentials:
+    try:
+        aws_access_key_id = document["AccessKeyId"]
+        aws_secret_access_key = document["SecretAccessKey"]
+    except (KeyError, TypeError):
+        raise ValueError("Temporary credentials should contain AccessKeyId and SecretAccessKey") from None
+
+    expiration = None
+    if document.get("Expiration"):
+        # fromisoformat only reads the Z suffix since Python 3.11
+        expiration = datetime.datetime.fromisoformat(document["Expiration"].replace("Z", "+00:00"))
+        if expiration.tzinfo is None:
+            expiration = expiration.replace(tzinfo=datetime.timezone.utc)
+
+    return Credentials(
+        aws_access_key_id,
+        aws_secret_access_key,
+        document.get("Token") or document.get("SessionToken") or "",
+        expiration
+    )
+
+
+class CredentialProviderChain(CredentialProvider):
+    """The credentials of the first provider which has some"""
+
+    name = "chain"
+
+    def __init__(self, providers: list[CredentialProvider]) -> None:
+        self.providers: list[CredentialProvider] = providers
+
+    def load(self) -> Credentials | None:
+        for provider in self.providers:
+            credentials = provider.load()
+            if credentials is not None:
+                return credentials
+        return None
+
+
+
+######################################
+# REFRESH
+######################################
+
+class RefreshingCredentials(Credentials):
+    """
+        Credentials loaded once from a provider, then loaded again before they expire :
+        in a background thread ADVISORY_REFRESH seconds before the expiration, and by the
+        request itself if the background refresh did not succeed MANDATORY_REFRESH seconds before.
+        Sign with get_frozen_credentials, so that a refresh never mixes two key pairs.
+    """
+
+    def __init__(self, provider: CredentialProvider, credentials: Credentials | None = None, advisory_refresh: float = ADVISORY_REFRESH, mandatory_refresh: float = MANDATORY_REFRESH, retry_delay: float = REFRESH_RETRY_DELAY) -> None:
+        self.provider: CredentialProvider = provider
+        self.advisory_refresh: float = advisory_refresh
+        self.mandatory_refresh: float = mandatory_refresh
+        self.retry_delay: float = retry_delay
+
+        self.refreshes: int = 0
+        self.refresh_errors: int = 0
+
+        self.__lock = threading.Lock()
+        self.__failures: int = 0
+        self.__timer: threading.Timer | None = None
+        self.__closed: bool = False
+        self.__current: Credentials = credentials if credentials is not None else self.__load()
+        self.__schedule()
+
+    def __load(self) -> Credentials:
+        credentials = self.provider.load()
+        if credentials is None:
+            raise ValueError(f"The provider '{self.provider.name}' has no credentials")
+        return credentials
+
+    def __get_remaining(self, credentials: Credentials) -> float | None:
+        if credentials.expiration is None:
+            return None
+        return (credentials.expiration - datetime.datetime.now(tz=datetime.timezone.utc)).total_seconds()
+
+    def __schedule(self) -> None:
+        """Refresh in the background when the advisory window starts"""
+        self.__failures = 0
+        remaining = self.__get_remaining(self.__current)
+        if remaining is None:
+            return
+        # At most one refresh per second when the provider gives credentials already in the window
+        self.__start_timer(max(1.0, remaining - self.advisory_refresh))
+
+    def __schedule_retry(self) -> None:
+        """Refresh in the background again after a failure, with a backoff, as long as the mandatory window has not started"""
+        remaining = self.__get_remaining(self.__current)
+        if remaining is None or remaining <= self.mandatory_refresh:
+            # The next request refreshes them itself
+            return
+        self.__start_timer(min(self.retry_delay * 2 ** (self.__failures - 1), remaining - self.mandatory_refresh))
+
+    def __start_timer(self, delay: float) -> None:
+        if self.__closed:
+            return
+        if self.__timer is not None:
+            self.__timer.cancel()
+        self.__timer = threading.Timer(delay, self.__refresh_in_background)
+        self.__timer.daemon = True
+        self.__timer.start()
+
+    def __refresh_in_background(self) -> None:
+        try:
+            self.refresh()
+        except Exception:
+            with self.__lock:
+                self.refresh_errors += 1
+                self.__failures += 1
+                self.__schedule_retry()
+
+    def refresh(self) -> Credentials:
+        with self.__lock:
+            credentials = self.__load()
+            self.__current = credentials
+            self.refreshes += 1
+            self.__schedule()
+            return credentials
+
+    def get_frozen_credentials(self) -> Credentials:
+        credentials = self.__current
+        remaining = self.__get_remaining(credentials)
+        if remaining is not None and remaining < self.mandatory_refresh:
+            with self.__lock:
+                # Unless another thread refreshed them while this one was waiting
+                if self.__current is credentials:
+                    self.__current = self.__load()
+                    self.refreshes += 1
+                    self.__schedule()
+                credentials = self.__current
+        return credentials
+
+    def close(self) -> None:
+        """Stop the background refresh"""
+        self.__closed = True
+        if self.__timer is not None:
+            self.__timer.cancel()
+
+    @property
+    def aws_access_key_id(self) -> str:
+        return self.__current.aws_access_key_id
+
+    @property
+    def aws_secret_access_key(self) -> str:
+        return self.__current.aws_secret_access_key
+
+    @property
+    def aws_session_token(self) -> str:
+        return self.__current.aws_session_token
+
+    @property
+    def expiration(self) -> datetime.datetime | None:
+        return self.__current.expiration
+
+    def set_credentials(self, aws_access_key_id, aws_secret_access_key, aws_session_token = "") -> None:
+        raise ValueError("Refreshed credentials are set by their provider")
+
+
+
+######################################
+# RESOLUTION
+######################################
+
+def resolve_credentials(aws_access_key_id: str | None = None, aws_secret_access_key: str | None = None, aws_session_token: str | None = None, profile: str | None = None, endpoint: str | None = None) -> Credentials:
+    """
+        Credentials of the first source which has some : the arguments, the environment variables,
+        the temporary credentials endpoint, then ~/.aws/credentials.
+        A profile or an endpoint given explicitly is the only source used.
+        Credentials which expire are refreshed before their expiration.
+    """
+    if endpoint:
+        provider = TemporaryCredentialsProvider(endpoint)
+    elif profile:
+        provider = SharedCredentialsProvider(profile)
+    else:
+        provider = CredentialProviderChain([
+            StaticProvider(aws_access_key_id, aws_secret_access_key, aws_session_token),
+            EnvironmentProvider(),
+            TemporaryCredentialsProvider(),
+            SharedCredentialsProvider()
+        ])
+
+    credentials = provider.load()
+    if credentials is None:
+        raise ValueError("Unable to locate credentials. Give them with -a and -k, the AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY environment variables, --profile or --credentials-endpoint")
+    if credentials.expiration is None:
+        return credentials
+    return RefreshingCredentials(provider, credentials)
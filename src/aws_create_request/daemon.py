@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import stat
+import socket
+import signal
+import argparse
+import threading
+import socketserver
+
+from aws_create_request.batch import ManifestEntry, _entry_from_row
+from aws_create_request.client import ShadowClient
+from aws_create_request.constants import HTTPMethod
+from aws_create_request.daemon_client import DEFAULT_SOCKET_PATH
+from aws_create_request.output import format_result_line
+
+
+class ShadowRequestHandler(socketserver.StreamRequestHandler):
+    """Results of the request lines of a connection, one line each and in their order, until the client closes it"""
+
+    def handle(self) -> None:
+        for line in self.rfile:
+            if line.strip():
+                self.wfile.write(self.server.execute_line(line).encode("utf-8"))
+
+
+class ShadowDaemon(socketserver.ThreadingUnixStreamServer):
+    """
+        Resident process serving shadow operations on a Unix socket, so that a call pays neither
+        the start of an interpreter, nor the credentials loading, nor a TLS handshake :
+        the client, its signing keys and the connections of its transport stay warm between calls.
+        A request is a line of a batch manifest : { "thing_name", "method", "shadow_name", "state_document" } ;
+        its result is a line of a batch output, with the "id" of the request if it had one.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, client: ShadowClient, socket_path: str = DEFAULT_SOCKET_PATH, verbose: bool = False) -> None:
+        self.client: ShadowClient = client
+        self.socket_path: str = socket_path
+        self.verbose: bool = verbose
+
+        self.requests: int = 0
+        self.__lock = threading.Lock()
+        self.__thread: threading.Thread | None = None
+
+        self.__remove_stale_socket()
+        super().__init__(socket_path, ShadowRequestHandler)
+
+    def __remove_stale_socket(self) -> None:
+        try:
+            if not stat.S_ISSOCK(os.stat(self.socket_path).st_mode):
+                raise FileExistsError(f"{self.socket_path} exists and is not a socket")
+        except FileNotFoundError:
+            return
+
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            try:
+                probe.connect(self.socket_path)
+            except ConnectionRefusedError:
+                # Left by a daemon which did not stop cleanly
+                os.remove(self.socket_path)
+                return
+        raise FileExistsError(f"A daemon already listens on {self.socket_path}")
+
+    def server_bind(self) -> None:
+        # Only the user of the daemon can connect : the requests are signed with their credentials
+        umask = os.umask(0o177)
+        try:
+            super().server_bind()
+        finally:
+            os.umask(umask)
+
+    def execute_line(self, line: bytes) -> str:
+        try:
+            request = json.loads(line)
+            entry = _entry_from_row(request)
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            return format_result_line({ "error": f"Invalid request : {e!r}" })
+
+        result = self.execute(entry)
+        if "id" in request:
+            result[0]["id"] = request["id"]
+        return format_result_line(*result)
+
+    def execute(self, entry: ManifestEntry) -> tuple[dict, bytes | None]:
+        """The result of the entry, and the content of its response if it was sent"""
+        with self.__lock:
+            self.requests += 1
+
+        result = entry.to_dict()
+        try:
+            if getattr(HTTPMethod, entry.shadow_method.upper(), None) == HTTPMethod.UPDATE and entry.state_document is None:
+                raise ValueError("With an UPDATE shadow method, a state document have to be passed")
+
+            response = self.client.request(entry.shadow_method, entry.thing_name, entry.shadow_name, entry.get_payload())
+        except Exception as e:
+            result["error"] = str(e)
+            return result, None
+
+        if self.verbose:
+            print(f"{entry.shadow_method.upper()} {entry.thing_name} {entry.shadow_name or ''} {response.status_code}", file=sys.stderr)
+        result["status_code"] = response.status_code
+        return result, response.content
+
+    def server_close(self) -> None:
+        super().server_close()
+        try:
+            os.remove(self.socket_path)
+        except FileNotFoundError:
+            pass
+
+    def start(self) -> "ShadowDaemon":
+        """Serve in a background thread"""
+        self.__thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.__thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+        if self.__thread is not None:
+            self.__thread.join()
+
+    def __enter__(self) -> "ShadowDaemon":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+
+
+######################################
+# COMMAND LINE
+######################################
+
+def _init_argparse() -> argparse.ArgumentParser:
+    from aws_create_request.transport import TRANSPORTS
+
+    parser = argparse.ArgumentParser(
+        "ShadowHttpApiDaemon",
+        description="Serve shadow operations on a Unix socket, keeping the credentials and the connections between calls",
+        add_help=True
+    )
+
+    parser.add_argument("--socket", default=DEFAULT_SOCKET_PATH, dest="socket_path", help=f"Path of the Unix socket. Default to {DEFAULT_SOCKET_PATH}", required=False)
+    parser.add_argument("-r", "--region", default="eu-west-1", dest="region", help="The region where the things are registered in AWS. Default to 'eu-west-1'", required=False)
+    parser.add_argument("-e", "--endpoint", dest="endpoint", help="Send the requests to this endpoint (e.g. http://127.0.0.1:8080) instead of data-ats.iot.<region>.amazonaws.com", required=False)
+    parser.add_argument("--transport", default="http.client", choices=list(TRANSPORTS), dest="transport", help="The HTTP client used to send the requests. Default to 'http.client'", required=False)
+    parser.add_argument("--pool-size", default=10, type=int, dest="pool_size", help="Connections kept open per host by the http.client transport. Default to 10", required=False)
+    parser.add_argument("--retries", default=3, type=int, dest="retries", help="Retries of an operation throttled (429), failed on the AWS side (5xx) or whose connection failed. Default to 3", required=False)
+    parser.add_argument("-a", "--aws-access-key-id", dest="aws_access_key_id", help="AWS access key id. Default to the environment, the credentials endpoint, then ~/.aws/credentials", required=False)
+    parser.add_argument("-k", "--aws-secret-access-key", dest="aws_secret_access_key", help="AWS secret access key", required=False)
+    parser.add_argument("--session-token", dest="aws_session_token", help="AWS session token of temporary credentials", required=False)
+    parser.add_argument("--profile", dest="profile", help="Read the credentials from this profile of ~/.aws/credentials", required=False)
+    parser.add_argument("--credentials-endpoint", dest="credentials_endpoint", help="Get temporary credentials from this URL, and get them again before they expire", required=False)
+    parser.add_argument("-v", "--verbose", action="store_true", dest="verbose", help="Log every request")
+
+    return parser
+
+def main() -> None:
+    from aws_create_request.credentials import resolve_credentials
+    from aws_create_request.retry import RetryPolicy
+    from aws_create_request.transport import create_transport
+
+    args = _init_argparse().parse_args()
+
+    try:
+        transport_options = { "endpoint": args.endpoint }
+        if args.transport == "http.client":
+            transport_options["pool_size"] = args.pool_size
+
+        client = ShadowClient(
+            resolve_credentials(args.aws_access_key_id, args.aws_secret_access_key, args.aws_session_token, args.profile, args.credentials_endpoint),
+            args.region,
+            transport=create_transport(args.transport, **transport_options),
+            retry_policy=RetryPolicy(max_attempts=args.retries + 1) if args.retries > 0 else None
+        )
+        daemon = ShadowDaemon(client, args.socket_path, args.verbose)
+    except Exception as e:
+        sys.exit(e)
+
+    # Stopped by a service manager as by Ctrl+C
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    print(f"Serving the shadow operations on {daemon.socket_path}", file=sys.stderr)
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon.server_close()
+        client.close()
+
+
+if __name__.__eq__("__main__"):
+    main()
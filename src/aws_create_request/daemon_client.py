@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import socket
+
+# Only standard modules are imported, and not argparse : the client is run for every shadow call,
+# and can be run as a file (python3 -S daemon_client.py) without the package being installed
+DEFAULT_SOCKET_PATH = os.path.join(os.environ.get("XDG_RUNTIME_DIR") or "/tmp", f"aws_shadows-{os.getuid()}.sock")
+
+USAGE = "Usage: daemon_client.py -t <thing name> -m <method> [-s <shadow name>] [-d <request state document>] [-o pretty|compact|ndjson] [--socket <path>]"
+
+
+class DaemonClient:
+    """Connection to a shadow daemon : one JSON line per request, one JSON line per result, in the same order"""
+
+    def __init__(self, socket_path: str = DEFAULT_SOCKET_PATH, timeout: float = 30.0) -> None:
+        self.socket_path: str = socket_path
+
+        self.__socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.__socket.settimeout(timeout)
+        try:
+            self.__socket.connect(socket_path)
+        except OSError:
+            self.__socket.close()
+            raise
+        self.__file = self.__socket.makefile("rwb")
+
+    def __enter__(self) -> "DaemonClient":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def request_line(self, request: dict) -> bytes:
+        """The result line of a request, as the daemon wrote it"""
+        self.__file.write(json.dumps(request, separators=(",", ":")).encode("utf-8") + b"\n")
+        self.__file.flush()
+
+        line = self.__file.readline()
+        if not line:
+            raise ConnectionError(f"The daemon of {self.socket_path} closed the connection")
+        return line
+
+    def request(self, method: str, thing_name: str, shadow_name: str | None = None, state_document: dict | str | None = None) -> dict:
+        """{ "thing_name", "shadow_name", "method", "status_code", "response" }, or with an "error" instead of the status"""
+        return json.loads(self.request_line({
+            "thing_name": thing_name,
+            "method": method,
+            "shadow_name": shadow_name,
+            "state_document": state_document
+        }))
+
+    def close(self) -> None:
+        self.__file.close()
+        self.__socket.close()
+
+
+
+######################################
+# COMMAND LINE
+######################################
+
+def _parse_args(argv: list[str]) -> dict[str, str]:
+    options = { "-t": "thing_name", "--thing-name": "thing_name", "-m": "method", "--method": "method", "-s": "shadow_name", "--shadow-name": "shadow_name", "-d": "state_document", "--state-document": "state_document", "-o": "output_format", "--output": "output_format", "--socket": "socket_path" }
+
+    args = { "output_format": "pretty", "socket_path": os.environ.get("AWS_SHADOWS_SOCKET") or DEFAULT_SOCKET_PATH }
+    position = 0
+    while position < len(argv):
+        if argv[position] not in options or position + 1 == len(argv):
+            raise ValueError(USAGE)
+        args[options[argv[position]]] = argv[position + 1]
+        position += 2
+
+    if "thing_name" not in args or "method" not in args or args["output_format"] not in ("pretty", "compact", "ndjson"):
+        raise ValueError(USAGE)
+    return args
+
+def main() -> None:
+    try:
+        args = _parse_args(sys.argv[1:])
+
+        state_document = None
+        if "state_document" in args:
+            # Read here : the daemon may not see the files of the caller
+            if args["state_document"] == "-":
+                state_document = sys.stdin.read()
+            else:
+                with open(args["state_document"]) as state_document_file:
+                    state_document = state_document_file.read()
+
+        with DaemonClient(args["socket_path"]) as client:
+            line = client.request_line({
+                "thing_name": args["thing_name"],
+                "method": args["method"],
+                "shadow_name": args.get("shadow_name"),
+                "state_document": state_document
+            })
+    except Exception as e:
+        sys.exit(e)
+
+    result = json.loads(line)
+    if "error" in result:
+        sys.exit(result["error"])
+
+    if args["output_format"] == "pretty":
+        sys.stdout.write(json.dumps(result["response"], indent=2) + "\n")
+    elif args["output_format"] == "compact":
+        sys.stdout.write(json.dumps(result["response"], separators=(",", ":")) + "\n")
+    else:
+        sys.stdout.write(line.decode("utf-8"))
+
+
+if __name__.__eq__("__main__"):
+    main()
@@ -0,0 +1,242 @@
+
+import os
+import json
+import copy
+import threading
+
+from aws_create_request.client import ShadowClient, ShadowResponse
+from aws_create_request.payload import encode_shadow_document
+
+
+# Status of an UPDATE whose version is not the current version of the shadow
+VERSION_CONFLICT = 409
+NOT_FOUND = 404
+
+
+def compute_delta(previous: dict, current: dict) -> dict:
+    """
+        Minimal document which turns previous into current with the shadow merge semantics :
+        changed values, new keys, and null for the removed keys. Lists are replaced as a whole.
+    """
+    delta = {}
+
+    for key, value in current.items():
+        if key not in previous:
+            if value is not None:
+                delta[key] = value
+        elif isinstance(value, dict) and isinstance(previous[key], dict):
+            nested_delta = compute_delta(previous[key], value)
+            if nested_delta:
+                delta[key] = nested_delta
+        elif value != previous[key] or type(value) is not type(previous[key]):
+            delta[key] = value
+
+    for key in previous:
+        if key not in current:
+            delta[key] = None
+
+    return delta
+
+
+def merge_state(base: dict, patch: dict) -> dict:
+    """Apply patch to a copy of base like the shadow service : later values win and null deletes"""
+    merged = copy.deepcopy(base)
+
+    for key, value in patch.items():
+        if value is None:
+            merged.pop(key, None)
+        elif isinstance(value, dict):
+            # A new object keeps none of its null values either
+            merged[key] = merge_state(merged[key] if isinstance(merged.get(key), dict) else {}, value)
+        else:
+            merged[key] = copy.deepcopy(value)
+
+    return merged
+
+
+def combine_patches(first: dict, second: dict) -> dict | None:
+    """
+        One patch which does what first then second do, nulls included.
+        None when it cannot be written as one document : second gives an object to a key
+        which first deleted or set to another value, and merging would keep the old keys of the shadow.
+    """
+    combined = copy.deepcopy(first)
+
+    for key, value in second.items():
+        if isinstance(value, dict) and key in combined:
+            if not isinstance(combined[key], dict):
+                return None
+            nested = combine_patches(combined[key], value)
+            if nested is None:
+                return None
+            combined[key] = nested
+        else:
+            combined[key] = copy.deepcopy(value)
+
+    return combined
+
+
+
+######################################
+# LAST ACKNOWLEDGED STATES
+######################################
+
+class ShadowStateStore:
+    """Last acknowledged state of each shadow : { "state": {...}, "version": int | None }"""
+
+    def load(self, thing_name: str, shadow_name: str | None) -> dict | None:
+        raise NotImplementedError
+
+    def save(self, thing_name: str, shadow_name: str | None, state: dict, version: int | None) -> None:
+        raise NotImplementedError
+
+    def delete(self, thing_name: str, shadow_name: str | None) -> None:
+        raise NotImplementedError
+
+
+class MemoryShadowStateStore(ShadowStateStore):
+
+    def __init__(self) -> None:
+        self.__states: dict[tuple[str, str | None], dict] = {}
+        self.__lock = threading.Lock()
+
+    def load(self, thing_name: str, shadow_name: str | None) -> dict | None:
+        with self.__lock:
+            known = self.__states.get((thing_name, shadow_name))
+            return copy.deepcopy(known) if known is not None else None
+
+    def save(self, thing_name: str, shadow_name: str | None, state: dict, version: int | None) -> None:
+        with self.__lock:
+            self.__states[(thing_name, shadow_name)] = { "state": copy.deepcopy(state), "version": version }
+
+    def delete(self, thing_name: str, shadow_name: str | None) -> None:
+        with self.__lock:
+            self.__states.pop((thing_name, shadow_name), None)
+
+
+class FileShadowStateStore(ShadowStateStore):
+    """One JSON file per shadow in a directory, so the state survives between two command lines"""
+
+    def __init__(self, directory: str) -> None:
+        self.directory: str = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def __get_path(self, thing_name: str, shadow_name: str | None) -> str:
+        return os.path.join(self.directory, f"{thing_name}.{shadow_name or '$classic'}.json")
+
+    def load(self, thing_name: str, shadow_name: str | None) -> dict | None:
+        try:
+            with open(self.__get_path(thing_name, shadow_name)) as known:
+                return json.load(known)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def save(self, thing_name: str, shadow_name: str | None, state: dict, version: int | None) -> None:
+        path = self.__get_path(thing_name, shadow_name)
+        # Write then rename, so a crash never leaves a truncated state
+        with open(f"{path}.tmp", "w") as known:
+            json.dump({ "state": state, "version": version }, known, separators=(",", ":"))
+        os.replace(f"{path}.tmp", path)
+
+    def delete(self, thing_name: str, shadow_name: str | None) -> None:
+        try:
+            os.remove(self.__get_path(thing_name, shadow_name))
+        except FileNotFoundError:
+            pass
+
+
+
+######################################
+# DELTA UPDATES
+######################################
+
+class DeltaUpdater:
+    """
+        Send only what changed since the last acknowledged state of a shadow, with its version
+        for optimistic concurrency. When the server rejects the version, the shadow is fetched
+        again and the delta is computed against it.
+    """
+
+    def __init__(self, client: ShadowClient, store: ShadowStateStore | None = None) -> None:
+        self.client: ShadowClient = client
+        self.store: ShadowStateStore = store if store is not None else MemoryShadowStateStore()
+
+        self.bytes_sent: int = 0
+        self.bytes_saved: int = 0
+
+    def update(self, thing_name: str, state_document: dict, shadow_name: str | None = None) -> ShadowResponse | None:
+        """Return the response of the UPDATE, or None when nothing changed"""
+        if not isinstance(state_document.get("state"), dict):
+            raise ValueError("A state document has a 'state' object")
+
+        known = self.store.load(thing_name, shadow_name)
+        response = self.__send_delta(thing_name, shadow_name, state_document, known)
+
+        if response is not None and response.status_code == VERSION_CONFLICT:
+            known = self.resync(thing_name, shadow_name)
+            response = self.__send_delta(thing_name, shadow_name, state_document, known)
+
+        return response
+
+    def __send_delta(self, thing_name: str, shadow_name: str | None, state_document: dict, known: dict | None) -> ShadowResponse | None:
+        full_payload = json.dumps(state_document, separators=(",", ":"))
+
+        if known is None:
+            # Nothing acknowledged yet : full document, without version
+            delta, update_document = state_document["state"], state_document
+        else:
+            delta = {}
+            # Only the sections of the document are compared : a missing 'desired' is not a deletion
+            for section, section_state in state_document["state"].items():
+                previous = known["state"].get(section)
+                if isinstance(section_state, dict) and isinstance(previous, dict):
+                    section_delta = compute_delta(previous, section_state)
+                    if section_delta:
+                        delta[section] = section_delta
+                elif section_state != previous:
+                    delta[section] = section_state
+
+            if not delta:
+                self.bytes_saved += len(full_payload)
+                return None
+
+            update_document = { "state": delta }
+            if known.get("version") is not None:
+                update_document["version"] = known["version"]
+
+        payload = encode_shadow_document(update_document)
+        response = self.client.update(thing_name, payload, shadow_name)
+
+        self.bytes_sent += len(payload)
+        self.bytes_saved += max(0, len(full_payload) - len(payload))
+
+        if response.ok:
+            acknowledged = merge_state(known["state"] if known is not None else {}, delta)
+            self.store.save(thing_name, shadow_name, acknowledged, self.__get_version(response))
+
+        return response
+
+    def __get_version(self, response: ShadowResponse) -> int | None:
+        try:
+            return response.json().get("version")
+        except (ValueError, AttributeError):
+            return None
+
+    def resync(self, thing_name: str, shadow_name: str | None = None) -> dict | None:
+        """Replace the acknowledged state by the current shadow. None if the shadow does not exist"""
+        response = self.client.get(thing_name, shadow_name)
+
+        if response.status_code == NOT_FOUND:
+            self.store.delete(thing_name, shadow_name)
+            return None
+        response.raise_for_status()
+
+        shadow = response.json()
+        state = { section: section_state for section, section_state in shadow.get("state", {}).items() if section != "delta" }
+        self.store.save(thing_name, shadow_name, state, shadow.get("version"))
+
+        return self.store.load(thing_name, shadow_name)
+
+    def forget(self, thing_name: str, shadow_name: str | None = None) -> None:
+        """To call after a DELETE of the shadow"""
+        self.store.delete(thing_name, shadow_name)
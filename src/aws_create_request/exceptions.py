@@ -0,0 +1,17 @@
+
+
+class ShadowError(Exception):
+    """Base class of the errors raised by the shadow clients"""
+
+
+class ShadowResponseError(ShadowError):
+    """The shadow request was answered with an error status"""
+
+    def __init__(self, status_code: int, content: bytes) -> None:
+        self.status_code: int = status_code
+        self.content: bytes = content
+        super().__init__(f"Shadow request failed with status {status_code}: {content.decode('utf-8', errors='replace')}")
+
+
+class ShadowSubscriptionError(ShadowError):
+    """The MQTT connection of a shadow subscription was refused or lost"""
@@ -0,0 +1,170 @@
+
+import json
+import time
+import bisect
+import threading
+
+from typing import Callable
+
+
+# Upper bounds, in seconds : from the signing steps (µs) to a slow TLS handshake (s)
+DEFAULT_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+
+def get_region_from_host(host: str) -> str:
+    """data-ats.iot.<region>.amazonaws.com -> <region>"""
+    parts = host.split(".")
+    return parts[2] if len(parts) > 3 and parts[1] == "iot" else ""
+
+
+class Histogram:
+    """Count of the observations below each bucket bound, with their sum"""
+
+    __slots__ = ("buckets", "counts", "count", "sum", "max")
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.buckets: tuple[float, ...] = buckets
+        # One more for the observations above the last bound (+Inf)
+        self.counts: list[int] = [0] * (len(buckets) + 1)
+        self.count: int = 0
+        self.sum: float = 0.0
+        self.max: float = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def get_cumulative_counts(self) -> list[int]:
+        cumulative, total = [], 0
+        for count in self.counts:
+            total += count
+            cumulative.append(total)
+        return cumulative
+
+
+class LatencyMetrics:
+    """
+        Latency histograms of each phase of the shadow requests, per (phase, HTTP method, region).
+        Every observation is also given to the callbacks, as (phase, method, region, seconds) :
+        they are called by the thread of the request, so they have to be quick.
+    """
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.buckets: tuple[float, ...] = buckets
+        self.enabled: bool = True
+        self.callback_errors: int = 0
+
+        self.__histograms: dict[tuple[str, str, str], Histogram] = {}
+        self.__callbacks: list[Callable[[str, str, str, float], None]] = []
+        self.__lock = threading.Lock()
+
+    def observe(self, phase: str, method: str, region: str, seconds: float) -> None:
+        if not self.enabled:
+            return
+
+        key = (phase, method, region)
+        with self.__lock:
+            histogram = self.__histograms.get(key)
+            if histogram is None:
+                histogram = Histogram(self.buckets)
+                self.__histograms[key] = histogram
+            histogram.observe(seconds)
+            callbacks = self.__callbacks
+
+        for callback in callbacks:
+            try:
+                callback(phase, method, region, seconds)
+            except Exception:
+                # A broken telemetry must not break the shadow requests
+                with self.__lock:
+                    self.callback_errors += 1
+
+    def add_callback(self, callback: Callable[[str, str, str, float], None]) -> None:
+        with self.__lock:
+            self.__callbacks = [*self.__callbacks, callback]
+
+    def remove_callback(self, callback: Callable[[str, str, str, float], None]) -> None:
+        with self.__lock:
+            self.__callbacks = [registered for registered in self.__callbacks if registered is not callback]
+
+    def reset(self) -> None:
+        with self.__lock:
+            self.__histograms.clear()
+            self.callback_errors = 0
+
+    def get_histogram(self, phase: str, method: str, region: str) -> Histogram | None:
+        with self.__lock:
+            return self.__histograms.get((phase, method, region))
+
+
+
+    ######################################
+    # EXPORT
+    ######################################
+
+    def to_dict(self) -> dict:
+        with self.__lock:
+            histograms = sorted(self.__histograms.items())
+            return {
+                "buckets": list(self.buckets),
+                "phases": [
+                    {
+                        "phase": phase,
+                        "method": method,
+                        "region": region,
+                        "count": histogram.count,
+                        "sum": histogram.sum,
+                        "max": histogram.max,
+                        "counts": histogram.get_cumulative_counts()
+                    }
+                    for (phase, method, region), histogram in histograms
+                ]
+            }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict())
+
+    def to_prometheus(self, name: str = "aws_shadows_phase_seconds") -> str:
+        """Prometheus text exposition format"""
+        lines = [
+            f"# HELP {name} Latency of each phase of the shadow requests",
+            f"# TYPE {name} histogram"
+        ]
+        with self.__lock:
+            for (phase, method, region), histogram in sorted(self.__histograms.items()):
+                labels = f'phase="{phase}",method="{method}",region="{region}"'
+                bounds = [f"{bound:g}" for bound in self.buckets] + ["+Inf"]
+                for bound, count in zip(bounds, histogram.get_cumulative_counts()):
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f"{name}_sum{{{labels}}} {histogram.sum!r}")
+                lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+
+        return "\n".join(lines) + "\n"
+
+
+class PhaseTimer:
+    """Observe consecutive phases : each lap is the time since the previous one"""
+
+    __slots__ = ("metrics", "method", "region", "started_at")
+
+    def __init__(self, metrics: LatencyMetrics, method: str, region: str) -> None:
+        self.metrics: LatencyMetrics = metrics
+        self.method: str = method
+        self.region: str = region
+        self.started_at: float = time.perf_counter()
+
+    def lap(self, phase: str) -> None:
+        now = time.perf_counter()
+        self.metrics.observe(phase, self.method, self.region, now - self.started_at)
+        self.started_at = now
+
+
+# Shared by every client of the process
+latency_metrics = LatencyMetrics()
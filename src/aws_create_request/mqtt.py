@@ -0,0 +1,562 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import ssl
+import sys
+import json
+import base64
+import struct
+import asyncio
+import hashlib
+import argparse
+
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Callable, Mapping
+from urllib.parse import urlsplit
+
+from aws_create_request.app import Credentials
+from aws_create_request.constants import AVAILABLE_REGION
+from aws_create_request.exceptions import ShadowSubscriptionError
+from aws_create_request.presign import presign
+
+
+# Service of the SigV4 signature of the MQTT over WebSocket connections
+MQTT_SERVICE = "iotdevicegateway"
+MQTT_PATH = "/mqtt"
+# Sec-WebSocket-Accept is the SHA-1 of the key followed by this GUID (RFC 6455)
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+# Largest WebSocket message accepted : a shadow document is at most 8 KB, plus its metadata
+MAX_MESSAGE_SIZE = 256 * 1024
+
+SHADOW_TOPIC = re.compile(r"^\$aws/things/([^/]+)/shadow(?:/name/([^/]+))?/(.+)$")
+
+
+class PacketType:
+    """MQTT 3.1.1 control packet types"""
+    CONNECT     = 1
+    CONNACK     = 2
+    PUBLISH     = 3
+    PUBACK      = 4
+    SUBSCRIBE   = 8
+    SUBACK      = 9
+    PINGREQ     = 12
+    PINGRESP    = 13
+    DISCONNECT  = 14
+
+class Opcode:
+    """WebSocket frame opcodes"""
+    CONTINUATION    = 0x0
+    TEXT            = 0x1
+    BINARY          = 0x2
+    CLOSE           = 0x8
+    PING            = 0x9
+    PONG            = 0xA
+
+
+
+######################################
+# TOPICS AND URL
+######################################
+
+def get_shadow_topic(thing_name: str, shadow_name: str | None = None, operation: str = "") -> str:
+    """$aws/things/<thing>/shadow[/name/<shadow>][/<operation>]"""
+    topic = f"$aws/things/{thing_name}/shadow"
+    if shadow_name:
+        topic = f"{topic}/name/{shadow_name}"
+    return f"{topic}/{operation}" if operation else topic
+
+def parse_shadow_topic(topic: str) -> tuple[str, str | None, str] | None:
+    """(thing name, shadow name, operation) of a shadow topic, None for another topic"""
+    match = SHADOW_TOPIC.match(topic)
+    if match is None:
+        return None
+    return match.group(1), match.group(2), match.group(3)
+
+def presign_mqtt_url(credentials: Credentials, region: str, expires: int = 300, request_date_time: str | None = None) -> str:
+    """wss URL of the MQTT broker of a region, signed in its query string"""
+    if region not in AVAILABLE_REGION:
+        raise ValueError(f"'{region}' is not an available region")
+
+    host = f"data-ats.iot.{region}.amazonaws.com"
+    query_string = presign(credentials, "GET", host, MQTT_PATH, {}, region, service=MQTT_SERVICE, expires=expires, request_date_time=request_date_time, sign_security_token=False)
+    return f"wss://{host}{MQTT_PATH}?{query_string}"
+
+def parse_websocket_endpoint(endpoint: str | None) -> tuple[bool, str | None, int | None]:
+    """Split an endpoint override like 'ws://127.0.0.1:8083' in (use_tls, address, port)"""
+    if endpoint is None:
+        return True, None, None
+
+    parts = urlsplit(endpoint)
+    if parts.scheme not in ("ws", "wss") or not parts.hostname:
+        raise ValueError(f"'{endpoint}' is not a WebSocket endpoint. It should look like wss://<host>[:<port>]")
+
+    use_tls = parts.scheme == "wss"
+    return use_tls, parts.hostname, parts.port or (443 if use_tls else 80)
+
+def get_websocket_accept(key: str) -> str:
+    return base64.b64encode(hashlib.sha1(f"{key}{WEBSOCKET_GUID}".encode("ascii")).digest()).decode("ascii")
+
+
+
+######################################
+# MQTT PACKETS
+######################################
+
+def encode_remaining_length(length: int) -> bytes:
+    """Variable length integer : 7 bits per byte, the high bit tells that another byte follows"""
+    encoded = bytearray()
+    while True:
+        length, digit = divmod(length, 128)
+        encoded.append(digit | 0x80 if length > 0 else digit)
+        if length == 0:
+            return bytes(encoded)
+
+def encode_string(value: str) -> bytes:
+    data = value.encode("utf-8")
+    return struct.pack("!H", len(data)) + data
+
+def encode_packet(packet_type: int, flags: int, body: bytes = b"") -> bytes:
+    return bytes([packet_type << 4 | flags]) + encode_remaining_length(len(body)) + body
+
+def encode_connect(client_id: str, keep_alive: int, clean_session: bool = True) -> bytes:
+    body = encode_string("MQTT") + bytes([4, 0x02 if clean_session else 0x00]) + struct.pack("!H", keep_alive) + encode_string(client_id)
+    return encode_packet(PacketType.CONNECT, 0, body)
+
+def encode_subscribe(packet_id: int, topics: list[str], qos: int = 1) -> bytes:
+    body = struct.pack("!H", packet_id) + b"".join(encode_string(topic) + bytes([qos]) for topic in topics)
+    # The flags of a SUBSCRIBE are reserved : 0b0010
+    return encode_packet(PacketType.SUBSCRIBE, 0x2, body)
+
+def encode_publish(topic: str, payload: bytes, qos: int = 0, packet_id: int | None = None) -> bytes:
+    body = encode_string(topic)
+    if qos > 0:
+        body += struct.pack("!H", packet_id)
+    return encode_packet(PacketType.PUBLISH, qos << 1, body + payload)
+
+def decode_publish(flags: int, body: bytes) -> tuple[str, int | None, bytes]:
+    """(topic, packet id if QoS > 0, payload)"""
+    (topic_length,) = struct.unpack_from("!H", body)
+    topic = body[2:2 + topic_length].decode("utf-8")
+    offset = 2 + topic_length
+
+    packet_id = None
+    if (flags >> 1) & 0x3 > 0:
+        (packet_id,) = struct.unpack_from("!H", body, offset)
+        offset += 2
+    return topic, packet_id, body[offset:]
+
+
+class PacketParser:
+    """
+        Split the byte stream of the WebSocket messages in MQTT packets :
+        a message can hold several packets, and a packet can span several messages.
+    """
+
+    def __init__(self) -> None:
+        self.__buffer = bytearray()
+
+    def feed(self, data: bytes) -> list[tuple[int, int, bytes]]:
+        """The complete packets, as (packet type, flags, body)"""
+        self.__buffer += data
+        packets = []
+
+        while len(self.__buffer) >= 2:
+            length, multiplier, offset = 0, 1, 1
+            while True:
+                if offset >= len(self.__buffer):
+                    return packets
+                byte = self.__buffer[offset]
+                length += (byte & 0x7F) * multiplier
+                multiplier *= 128
+                offset += 1
+                if byte & 0x80 == 0:
+                    break
+                if offset > 4:
+                    raise ValueError("Malformed remaining length")
+
+            if len(self.__buffer) < offset + length:
+                return packets
+
+            header = self.__buffer[0]
+            packets.append((header >> 4, header & 0x0F, bytes(self.__buffer[offset:offset + length])))
+            del self.__buffer[:offset + length]
+
+        return packets
+
+
+
+######################################
+# WEBSOCKET FRAMES
+######################################
+
+def encode_frame(opcode: int, payload: bytes, mask: bool = True) -> bytes:
+    """A final frame. The frames of a client are masked, those of a server are not"""
+    length = len(payload)
+    if length < 126:
+        header = bytes([0x80 | opcode, (0x80 if mask else 0) | length])
+    elif length < 1 << 16:
+        header = bytes([0x80 | opcode, (0x80 if mask else 0) | 126]) + struct.pack("!H", length)
+    else:
+        header = bytes([0x80 | opcode, (0x80 if mask else 0) | 127]) + struct.pack("!Q", length)
+
+    if not mask:
+        return header + payload
+
+    masking_key = os.urandom(4)
+    return header + masking_key + apply_mask(payload, masking_key)
+
+def apply_mask(payload: bytes, masking_key: bytes) -> bytes:
+    # XOR of the payload with the key repeated : one big integer instead of a loop on the bytes
+    repeated = (masking_key * (len(payload) // 4 + 1))[:len(payload)]
+    return (int.from_bytes(payload, "big") ^ int.from_bytes(repeated, "big")).to_bytes(len(payload), "big")
+
+async def read_frame(reader: asyncio.StreamReader) -> tuple[bool, int, bytes]:
+    """(final frame, opcode, unmasked payload)"""
+    first, second = await reader.readexactly(2)
+    length = second & 0x7F
+    if length == 126:
+        (length,) = struct.unpack("!H", await reader.readexactly(2))
+    elif length == 127:
+        (length,) = struct.unpack("!Q", await reader.readexactly(8))
+    if length > MAX_MESSAGE_SIZE:
+        raise ShadowSubscriptionError(f"WebSocket frame of {length} bytes, more than {MAX_MESSAGE_SIZE}")
+
+    masking_key = await reader.readexactly(4) if second & 0x80 else None
+    payload = await reader.readexactly(length)
+    if masking_key is not None:
+        payload = apply_mask(payload, masking_key)
+    return bool(first & 0x80), first & 0x0F, payload
+
+async def read_message(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, mask: bool = True) -> bytes | None:
+    """
+        Payload of the next data message, its fragments joined. Answer the pings on the way.
+        None when the peer closed the WebSocket.
+    """
+    fragments: list[bytes] = []
+    while True:
+        final, opcode, payload = await read_frame(reader)
+
+        if opcode == Opcode.PING:
+            writer.write(encode_frame(Opcode.PONG, payload, mask))
+            continue
+        if opcode == Opcode.PONG:
+            continue
+        if opcode == Opcode.CLOSE:
+            writer.write(encode_frame(Opcode.CLOSE, payload[:2], mask))
+            return None
+
+        fragments.append(payload)
+        if sum(len(fragment) for fragment in fragments) > MAX_MESSAGE_SIZE:
+            raise ShadowSubscriptionError(f"WebSocket message larger than {MAX_MESSAGE_SIZE} bytes")
+        if final:
+            return b"".join(fragments)
+
+
+
+######################################
+# SUBSCRIPTION
+######################################
+
+@dataclass(frozen=True)
+class ShadowEvent:
+    """
+        A message of a shadow topic. operation is 'update/delta' when the desired state differs
+        from the reported one, 'get/accepted' for the current document of the shadow.
+    """
+    topic: str
+    thing_name: str
+    shadow_name: str | None
+    operation: str
+    document: Mapping
+
+    def to_dict(self) -> dict:
+        return {
+            "thing_name": self.thing_name,
+            "shadow_name": self.shadow_name,
+            "operation": self.operation,
+            "document": dict(self.document)
+        }
+
+
+class ShadowSubscriber:
+    """
+        Push-based shadow changes, instead of polling them with signed GETs : MQTT 3.1.1 over a
+        WebSocket whose URL is presigned with SigV4 (service iotdevicegateway).
+        Each event is given to the callback if there is one (called by the event loop : it has to be quick),
+        else queued for the async iterator. A lost connection ends the iteration with a ShadowSubscriptionError.
+    """
+
+    def __init__(self, credentials: Credentials, region: str = "eu-west-1", client_id: str | None = None, keep_alive: int = 60, timeout: float = 10.0, endpoint: str | None = None, ssl_context: ssl.SSLContext | None = None, callback: Callable[[ShadowEvent], None] | None = None) -> None:
+        if region not in AVAILABLE_REGION:
+            raise ValueError(f"'{region}' is not an available region")
+
+        self.credentials: Credentials = credentials
+        self.region: str = region
+        self.client_id: str = client_id or f"aws-shadows-{os.urandom(6).hex()}"
+        self.keep_alive: int = keep_alive
+        self.timeout: float = timeout
+        self.callback: Callable[[ShadowEvent], None] | None = callback
+        self.callback_errors: int = 0
+
+        self.__use_tls, self.__address, self.__port = parse_websocket_endpoint(endpoint)
+        self.__ssl_context = ssl_context
+        if self.__use_tls and self.__ssl_context is None:
+            self.__ssl_context = ssl.create_default_context()
+
+        self.__reader: asyncio.StreamReader | None = None
+        self.__writer: asyncio.StreamWriter | None = None
+        self.__tasks: list[asyncio.Task] = []
+        self.__parser: PacketParser = PacketParser()
+        self.__events: asyncio.Queue = asyncio.Queue()
+        self.__pending: dict[int, asyncio.Future] = {}
+        self.__packet_id: int = 0
+        self.__closed: bool = False
+
+    async def __aenter__(self) -> "ShadowSubscriber":
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    def __aiter__(self) -> "ShadowSubscriber":
+        return self
+
+    async def __anext__(self) -> ShadowEvent:
+        event = await self.__events.get()
+        if event is None:
+            # Put back for the other iterators
+            self.__events.put_nowait(None)
+            raise StopAsyncIteration
+        if isinstance(event, Exception):
+            self.__events.put_nowait(event)
+            raise event
+        return event
+
+
+
+    ######################################
+    # CONNECTION
+    ######################################
+
+    async def connect(self) -> None:
+        await asyncio.wait_for(self.__connect(), self.timeout)
+        self.__tasks = [
+            asyncio.create_task(self.__receive()),
+            asyncio.create_task(self.__ping())
+        ]
+
+    async def __connect(self) -> None:
+        url = urlsplit(presign_mqtt_url(self.credentials, self.region))
+        self.__reader, self.__writer = await asyncio.open_connection(
+            self.__address or url.hostname,
+            self.__port or 443,
+            ssl=self.__ssl_context if self.__use_tls else None,
+            server_hostname=url.hostname if self.__use_tls else None
+        )
+
+        key = base64.b64encode(os.urandom(16)).decode("ascii")
+        self.__writer.write((
+            f"GET {url.path}?{url.query} HTTP/1.1\r\n"
+            f"Host: {url.hostname}\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Key: {key}\r\n"
+            "Sec-WebSocket-Version: 13\r\n"
+            "Sec-WebSocket-Protocol: mqtt\r\n"
+            "\r\n"
+        ).encode("utf-8"))
+
+        status_line, *header_lines = (await self.__reader.readuntil(b"\r\n\r\n")).decode("latin-1").split("\r\n")
+        headers = { name.strip().lower(): value.strip() for name, _, value in (line.partition(":") for line in header_lines if line) }
+        if status_line.split(" ")[1:2] != ["101"]:
+            self.__writer.close()
+            raise ShadowSubscriptionError(f"The WebSocket upgrade was refused : {status_line}")
+        if headers.get("sec-websocket-accept") != get_websocket_accept(key):
+            self.__writer.close()
+            raise ShadowSubscriptionError("Wrong Sec-WebSocket-Accept")
+
+        connack = self.__expect(0)
+        self.__send(encode_connect(self.client_id, self.keep_alive))
+
+        # The receiving task does not run yet : read the CONNACK here
+        while not connack.done():
+            message = await read_message(self.__reader, self.__writer)
+            if message is None:
+                raise ShadowSubscriptionError("The broker closed the connection before CONNACK")
+            for packet in self.__parser.feed(message):
+                self.__dispatch(*packet)
+        await connack
+
+    async def close(self) -> None:
+        if self.__closed:
+            return
+        self.__closed = True
+
+        for task in self.__tasks:
+            task.cancel()
+        await asyncio.gather(*self.__tasks, return_exceptions=True)
+        if self.__writer is not None:
+            try:
+                self.__send(encode_packet(PacketType.DISCONNECT, 0))
+                self.__writer.write(encode_frame(Opcode.CLOSE, struct.pack("!H", 1000)))
+                self.__writer.close()
+                await self.__writer.wait_closed()
+            except (ConnectionError, ssl.SSLError):
+                pass
+        self.__events.put_nowait(None)
+
+    def __send(self, packet: bytes) -> None:
+        self.__writer.write(encode_frame(Opcode.BINARY, packet))
+
+    async def __ping(self) -> None:
+        while True:
+            await asyncio.sleep(self.keep_alive * 0.75)
+            self.__send(encode_packet(PacketType.PINGREQ, 0))
+
+    async def __receive(self) -> None:
+        try:
+            while True:
+                message = await read_message(self.__reader, self.__writer)
+                if message is None:
+                    raise ShadowSubscriptionError("The broker closed the connection")
+                for packet in self.__parser.feed(message):
+                    self.__dispatch(*packet)
+        except asyncio.CancelledError:
+            raise
+        except (ConnectionError, asyncio.IncompleteReadError, ShadowSubscriptionError, ValueError) as error:
+            if not isinstance(error, ShadowSubscriptionError):
+                error = ShadowSubscriptionError(f"Connection lost : {error!r}")
+            for future in self.__pending.values():
+                if not future.done():
+                    future.set_exception(error)
+            self.__events.put_nowait(error)
+
+
+
+    ######################################
+    # MQTT
+    ######################################
+
+    def __expect(self, packet_id: int) -> asyncio.Future:
+        """Future of the acknowledgement of a packet : 0 for the CONNACK"""
+        future = asyncio.get_running_loop().create_future()
+        self.__pending[packet_id] = future
+        return future
+
+    def __next_packet_id(self) -> int:
+        # 1 to 65535 : 0 is not a valid packet identifier
+        self.__packet_id = self.__packet_id % 0xFFFF + 1
+        return self.__packet_id
+
+    def __dispatch(self, packet_type: int, flags: int, body: bytes) -> None:
+        if packet_type == PacketType.CONNACK:
+            future = self.__pending.pop(0, None)
+            if future is not None and not future.done():
+                if len(body) == 2 and body[1] == 0:
+                    future.set_result(None)
+                else:
+                    future.set_exception(ShadowSubscriptionError(f"Connection refused by the broker, return code {body[1:2].hex()}"))
+
+        elif packet_type == PacketType.SUBACK:
+            (packet_id,) = struct.unpack_from("!H", body)
+            future = self.__pending.pop(packet_id, None)
+            if future is not None and not future.done():
+                if 0x80 in body[2:]:
+                    future.set_exception(ShadowSubscriptionError("Subscription refused by the broker"))
+                else:
+                    future.set_result(None)
+
+        elif packet_type == PacketType.PUBLISH:
+            topic, packet_id, payload = decode_publish(flags, body)
+            if packet_id is not None:
+                self.__send(encode_packet(PacketType.PUBACK, 0, struct.pack("!H", packet_id)))
+            self.__deliver(topic, payload)
+
+    def __deliver(self, topic: str, payload: bytes) -> None:
+        shadow_topic = parse_shadow_topic(topic)
+        if shadow_topic is None:
+            return
+        try:
+            document = json.loads(payload) if payload else {}
+        except ValueError:
+            document = {}
+
+        thing_name, shadow_name, operation = shadow_topic
+        event = ShadowEvent(topic, thing_name, shadow_name, operation, MappingProxyType(document))
+
+        if self.callback is None:
+            self.__events.put_nowait(event)
+            return
+        try:
+            self.callback(event)
+        except Exception:
+            # A broken callback must not break the subscription
+            self.callback_errors += 1
+
+    async def subscribe(self, thing_name: str, shadow_name: str | None = None, get_current: bool = True) -> None:
+        """
+            Receive the update/delta and get/accepted messages of a shadow.
+            With get_current, ask the current document at once, delivered as a get/accepted event.
+        """
+        packet_id = self.__next_packet_id()
+        suback = self.__expect(packet_id)
+        self.__send(encode_subscribe(packet_id, [
+            get_shadow_topic(thing_name, shadow_name, "update/delta"),
+            get_shadow_topic(thing_name, shadow_name, "get/accepted")
+        ]))
+        await asyncio.wait_for(suback, self.timeout)
+
+        if get_current:
+            self.__send(encode_publish(get_shadow_topic(thing_name, shadow_name, "get"), b"{}"))
+        await self.__writer.drain()
+
+
+
+######################################
+# COMMAND LINE
+######################################
+
+def _init_argparse() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        "ShadowHttpApiSubscribe",
+        description="Write the changes of the desired state of shadows as they happen, one JSON line per change, using MQTT over WebSocket",
+        add_help=True
+    )
+
+    parser.add_argument("-t", "--thing-name", action="append", dest="thing_names", help="The name of the thing in AWS. Can be repeated", required=True)
+    parser.add_argument("-s", "--shadow-name", dest="shadow_name", help="The name of the shadow, for a named shadow", required=False)
+    parser.add_argument("-r", "--region", default="eu-west-1", dest="region", help="The region where the things are registered in AWS. Default to 'eu-west-1'", required=False)
+    parser.add_argument("-a", "--aws-access-key-id", dest="aws_access_key_id", help="AWS access key id. Default to the environment, then ~/.aws/credentials", required=False)
+    parser.add_argument("-k", "--aws-secret-access-key", dest="aws_secret_access_key", help="AWS secret access key", required=False)
+    parser.add_argument("--session-token", dest="aws_session_token", help="AWS session token of temporary credentials", required=False)
+    parser.add_argument("--profile", dest="profile", help="Read the credentials from this profile of ~/.aws/credentials", required=False)
+    parser.add_argument("-e", "--endpoint", dest="endpoint", help="Connect to this endpoint (e.g. ws://127.0.0.1:8083) instead of data-ats.iot.<region>.amazonaws.com", required=False)
+    parser.add_argument("--no-get", action="store_false", dest="get_current", help="Do not write the current document of each shadow first")
+
+    return parser
+
+async def subscribe(args: argparse.Namespace, credentials: Credentials) -> None:
+    async with ShadowSubscriber(credentials, args.region, endpoint=args.endpoint) as subscriber:
+        for thing_name in args.thing_names:
+            await subscriber.subscribe(thing_name, args.shadow_name, args.get_current)
+        async for event in subscriber:
+            print(json.dumps(event.to_dict(), separators=(",", ":")), flush=True)
+
+def main() -> None:
+    from aws_create_request.credentials import resolve_credentials
+
+    args = _init_argparse().parse_args()
+    try:
+        credentials = resolve_credentials(args.aws_access_key_id, args.aws_secret_access_key, args.aws_session_token, args.profile)
+        asyncio.run(subscribe(args, credentials))
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        sys.exit(e)
+
+
+if __name__.__eq__("__main__"):
+    main()
@@ -0,0 +1,93 @@
+
+import sys
+import json
+import gzip
+
+from typing import BinaryIO
+
+
+# pretty : indented, like before. compact : one line, without spaces.
+# raw : the bytes of the response, unchanged. ndjson : one line per response
+OUTPUT_FORMATS = ("pretty", "compact", "raw", "ndjson")
+
+
+def reject_constant(name: str) -> None:
+    raise ValueError(f"{name} is not a JSON value")
+
+
+def is_single_line_json(content: bytes) -> bool:
+    """A JSON object on one line, fully checked : the C decoder validates it faster than any scan written in Python"""
+    if b"\n" in content or b"\r" in content:
+        return False
+    try:
+        return isinstance(json.loads(content, parse_constant=reject_constant), dict)
+    except ValueError:
+        return False
+
+
+def format_response(content: bytes, output_format: str = "pretty") -> bytes:
+    """The bytes to write for the content of a response. raw and a JSON line in ndjson are written as they came"""
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"'{output_format}' is not an output format. It is can be either {', '.join(OUTPUT_FORMATS)}.")
+
+    if output_format == "raw":
+        return content
+    if output_format == "ndjson" and is_single_line_json(content):
+        # The service answers compact JSON : it is already a line
+        return content + b"\n"
+
+    return format_document(json.loads(content) if content.strip() else {}, output_format)
+
+
+def format_document(document, output_format: str = "pretty") -> bytes:
+    if output_format == "pretty":
+        return json.dumps(document, indent=2).encode("utf-8") + b"\n"
+    return json.dumps(document, separators=(",", ":")).encode("utf-8") + b"\n"
+
+
+def format_result_line(result: dict, content: bytes | None = None) -> str:
+    """
+        NDJSON line of a result, with the response content as its 'response' field.
+        A content which is already a valid JSON line is inserted as is, without encoding it again.
+    """
+    line = json.dumps(result, separators=(",", ":"))
+    if content is None:
+        return line + "\n"
+
+    try:
+        text = content.decode("utf-8")
+        document = json.loads(text, parse_constant=reject_constant)
+    except ValueError:
+        # Not JSON, or not UTF-8 : the response is kept as a string
+        response = json.dumps(content.decode("utf-8", errors="replace"))
+    else:
+        # Checked in full : a JSON line is inserted as is, without encoding it again
+        response = text if "\n" not in text and "\r" not in text else json.dumps(document, separators=(",", ":"))
+
+    return f'{line[:-1]}{"," if len(result) > 0 else ""}"response":{response}}}\n'
+
+
+class ResponseOutput:
+    """Where the responses are written : the standard output, or a gzip file when gzip_path is given"""
+
+    def __init__(self, gzip_path: str | None = None, stream: BinaryIO | None = None) -> None:
+        self.gzip_path: str | None = gzip_path
+        if gzip_path is not None:
+            self.stream: BinaryIO = gzip.open(gzip_path, "wb")
+        else:
+            self.stream = stream if stream is not None else sys.stdout.buffer
+
+    def __enter__(self) -> "ResponseOutput":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def write(self, data: bytes) -> None:
+        self.stream.write(data)
+
+    def close(self) -> None:
+        if self.gzip_path is not None:
+            self.stream.close()
+        else:
+            self.stream.flush()
@@ -0,0 +1,260 @@
+
+import re
+import os
+import sys
+import json
+import mmap
+import stat
+import hashlib
+
+from typing import BinaryIO
+
+
+# Structural bytes of a JSON document. Everything else is skipped by the regex engine
+STRUCTURAL_BYTES = re.compile(rb'[{}\[\]"\\]')
+NON_WHITESPACE = re.compile(rb'[^ \t\r\n]')
+
+OPENING_BYTES = frozenset(b"{[")
+CLOSING_BYTES = { ord("}"): ord("{"), ord("]"): ord("[") }
+QUOTE = ord('"')
+BACKSLASH = ord("\\")
+
+# Quotas of the shadow service : compact size of an UPDATE document, levels under 'desired' or 'reported'
+MAX_DOCUMENT_SIZE = 8 * 1024
+MAX_STATE_DEPTH = 8
+MAX_CLIENT_TOKEN_LENGTH = 64
+UPDATE_KEYS = frozenset(("state", "version", "clientToken"))
+STATE_SECTIONS = frozenset(("desired", "reported"))
+
+
+class StateDocumentValidator:
+    """
+        Incremental structural check of a state document, fed chunk by chunk :
+        one JSON object, balanced braces and brackets, terminated strings.
+        Literals and numbers are left to the server.
+    """
+
+    def __init__(self) -> None:
+        self.max_depth: int = 0
+        self.size: int = 0
+
+        self.__stack: list[int] = []
+        self.__in_string: bool = False
+        self.__escaped: bool = False
+        self.__started: bool = False
+        self.__ended: bool = False
+
+    def __error(self, offset: int, reason: str) -> ValueError:
+        return ValueError(f"Invalid state document at byte {self.size + offset}: {reason}")
+
+    def __check_end(self, chunk: bytes | memoryview, position: int) -> None:
+        if NON_WHITESPACE.search(chunk, position) is not None:
+            raise self.__error(position, "data after the end of the document")
+
+    def feed(self, chunk: bytes | memoryview) -> None:
+        position = 0
+
+        if self.__ended:
+            self.__check_end(chunk, position)
+        elif not self.__started:
+            first = NON_WHITESPACE.search(chunk)
+            if first is not None:
+                if chunk[first.start()] != ord("{"):
+                    raise self.__error(first.start(), "a state document is a JSON object")
+                self.__started = True
+
+        if self.__escaped and len(chunk) > 0:
+            # The backslash ending the previous chunk escapes the first byte of this one
+            self.__escaped = False
+            position = 1
+
+        skip = -1
+        for match in STRUCTURAL_BYTES.finditer(chunk, position):
+            index = match.start()
+            if index == skip or self.__ended:
+                continue
+            byte = chunk[index]
+
+            if self.__in_string:
+                if byte == BACKSLASH:
+                    skip = index + 1
+                elif byte == QUOTE:
+                    self.__in_string = False
+            elif byte == QUOTE:
+                self.__in_string = True
+            elif byte in OPENING_BYTES:
+                self.__stack.append(byte)
+                self.max_depth = max(self.max_depth, len(self.__stack))
+            elif byte in CLOSING_BYTES:
+                if not self.__stack or self.__stack.pop() != CLOSING_BYTES[byte]:
+                    raise self.__error(index, f"unexpected '{chr(byte)}'")
+                if not self.__stack:
+                    self.__ended = True
+                    self.__check_end(chunk, index + 1)
+            else:
+                raise self.__error(index, "backslash outside of a string")
+
+        self.__escaped = skip == len(chunk)
+        self.size += len(chunk)
+
+    def close(self) -> None:
+        if not self.__ended:
+            raise self.__error(0, "truncated document")
+
+
+class StatePayload:
+    """
+        State document ready to be sent : its bytes (memory-mapped file or buffer read
+        from a pipe) and their SHA256, computed while the document was read.
+        body is a memoryview, so the transport sends the bytes without copying them.
+    """
+
+    def __init__(self, buffer: bytes | bytearray | mmap.mmap, hashed_payload: str, max_depth: int = 0) -> None:
+        self.hashed_payload: str = hashed_payload
+        self.max_depth: int = max_depth
+
+        self.__buffer = buffer
+        self.body: memoryview = memoryview(buffer)
+
+    def __len__(self) -> int:
+        return len(self.body)
+
+    def close(self) -> None:
+        self.body.release()
+        if isinstance(self.__buffer, mmap.mmap):
+            self.__buffer.close()
+
+
+def read_state_document(source: str | BinaryIO, validate: bool = True, chunk_size: int = 64 * 1024) -> StatePayload:
+    """
+        Read a state document from a path, '-' (the standard input) or a binary file object.
+        A regular file is memory-mapped ; a pipe is read chunk by chunk in one growing buffer.
+        Each chunk is hashed (and validated) as soon as it is read.
+    """
+    if source == "-":
+        return read_state_document(sys.stdin.buffer, validate, chunk_size)
+
+    if isinstance(source, str):
+        if not os.path.exists(source):
+            raise FileNotFoundError(f"Path {source} does not exist")
+        with open(source, "rb") as state_document:
+            return read_state_document(state_document, validate, chunk_size)
+
+    hash = hashlib.sha256()
+    validator = StateDocumentValidator() if validate else None
+
+    def consume(chunk: memoryview) -> None:
+        hash.update(chunk)
+        if validator is not None:
+            validator.feed(chunk)
+
+    buffer: bytes | bytearray | mmap.mmap
+    try:
+        file_stat = os.fstat(source.fileno())
+        is_regular_file, size = stat.S_ISREG(file_stat.st_mode), file_stat.st_size
+    except (AttributeError, OSError, ValueError):
+        is_regular_file, size = False, 0
+
+    if is_regular_file and size > 0:
+        buffer = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(buffer)
+        for offset in range(0, size, chunk_size):
+            consume(view[offset:offset + chunk_size])
+        view.release()
+    else:
+        buffer = bytearray()
+        chunk = bytearray(chunk_size)
+        chunk_view = memoryview(chunk)
+        while True:
+            read = source.readinto(chunk_view)
+            if not read:
+                break
+            consume(chunk_view[:read])
+            buffer += chunk_view[:read]
+        chunk_view.release()
+
+    if validator is not None:
+        validator.close()
+
+    return StatePayload(buffer, hash.hexdigest(), validator.max_depth if validator is not None else 0)
+
+
+def check_state_depth(section_state: dict | list, section: str, max_depth: int = MAX_STATE_DEPTH) -> None:
+    """Levels of objects and arrays of a section, itself being the first one. Iterative, so a deep document cannot exhaust the stack"""
+    stack = [(section_state, 1)]
+    while stack:
+        value, depth = stack.pop()
+        if depth > max_depth:
+            raise ValueError(f"'{section}' is nested deeper than {max_depth} levels")
+        children = value.values() if isinstance(value, dict) else value
+        stack.extend((child, depth + 1) for child in children if isinstance(child, (dict, list)))
+
+
+def validate_state_document(state_document: dict, max_depth: int = MAX_STATE_DEPTH) -> None:
+    """Structure of an UPDATE document : a 'state' with 'desired' and 'reported' objects (or null), an integer 'version', a short 'clientToken'"""
+    if not isinstance(state_document, dict):
+        raise ValueError("A state document is a JSON object")
+
+    unknown_keys = state_document.keys() - UPDATE_KEYS
+    if unknown_keys:
+        raise ValueError(f"Unknown keys in the state document : {', '.join(sorted(map(str, unknown_keys)))}. It can have {', '.join(sorted(UPDATE_KEYS))}")
+    if "state" not in state_document:
+        raise ValueError("A state document has a 'state' object")
+
+    if "version" in state_document and (not isinstance(state_document["version"], int) or isinstance(state_document["version"], bool) or state_document["version"] < 0):
+        raise ValueError("'version' is a positive integer")
+    if "clientToken" in state_document and (not isinstance(state_document["clientToken"], str) or len(state_document["clientToken"].encode("utf-8")) > MAX_CLIENT_TOKEN_LENGTH):
+        raise ValueError(f"'clientToken' is a string of at most {MAX_CLIENT_TOKEN_LENGTH} bytes")
+
+    state = state_document["state"]
+    if state is None:
+        # Deletes the whole state
+        return
+    if not isinstance(state, dict):
+        raise ValueError("'state' is a JSON object or null")
+
+    for section, section_state in state.items():
+        if section not in STATE_SECTIONS:
+            raise ValueError(f"'{section}' is not a section of the state. It can be either {' or '.join(sorted(STATE_SECTIONS))}")
+        if section_state is None:
+            continue
+        if not isinstance(section_state, dict):
+            raise ValueError(f"'{section}' is a JSON object or null")
+        check_state_depth(section_state, section, max_depth)
+
+
+def encode_shadow_document(state_document: dict, max_size: int = MAX_DOCUMENT_SIZE, max_depth: int = MAX_STATE_DEPTH) -> str:
+    """
+        Compact canonical JSON of an UPDATE document : no whitespace, sorted keys, UTF-8 instead of \\u escapes.
+        Checked against the shadow quotas first, so a bad document is refused before it is signed.
+    """
+    validate_state_document(state_document, max_depth)
+
+    try:
+        encoded = json.dumps(state_document, separators=(",", ":"), sort_keys=True, ensure_ascii=False, allow_nan=False)
+    except TypeError as t_err:
+        raise ValueError(f"The state document cannot be encoded : {t_err}") from None
+
+    # Only the non-ASCII characters take more than one byte
+    size = len(encoded) if encoded.isascii() else len(encoded.encode("utf-8"))
+    if size > max_size:
+        raise ValueError(f"The state document is {size} bytes, more than the {max_size} bytes of a shadow")
+    return encoded
+
+
+def check_state_payload(payload: StatePayload, max_size: int = MAX_DOCUMENT_SIZE, max_depth: int = MAX_STATE_DEPTH) -> None:
+    """
+        The quotas of encode_shadow_document for a state document read from a file, sent as it is.
+        The depth comes from the pass of the validator while the file was read, so a deep file is refused
+        before it is decoded. The service measures the document without its whitespace : a larger file
+        is measured once encoded compactly.
+    """
+    # The root object and 'state' are the first two levels of the file
+    if payload.max_depth - 2 > max_depth:
+        raise ValueError(f"The state document is nested deeper than {max_depth} levels under 'desired' or 'reported'")
+
+    state_document = json.loads(bytes(payload.body))
+    if len(payload) > max_size:
+        encode_shadow_document(state_document, max_size, max_depth)
+    else:
+        validate_state_document(state_document, max_depth)
@@ -0,0 +1,111 @@
+
+import hashlib
+import datetime
+
+from typing import Iterable
+from urllib.parse import quote
+
+from aws_create_request.app import Credentials
+from aws_create_request.canonical_request import EMPTY_PAYLOAD_HASH, get_canonical_request_template
+from aws_create_request.constants import AVAILABLE_REGION, SERVICE, HTTPMethod
+from aws_create_request.string_to_sign import StringToSign, SigningKeyCache
+
+
+# A presigned URL can't be valid for more than 7 days
+MAX_EXPIRES = 7 * 24 * 60 * 60
+
+
+def encode_query_string(query: dict[str, str]) -> str:
+    """Canonical query string : URI-encoded keys and values, sorted by key"""
+    encoded = sorted((quote(key, safe="-_.~"), quote(value, safe="-_.~")) for key, value in query.items())
+    return "&".join(f"{key}={value}" for key, value in encoded)
+
+
+def presign(credentials: Credentials, method: str, host: str, path: str, query: dict[str, str], region: str, service: str = SERVICE, expires: int = 300, request_date_time: str | None = None, hashed_payload: str = EMPTY_PAYLOAD_HASH, key_cache: SigningKeyCache | None = None, sign_security_token: bool = True) -> str:
+    """
+        Sign a request in its query string instead of its headers (X-Amz-Algorithm, X-Amz-Credential,
+        X-Amz-Date, X-Amz-Expires, X-Amz-SignedHeaders and X-Amz-Signature).
+        Return the query string, signature included.
+        Without sign_security_token, the session token is appended after the signature, as AWS IoT expects it on /mqtt.
+    """
+    if not 0 < expires <= MAX_EXPIRES:
+        raise ValueError(f"A presigned URL expires after 1 to {MAX_EXPIRES} seconds, not {expires}")
+    if request_date_time is None:
+        request_date_time = datetime.datetime.now(tz=datetime.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    credentials = credentials.get_frozen_credentials()
+
+    credential_scope = f"{request_date_time.split('T')[0]}/{region}/{service}/aws4_request"
+    signed_query = {
+        **query,
+        "X-Amz-Algorithm": "AWS4-HMAC-SHA256",
+        "X-Amz-Credential": f"{credentials.aws_access_key_id}/{credential_scope}",
+        "X-Amz-Date": request_date_time,
+        "X-Amz-Expires": str(expires),
+        "X-Amz-SignedHeaders": "host"
+    }
+    if credentials.aws_session_token and sign_security_token:
+        signed_query["X-Amz-Security-Token"] = credentials.aws_session_token
+    query_string = encode_query_string(signed_query)
+
+    canonical_string = "\n".join([method, path, query_string, f"host:{host}", "", "host", hashed_payload])
+
+    string_to_sign = StringToSign()
+    string_to_sign.complete_string_to_sign_from_date(
+        request_date_time=request_date_time,
+        canonical_request_hash=hashlib.sha256(canonical_string.encode("utf-8")).hexdigest(),
+        region=region,
+        service=service
+    )
+    signature = string_to_sign.calculate_signature(credentials.aws_secret_access_key, key_cache)
+
+    query_string = f"{query_string}&X-Amz-Signature={signature}"
+    if credentials.aws_session_token and not sign_security_token:
+        query_string = f"{query_string}&{encode_query_string({ 'X-Amz-Security-Token': credentials.aws_session_token })}"
+    return query_string
+
+
+def presign_url(credentials: Credentials, region: str, shadow_method: str, thing_name: str, shadow_name: str | None = None, payload: str = "", expires: int = 300, request_date_time: str | None = None, key_cache: SigningKeyCache | None = None) -> str:
+    """
+        Presigned https URL of a shadow operation, usable without any crypto by the thing.
+        The URL of an UPDATE is only valid for the payload it was signed with.
+    """
+    if region not in AVAILABLE_REGION:
+        raise ValueError(f"'{region}' is not an available region")
+
+    template = get_canonical_request_template(shadow_method, thing_name, shadow_name if shadow_name else None, region)
+    query = { "name": shadow_name } if shadow_name else {}
+    hashed_payload = hashlib.sha256(payload.encode("utf-8")).hexdigest() if payload else EMPTY_PAYLOAD_HASH
+
+    query_string = presign(
+        credentials=credentials,
+        method=template.http_method,
+        host=template.host,
+        path=template.canonical_uri,
+        query=query,
+        region=region,
+        expires=expires,
+        request_date_time=request_date_time,
+        hashed_payload=hashed_payload,
+        key_cache=key_cache
+    )
+
+    return f"https://{template.host}{template.canonical_uri}?{query_string}"
+
+
+def presign_urls(credentials: Credentials, region: str, shadow_method: str, things: Iterable[str | tuple[str, str | None] | tuple[str, str | None, str]], expires: int = 300, key_cache: SigningKeyCache | None = None) -> list[str]:
+    """
+        Presigned URLs for a list of thing names, (thing name, shadow name) or (thing name, shadow name, payload), in the same order.
+        Every URL shares the same date, so the signing key is derived once for the whole list.
+        An UPDATE URL is only valid for its payload : each UPDATE is given as (thing name, shadow name, payload).
+    """
+    request_date_time = datetime.datetime.now(tz=datetime.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    is_update = getattr(HTTPMethod, shadow_method.upper(), None) == HTTPMethod.UPDATE
+
+    urls = []
+    for thing in things:
+        thing_name, shadow_name, payload = (thing, None, "") if isinstance(thing, str) else (*thing, "")[:3]
+        if is_update and not payload:
+            raise ValueError(f"The URL of an UPDATE is signed with its payload : give ({thing_name}, shadow name, payload) instead of {thing!r}")
+        urls.append(presign_url(credentials, region, shadow_method, thing_name, shadow_name, payload, expires=expires, request_date_time=request_date_time, key_cache=key_cache))
+
+    return urls
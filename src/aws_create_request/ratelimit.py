@@ -0,0 +1,113 @@
+
+import time
+import threading
+
+from collections import OrderedDict
+
+
+class TokenBucket:
+    """rate tokens per second, at most burst tokens saved while idle"""
+
+    def __init__(self, rate: float, burst: float | None = None) -> None:
+        if rate <= 0:
+            raise ValueError(f"A rate is a positive number of requests per second, not {rate}")
+
+        self.rate: float = rate
+        self.burst: float = burst if burst is not None else max(1.0, rate)
+
+        self.__tokens: float = self.burst
+        self.__updated_at: float = time.monotonic()
+        self.__lock = threading.Lock()
+
+    def __refill(self, now: float) -> None:
+        self.__tokens = min(self.burst, self.__tokens + (now - self.__updated_at) * self.rate)
+        self.__updated_at = now
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        """Take tokens if available, without waiting"""
+        with self.__lock:
+            self.__refill(time.monotonic())
+            if self.__tokens >= tokens:
+                self.__tokens -= tokens
+                return True
+            return False
+
+    def reserve(self, tokens: float = 1.0) -> float:
+        """
+            Take tokens now, even those not refilled yet, and return the seconds to wait before using them.
+            The callers are served in the order of their reservations, exactly at the rate of the bucket.
+        """
+        with self.__lock:
+            self.__refill(time.monotonic())
+            self.__tokens -= tokens
+            return max(0.0, -self.__tokens / self.rate)
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """Wait for tokens. Return the seconds waited"""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def drain(self) -> None:
+        """Drop the saved tokens, e.g. when the server throttled : no burst until they are refilled"""
+        with self.__lock:
+            self.__refill(time.monotonic())
+            self.__tokens = min(self.__tokens, 0.0)
+
+
+class RateLimiter:
+    """
+        Client-side rate limit of the shadow requests : one bucket for the whole account (rate)
+        and one bucket per thing (thing_rate). Either can be None to not limit it.
+        At most max_things per-thing buckets are kept ; the least recently used go first.
+    """
+
+    def __init__(self, rate: float | None = None, burst: float | None = None, thing_rate: float | None = None, thing_burst: float | None = None, max_things: int = 10000) -> None:
+        self.thing_rate: float | None = thing_rate
+        self.thing_burst: float | None = thing_burst
+        self.max_things: int = max_things
+
+        self.bucket: TokenBucket | None = TokenBucket(rate, burst) if rate else None
+        self.waited: float = 0.0
+
+        self.__thing_buckets: OrderedDict[str, TokenBucket] = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def get_thing_bucket(self, thing_name: str) -> TokenBucket | None:
+        if not self.thing_rate:
+            return None
+
+        with self.__lock:
+            bucket = self.__thing_buckets.get(thing_name)
+            if bucket is None:
+                bucket = TokenBucket(self.thing_rate, self.thing_burst)
+                self.__thing_buckets[thing_name] = bucket
+                if len(self.__thing_buckets) > self.max_things:
+                    self.__thing_buckets.popitem(last=False)
+            else:
+                self.__thing_buckets.move_to_end(thing_name)
+            return bucket
+
+    def reserve(self, thing_name: str) -> float:
+        """Seconds to wait before sending a request for this thing"""
+        wait = 0.0
+        for bucket in (self.get_thing_bucket(thing_name), self.bucket):
+            if bucket is not None:
+                wait = max(wait, bucket.reserve())
+
+        with self.__lock:
+            self.waited += wait
+        return wait
+
+    def acquire(self, thing_name: str) -> float:
+        wait = self.reserve(thing_name)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def throttled(self, thing_name: str) -> None:
+        """The server answered 429 : stop bursting"""
+        for bucket in (self.get_thing_bucket(thing_name), self.bucket):
+            if bucket is not None:
+                bucket.drain()
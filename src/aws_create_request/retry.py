@@ -0,0 +1,138 @@
+
+import ssl
+import time
+import random
+import socket
+import threading
+import http.client
+
+from typing import Awaitable, Callable, Iterator, TypeVar
+
+
+# Throttled, or failed on the side of the service
+RETRYABLE_STATUSES = frozenset({ 429, 500, 502, 503, 504 })
+# Connection refused, reset or timed out, DNS failure, response cut (EOFError of the asyncio streams)
+RETRYABLE_ERRORS = (OSError, http.client.HTTPException, EOFError)
+# Raised before the request reached the server : retried whatever its method
+UNSENT_ERRORS = (ConnectionRefusedError, socket.gaierror)
+# Another attempt would fail the same way
+FATAL_ERRORS = (ssl.SSLCertVerificationError,)
+
+Response = TypeVar("Response")
+
+
+def get_retry_after(response) -> float:
+    """Seconds asked by the Retry-After header of a response, 0 without it"""
+    for name, value in response.headers.items():
+        if name.lower() == "retry-after":
+            try:
+                return max(0.0, float(value))
+            except ValueError:
+                return 0.0
+    return 0.0
+
+
+class RetryPolicy:
+    """
+        Retry of the shadow requests throttled (429), failed on the service side (5xx) or
+        whose connection failed, after an exponential backoff with decorrelated jitter :
+        each delay is drawn between base_delay and 3 times the previous one, up to max_delay.
+        A longer Retry-After of the server is waited, or the call gives up if it is above max_delay.
+        timeout bounds the whole call, retries included.
+        send is called again for each attempt, so that it signs the request again. A request which is not
+        resendable (an UPDATE) is only retried after a connection error if it was never sent.
+    """
+
+    def __init__(self, max_attempts: int = 4, base_delay: float = 0.05, max_delay: float = 5.0, timeout: float | None = None, retryable_statuses: frozenset[int] = RETRYABLE_STATUSES, seed: int | None = None) -> None:
+        if max_attempts < 1:
+            raise ValueError(f"A request is attempted at least once, not {max_attempts} times")
+
+        self.max_attempts: int = max_attempts
+        self.base_delay: float = base_delay
+        self.max_delay: float = max_delay
+        self.timeout: float | None = timeout
+        self.retryable_statuses: frozenset[int] = retryable_statuses
+
+        self.retries: int = 0
+        self.exhausted: int = 0
+
+        self.__random = random.Random(seed)
+        self.__lock = threading.Lock()
+
+    def get_delays(self) -> Iterator[float]:
+        """The delays before each retry"""
+        delay = self.base_delay
+        for _ in range(self.max_attempts - 1):
+            with self.__lock:
+                delay = min(self.max_delay, self.__random.uniform(self.base_delay, delay * 3))
+            yield delay
+
+    def is_retryable(self, response) -> bool:
+        return response.status_code in self.retryable_statuses
+
+    def is_retryable_error(self, error: BaseException, resendable: bool = True) -> bool:
+        if isinstance(error, FATAL_ERRORS):
+            return False
+        return resendable or isinstance(error, UNSENT_ERRORS)
+
+    def __next_delay(self, delays: Iterator[float], deadline: float | None, response) -> float | None:
+        """Delay before the next attempt, or None to give up"""
+        delay = next(delays, None)
+        if delay is not None and response is not None:
+            retry_after = get_retry_after(response)
+            # The server asks to wait longer than allowed : the response is returned rather than sent too early
+            delay = max(delay, retry_after) if retry_after <= self.max_delay else None
+        if delay is None or (deadline is not None and time.monotonic() + delay > deadline):
+            with self.__lock:
+                self.exhausted += 1
+            return None
+
+        with self.__lock:
+            self.retries += 1
+        return delay
+
+    def call(self, send: Callable[[], Response], resendable: bool = True) -> Response:
+        """Return the last response, or raise the last connection error"""
+        delays = self.get_delays()
+        deadline = time.monotonic() + self.timeout if self.timeout is not None else None
+
+        while True:
+            try:
+                response = send()
+            except RETRYABLE_ERRORS as e:
+                if not self.is_retryable_error(e, resendable):
+                    raise
+                delay = self.__next_delay(delays, deadline, None)
+                if delay is None:
+                    raise
+            else:
+                if not self.is_retryable(response):
+                    return response
+                delay = self.__next_delay(delays, deadline, response)
+                if delay is None:
+                    return response
+            time.sleep(delay)
+
+    async def call_async(self, send: Callable[[], Awaitable[Response]], resendable: bool = True) -> Response:
+        """Same as call, for a coroutine function"""
+        import asyncio
+
+        delays = self.get_delays()
+        deadline = time.monotonic() + self.timeout if self.timeout is not None else None
+
+        while True:
+            try:
+                response = await send()
+            except (*RETRYABLE_ERRORS, asyncio.TimeoutError) as e:
+                if not self.is_retryable_error(e, resendable):
+                    raise
+                delay = self.__next_delay(delays, deadline, None)
+                if delay is None:
+                    raise
+            else:
+                if not self.is_retryable(response):
+                    return response
+                delay = self.__next_delay(delays, deadline, response)
+                if delay is None:
+                    return response
+            await asyncio.sleep(delay)
@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import mmap
+import bisect
+import struct
+import hashlib
+import argparse
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable
+
+from aws_create_request.cache import find_version
+from aws_create_request.client import ShadowClient
+
+
+NOT_FOUND = 404
+
+DATA_FILE_NAME = "shadows.ndjson"
+INDEX_FILE_NAME = "shadows.idx"
+
+# Index : a header, then one record per shadow sorted by key, so a lookup is a binary search in the mapped file
+INDEX_MAGIC = b"SHX2"
+INDEX_HEADER = struct.Struct("<4sI")
+# Key (BLAKE2b of the thing name, then of the shadow name), version, offset and length of the line in the data file
+INDEX_RECORD = struct.Struct("<16sQQI")
+NAME_KEY_SIZE = 8
+KEY_SIZE = 2 * NAME_KEY_SIZE
+# Version of a document which has none : never equal to the version of a fetched shadow
+NO_VERSION = 2 ** 64 - 1
+
+
+def get_thing_key(thing_name: str) -> bytes:
+    """First half of the keys of the shadows of a thing : they are next to each other in the index"""
+    return hashlib.blake2b(thing_name.encode("utf-8"), digest_size=NAME_KEY_SIZE).digest()
+
+
+def get_snapshot_key(thing_name: str, shadow_name: str | None = None) -> bytes:
+    return get_thing_key(thing_name) + hashlib.blake2b((shadow_name or "").encode("utf-8"), digest_size=NAME_KEY_SIZE).digest()
+
+
+class IndexKeys:
+    """Keys of the records of a mapped index, as a sequence for bisect"""
+
+    def __init__(self, index: mmap.mmap, count: int) -> None:
+        self.__index = index
+        self.__count = count
+
+    def __len__(self) -> int:
+        return self.__count
+
+    def __getitem__(self, position: int) -> bytes:
+        start = INDEX_HEADER.size + position * INDEX_RECORD.size
+        return self.__index[start:start + KEY_SIZE]
+
+
+class FleetSnapshot:
+    """
+        Snapshot of the shadows of a fleet in a directory : an append-only NDJSON data file, one line per
+        stored document, and an index of (thing name, shadow name) -> (version, offset, length).
+        A run only appends the documents whose version changed, then replaces the index ;
+        a lookup reads the mapped index then only its line of the data file.
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory: str = directory
+        os.makedirs(directory, exist_ok=True)
+
+        self.data_path: str = os.path.join(directory, DATA_FILE_NAME)
+        self.index_path: str = os.path.join(directory, INDEX_FILE_NAME)
+
+        self.__index: mmap.mmap | None = None
+        self.__count: int = 0
+        self.__lock = threading.Lock()
+
+    def __enter__(self) -> "FleetSnapshot":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+
+    ######################################
+    # INDEX
+    ######################################
+
+    def __open_index(self) -> mmap.mmap | None:
+        if self.__index is None:
+            try:
+                with open(self.index_path, "rb") as index_file:
+                    index = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+            except FileNotFoundError:
+                return None
+            magic, count = INDEX_HEADER.unpack_from(index)
+            if magic != INDEX_MAGIC or len(index) != INDEX_HEADER.size + count * INDEX_RECORD.size:
+                index.close()
+                raise ValueError(f"{self.index_path} is not a snapshot index")
+            self.__index, self.__count = index, count
+        return self.__index
+
+    def __find(self, key: bytes) -> tuple[int, int, int] | None:
+        with self.__lock:
+            index = self.__open_index()
+            if index is None:
+                return None
+            position = bisect.bisect_left(IndexKeys(index, self.__count), key)
+            if position == self.__count:
+                return None
+            found, version, offset, length = INDEX_RECORD.unpack_from(index, INDEX_HEADER.size + position * INDEX_RECORD.size)
+        return (version, offset, length) if found == key else None
+
+    def __read_index(self) -> dict[bytes, tuple[int, int, int]]:
+        with self.__lock:
+            index = self.__open_index()
+            if index is None:
+                return {}
+            return {
+                key: (version, offset, length)
+                for key, version, offset, length in INDEX_RECORD.iter_unpack(index[INDEX_HEADER.size:])
+            }
+
+    def __write_index(self, records: dict[bytes, tuple[int, int, int]]) -> None:
+        index = bytearray(INDEX_HEADER.size + len(records) * INDEX_RECORD.size)
+        INDEX_HEADER.pack_into(index, 0, INDEX_MAGIC, len(records))
+        for position, key in enumerate(sorted(records)):
+            INDEX_RECORD.pack_into(index, INDEX_HEADER.size + position * INDEX_RECORD.size, key, *records[key])
+
+        # Write then rename, so a lookup never reads a truncated index
+        with open(f"{self.index_path}.tmp", "wb") as index_file:
+            index_file.write(index)
+            index_file.flush()
+            os.fsync(index_file.fileno())
+        with self.__lock:
+            os.replace(f"{self.index_path}.tmp", self.index_path)
+            self.__close_index()
+
+    def __close_index(self) -> None:
+        if self.__index is not None:
+            self.__index.close()
+            self.__index, self.__count = None, 0
+
+    def __len__(self) -> int:
+        with self.__lock:
+            self.__open_index()
+            return self.__count
+
+
+
+    ######################################
+    # LOOKUPS
+    ######################################
+
+    def get_version(self, thing_name: str, shadow_name: str | None = None) -> int | None:
+        """Version of the stored document, from the index only. None if the shadow is not in the snapshot"""
+        found = self.__find(get_snapshot_key(thing_name, shadow_name))
+        if found is None or found[0] == NO_VERSION:
+            return None
+        return found[0]
+
+    def get_line(self, thing_name: str, shadow_name: str | None = None) -> bytes | None:
+        """Line of the data file of a shadow, as it was written"""
+        found = self.__find(get_snapshot_key(thing_name, shadow_name))
+        if found is None:
+            return None
+        with open(self.data_path, "rb") as data_file:
+            return os.pread(data_file.fileno(), found[2], found[1])
+
+    def get(self, thing_name: str, shadow_name: str | None = None) -> dict | None:
+        """Stored document of a shadow, None if it is not in the snapshot"""
+        line = self.get_line(thing_name, shadow_name)
+        if line is None:
+            return None
+        entry = json.loads(line)
+        # Two names with the same key are as likely as a collision of BLAKE2b, but are not mixed up
+        if entry["thing_name"] != thing_name or entry["shadow_name"] != (shadow_name or None):
+            return None
+        return entry["shadow"]
+
+
+
+    ######################################
+    # SNAPSHOT
+    ######################################
+
+    def update(self, client: ShadowClient, thing_names: Iterable[str], named: bool = False, max_workers: int = 16) -> dict:
+        """
+            Fetch the classic shadow of each thing (and its named shadows with named) on max_workers threads,
+            and append the documents whose version is not the one of the index.
+            The new index only has the shadows of this run : a shadow which no longer exists, or is no longer
+            listed, leaves it. One whose GET failed, or all those of a thing whose listing failed, keep their previous document.
+        """
+        previous = self.__read_index()
+        previous_keys: list[bytes] | None = None
+        records: dict[bytes, tuple[int, int, int]] = {}
+        stats = { "stored": 0, "unchanged": 0, "missing": 0, "failed": 0 }
+        records_lock = threading.Lock()
+
+        with open(self.data_path, "ab") as data_file:
+            offset = data_file.tell()
+
+            def snapshot_shadow(thing_name: str, shadow_name: str | None) -> None:
+                nonlocal offset
+                key = get_snapshot_key(thing_name, shadow_name)
+
+                response = client.get(thing_name, shadow_name)
+                if response.status_code == NOT_FOUND:
+                    with records_lock:
+                        # Kept with the other shadows of its thing when their listing failed
+                        records.pop(key, None)
+                        stats["missing"] += 1
+                    return
+                response.raise_for_status()
+
+                version = find_version(response.content)
+                known = previous.get(key)
+                if version is not None and known is not None and known[0] == version:
+                    with records_lock:
+                        records[key] = known
+                        stats["unchanged"] += 1
+                    return
+
+                header = json.dumps({ "thing_name": thing_name, "shadow_name": shadow_name, "version": version }, separators=(",", ":"))
+                # A newline of a JSON document is whitespace : removed, the document holds on one line
+                line = b"".join((header[:-1].encode("utf-8"), b',"shadow":', response.content.replace(b"\n", b""), b"}\n"))
+
+                with records_lock:
+                    data_file.write(line)
+                    records[key] = (version if version is not None else NO_VERSION, offset, len(line))
+                    offset += len(line)
+                    stats["stored"] += 1
+
+            def keep_previous(thing_name: str, shadow_name: str | None = None, whole_thing: bool = False) -> None:
+                nonlocal previous_keys
+                with records_lock:
+                    if not whole_thing:
+                        key = get_snapshot_key(thing_name, shadow_name)
+                        if key in previous:
+                            records[key] = previous[key]
+                        return
+
+                    if previous_keys is None:
+                        previous_keys = sorted(previous)
+                    thing_key = get_thing_key(thing_name)
+                    position = bisect.bisect_left(previous_keys, thing_key)
+                    while position < len(previous_keys) and previous_keys[position].startswith(thing_key):
+                        records[previous_keys[position]] = previous[previous_keys[position]]
+                        position += 1
+
+            def snapshot_thing(thing_name: str) -> None:
+                shadow_names = [None]
+                try:
+                    if named:
+                        shadow_names.extend(client.list_named_shadows(thing_name))
+                except Exception:
+                    # The named shadows of the thing are unknown : none of them leaves the index
+                    keep_previous(thing_name, whole_thing=True)
+                    with records_lock:
+                        stats["failed"] += 1
+
+                for shadow_name in shadow_names:
+                    try:
+                        snapshot_shadow(thing_name, shadow_name)
+                    except Exception:
+                        keep_previous(thing_name, shadow_name)
+                        with records_lock:
+                            stats["failed"] += 1
+
+            # Bound the number of queued things, so a large fleet is never fully loaded
+            slots = threading.BoundedSemaphore(max_workers * 2)
+
+            def run_thing(thing_name: str) -> None:
+                try:
+                    snapshot_thing(thing_name)
+                finally:
+                    slots.release()
+
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                for thing_name in thing_names:
+                    slots.acquire()
+                    executor.submit(run_thing, thing_name)
+
+            # The lines are on disk before the index points to them
+            data_file.flush()
+            os.fsync(data_file.fileno())
+
+        self.__write_index(records)
+        stats["shadows"] = len(records)
+        return stats
+
+    def close(self) -> None:
+        with self.__lock:
+            self.__close_index()
+
+
+
+######################################
+# COMMAND LINE
+######################################
+
+def _init_argparse() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        "ShadowHttpApiSnapshot",
+        description="Store the shadows of a fleet whose version changed since the last snapshot, or read one from the snapshot",
+        add_help=True
+    )
+
+    parser.add_argument("-d", "--directory", dest="directory", help="Directory of the snapshot", required=True)
+    parser.add_argument("-f", "--things", dest="things", help="File of the thing names, one per line. '-' to read them from the standard input", required=False)
+    parser.add_argument("--named", action="store_true", dest="named", help="Store the named shadows of each thing too")
+    parser.add_argument("-l", "--lookup", dest="lookup", help="Write the stored document of this thing instead of taking a snapshot", required=False)
+    parser.add_argument("-s", "--shadow-name", dest="shadow_name", help="The name of the shadow to look up, for a named shadow", required=False)
+    parser.add_argument("-w", "--workers", default=16, type=int, dest="workers", help="Number of shadows fetched at the same time. Default to 16", required=False)
+    parser.add_argument("-r", "--region", default="eu-west-1", dest="region", help="The region where the things are registered in AWS. Default to 'eu-west-1'", required=False)
+    parser.add_argument("-e", "--endpoint", dest="endpoint", help="Send the requests to this endpoint (e.g. http://127.0.0.1:8080) instead of data-ats.iot.<region>.amazonaws.com", required=False)
+    parser.add_argument("--retries", default=3, type=int, dest="retries", help="Retries of a GET throttled (429), failed on the AWS side (5xx) or whose connection failed. Default to 3", required=False)
+    parser.add_argument("-a", "--aws-access-key-id", dest="aws_access_key_id", help="AWS access key id. Default to the environment, the credentials endpoint, then ~/.aws/credentials", required=False)
+    parser.add_argument("-k", "--aws-secret-access-key", dest="aws_secret_access_key", help="AWS secret access key", required=False)
+    parser.add_argument("--session-token", dest="aws_session_token", help="AWS session token of temporary credentials", required=False)
+    parser.add_argument("--profile", dest="profile", help="Read the credentials from this profile of ~/.aws/credentials", required=False)
+    parser.add_argument("--credentials-endpoint", dest="credentials_endpoint", help="Get temporary credentials from this URL, and get them again before they expire", required=False)
+
+    return parser
+
+def main() -> None:
+    args = _init_argparse().parse_args()
+
+    try:
+        with FleetSnapshot(args.directory) as snapshot:
+            if args.lookup is not None:
+                document = snapshot.get(args.lookup, args.shadow_name)
+                if document is None:
+                    raise ValueError(f"The shadow {args.shadow_name or '(classic)'} of {args.lookup} is not in the snapshot")
+                sys.stdout.write(json.dumps(document, separators=(",", ":")) + "\n")
+                return
+            if args.things is None:
+                raise ValueError("A snapshot needs the file of the thing names (-f)")
+
+            from aws_create_request.credentials import resolve_credentials
+            from aws_create_request.retry import RetryPolicy
+            from aws_create_request.transport import create_transport
+
+            client = ShadowClient(
+                resolve_credentials(args.aws_access_key_id, args.aws_secret_access_key, args.aws_session_token, args.profile, args.credentials_endpoint),
+                args.region,
+                transport=create_transport(pool_size=args.workers, endpoint=args.endpoint),
+                retry_policy=RetryPolicy(max_attempts=args.retries + 1) if args.retries > 0 else None
+            )
+            with client:
+                if args.things == "-":
+                    summary = snapshot.update(client, (line.strip() for line in sys.stdin if line.strip()), args.named, args.workers)
+                else:
+                    with open(args.things) as things:
+                        summary = snapshot.update(client, (line.strip() for line in things if line.strip()), args.named, args.workers)
+    except Exception as e:
+        sys.exit(e)
+
+    print(json.dumps(summary), file=sys.stderr)
+
+
+if __name__.__eq__("__main__"):
+    main()
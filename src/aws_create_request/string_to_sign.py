@@ -1,9 +1,100 @@
 
 import hmac
 import hashlib
+import datetime
+import threading
 
 from aws_create_request.canonical_request import CanonicalRequest
 
+
+def derive_signing_key(aws_secret_access_key: str, date: str, region: str, service: str) -> bytes:
+    """
+        1. kdate
+        2. kregion
+        3. kservice
+        4. ksigning
+    """
+    k_date = hmac.new(f"AWS4{aws_secret_access_key}".encode("utf-8"), date.encode("utf-8"), hashlib.sha256).digest()
+    k_region = hmac.new(k_date, region.encode("utf-8"), hashlib.sha256).digest()
+    k_service = hmac.new(k_region, service.encode("utf-8"), hashlib.sha256).digest()
+    k_signing = hmac.new(k_service, b"aws4_request", hashlib.sha256).digest()
+
+    return k_signing
+
+
+class SigningKeyCache:
+    """
+        Derived signing keys, keyed per credential/region/service.
+        A key is only valid for the UTC day of its credential scope, so an entry
+        expires at UTC midnight and is replaced on the first request of the next day.
+    """
+
+    def __init__(self) -> None:
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+
+        self.__keys: dict[tuple[str, str, str], tuple[str, bytes]] = {}
+        self.__lock = threading.Lock()
+
+    def __credential_id(self, aws_secret_access_key: str) -> str:
+        # Do not keep the secret itself as a dictionary key
+        return hashlib.sha256(aws_secret_access_key.encode("utf-8")).hexdigest()
+
+    def get_signing_key(self, aws_secret_access_key: str, date: str, region: str, service: str) -> bytes:
+        cache_key = (self.__credential_id(aws_secret_access_key), region, service)
+
+        with self.__lock:
+            entry = self.__keys.get(cache_key)
+            if entry is not None and entry[0] == date:
+                self.hits += 1
+                return entry[1]
+
+        signing_key = derive_signing_key(aws_secret_access_key, date, region, service)
+
+        with self.__lock:
+            self.misses += 1
+            self.__keys[cache_key] = (date, signing_key)
+            self.__evict_older_than(date)
+
+        return signing_key
+
+    def __evict_older_than(self, date: str) -> None:
+        expired = [cache_key for cache_key, (key_date, _) in self.__keys.items() if key_date < date]
+        for cache_key in expired:
+            del self.__keys[cache_key]
+        self.evictions += len(expired)
+
+    def purge_expired(self, now: datetime.datetime | None = None) -> None:
+        """Drop every key derived for a previous UTC day"""
+        if now is None:
+            now = datetime.datetime.now(tz=datetime.timezone.utc)
+        with self.__lock:
+            self.__evict_older_than(now.astimezone(datetime.timezone.utc).strftime("%Y%m%d"))
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__keys.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def get_stats(self) -> dict:
+        with self.__lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self.__keys),
+                "hit_ratio": self.hits / lookups if lookups else 0.0
+            }
+
+
+# Shared by every StringToSign of the process
+signing_key_cache = SigningKeyCache()
+
+
 class StringToSign:
     """
         algorithm
@@ -24,6 +115,13 @@ class StringToSign:
         self.__set_credential_scope(region, service)
         self.__set_hashed_canonical_request(canonical_request_hash)
 
+    def complete_string_to_sign_from_date(self, request_date_time: str, canonical_request_hash: str, region: str, service: str) -> None:
+        """Same as complete_string_to_sign, with the date the canonical request was built with"""
+        self.__set_algorithm()
+        self.request_date_time = request_date_time
+        self.__set_credential_scope(region, service)
+        self.__set_hashed_canonical_request(canonical_request_hash)
+
     def __set_algorithm(self) -> None:
         self.algorithm = "AWS4-HMAC-SHA256"
 
@@ -49,21 +147,18 @@ class StringToSign:
         hash = hmac.new(key, data, hashlib.sha256)
         return hash.hexdigest() if is_signature else hash.digest()
 
-    def calculate_signature(self, aws_secret_access_key: str) -> str:
+    def calculate_signature(self, aws_secret_access_key: str, key_cache: SigningKeyCache | None = None) -> str:
         """
-            1. kdate
-            2. kregion
-            3. kservice
-            4. ksigning
-            5. signature
+            1. ksigning, from the key cache (kdate -> kregion -> kservice -> ksigning on a miss)
+            2. signature
         """
+        if key_cache is None:
+            key_cache = signing_key_cache
+
         string_to_sign = self.__generate_string_to_sign()
-        [d_date, d_region, d_service, d_signing] = self.credential_scope.split("/")
+        [d_date, d_region, d_service, _] = self.credential_scope.split("/")
 
-        k_date = self.__sign(f"AWS4{aws_secret_access_key}".encode("utf-8"), d_date.encode("utf-8"))
-        k_region = self.__sign(k_date, d_region.encode("utf-8"))
-        k_service = self.__sign(k_region, d_service.encode("utf-8"))
-        k_signing = self.__sign(k_service, d_signing.encode("utf-8"))
+        k_signing = key_cache.get_signing_key(aws_secret_access_key, d_date, d_region, d_service)
         signature = self.__sign(k_signing, string_to_sign.encode("utf-8"), is_signature=True)
 
-        return signature
\ No newline at end of file
+        return signature
@@ -0,0 +1,284 @@
+
+import io
+import ssl
+import sys
+import json
+import struct
+import asyncio
+import threading
+import http.client
+
+from aws_create_request.mqtt import (
+    MQTT_PATH, MQTT_SERVICE, Opcode, PacketParser, PacketType,
+    decode_publish, encode_frame, encode_packet, encode_publish,
+    get_shadow_topic, get_websocket_accept, parse_shadow_topic, read_message
+)
+from aws_create_request.stub_server import ShadowStore, SigV4Verifier
+
+
+def match_topic(topic_filter: str, topic: str) -> bool:
+    """MQTT wildcards : + matches one level, # every remaining level"""
+    filter_levels, levels = topic_filter.split("/"), topic.split("/")
+    for index, level in enumerate(filter_levels):
+        if level == "#":
+            return True
+        if index >= len(levels) or level not in ("+", levels[index]):
+            return False
+    return len(filter_levels) == len(levels)
+
+
+class BrokerConnection:
+    """A client of the broker and its subscriptions (topic filter -> QoS)"""
+
+    def __init__(self, writer: asyncio.StreamWriter) -> None:
+        self.writer: asyncio.StreamWriter = writer
+        self.subscriptions: dict[str, int] = {}
+        self.__packet_id: int = 0
+
+    def send(self, packet: bytes) -> None:
+        # The frames of a server are not masked
+        self.writer.write(encode_frame(Opcode.BINARY, packet, mask=False))
+
+    def publish(self, topic: str, payload: bytes) -> None:
+        qos = max((qos for topic_filter, qos in self.subscriptions.items() if match_topic(topic_filter, topic)), default=None)
+        if qos is None:
+            return
+
+        packet_id = None
+        if qos > 0:
+            self.__packet_id = self.__packet_id % 0xFFFF + 1
+            packet_id = self.__packet_id
+        self.send(encode_publish(topic, payload, qos, packet_id))
+
+
+class StubShadowBroker:
+    """
+        Local stand-in of the MQTT over WebSocket endpoint of AWS IoT (/mqtt) for the shadow topics.
+        The WebSocket upgrade is refused (403) when its URL is not presigned with known credentials,
+        unless credentials is None.
+        A publish on .../get is answered on get/accepted or get/rejected, and one on .../update or
+        .../delete changes the store. Every update of the store, including those of a StubShadowServer
+        sharing it, is published on update/accepted, and on update/delta when the desired state
+        differs from the reported one.
+    """
+
+    def __init__(self, address: tuple[str, int] = ("127.0.0.1", 0), credentials: dict[str, str] | None = None, store: ShadowStore | None = None, ssl_context: ssl.SSLContext | None = None, verbose: bool = False) -> None:
+        self.address: tuple[str, int] = address
+        self.store: ShadowStore = store if store is not None else ShadowStore()
+        self.verifier: SigV4Verifier | None = SigV4Verifier(credentials, service=MQTT_SERVICE, signed_security_token=False) if credentials is not None else None
+        self.ssl_context: ssl.SSLContext | None = ssl_context
+        self.verbose: bool = verbose
+        self.server_address: tuple[str, int] | None = None
+
+        # Only used by the thread of the event loop
+        self.connections: set[BrokerConnection] = set()
+
+        self.__loop: asyncio.AbstractEventLoop | None = None
+        self.__thread: threading.Thread | None = None
+        self.__server: asyncio.AbstractServer | None = None
+        self.__error: OSError | None = None
+        # The same bound method, to remove it
+        self.__listener = self.__on_update
+
+    @property
+    def endpoint(self) -> str:
+        """To give to the endpoint argument of the ShadowSubscriber"""
+        address, port = self.server_address
+        return f"{'wss' if self.ssl_context is not None else 'ws'}://{address}:{port}"
+
+    def log(self, message: str) -> None:
+        if self.verbose:
+            print(message, file=sys.stderr)
+
+
+
+    ######################################
+    # LIFECYCLE
+    ######################################
+
+    def start(self) -> "StubShadowBroker":
+        """Serve in a background thread, with its own event loop"""
+        self.__loop = asyncio.new_event_loop()
+        started = threading.Event()
+        self.__thread = threading.Thread(target=self.__run, args=(started,), daemon=True)
+        self.__thread.start()
+        started.wait()
+
+        if self.__error is not None:
+            self.__thread.join()
+            raise self.__error
+        self.store.add_listener(self.__listener)
+        return self
+
+    def __run(self, started: threading.Event) -> None:
+        asyncio.set_event_loop(self.__loop)
+        try:
+            self.__server = self.__loop.run_until_complete(asyncio.start_server(self.__handle, *self.address, ssl=self.ssl_context))
+            self.server_address = self.__server.sockets[0].getsockname()[:2]
+        except OSError as o_err:
+            self.__error = o_err
+            self.__loop.close()
+            started.set()
+            return
+
+        started.set()
+        self.__loop.run_forever()
+
+        self.__server.close()
+        for connection in self.connections:
+            connection.writer.close()
+        tasks = asyncio.all_tasks(self.__loop)
+        for task in tasks:
+            task.cancel()
+        self.__loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        self.__loop.close()
+
+    def stop(self) -> None:
+        self.store.remove_listener(self.__listener)
+        self.__loop.call_soon_threadsafe(self.__loop.stop)
+        self.__thread.join()
+
+    def __enter__(self) -> "StubShadowBroker":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+
+
+    ######################################
+    # WEBSOCKET
+    ######################################
+
+    async def __handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        connection = None
+        try:
+            request_line, _, raw_headers = (await reader.readuntil(b"\r\n\r\n")).partition(b"\r\n")
+            method, target, _ = request_line.decode("latin-1").split(" ", 2)
+            headers = http.client.parse_headers(io.BytesIO(raw_headers))
+            path, _, query = target.partition("?")
+
+            if path != MQTT_PATH or (headers.get("Upgrade") or "").lower() != "websocket" or not headers.get("Sec-WebSocket-Key"):
+                return self.__refuse(writer, "400 Bad Request", "Not a WebSocket upgrade to /mqtt")
+            if self.verifier is not None:
+                try:
+                    self.verifier.verify(method, path, query, headers, b"")
+                except ValueError as v_err:
+                    return self.__refuse(writer, "403 Forbidden", str(v_err))
+
+            writer.write((
+                "HTTP/1.1 101 Switching Protocols\r\n"
+                "Upgrade: websocket\r\n"
+                "Connection: Upgrade\r\n"
+                f"Sec-WebSocket-Accept: {get_websocket_accept(headers['Sec-WebSocket-Key'])}\r\n"
+                "Sec-WebSocket-Protocol: mqtt\r\n"
+                "\r\n"
+            ).encode("utf-8"))
+
+            connection = BrokerConnection(writer)
+            self.connections.add(connection)
+            parser = PacketParser()
+            while True:
+                message = await read_message(reader, writer, mask=False)
+                if message is None:
+                    return
+                for packet in parser.feed(message):
+                    if not self.__dispatch(connection, *packet):
+                        return
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError) as error:
+            self.log(f"Connection lost : {error!r}")
+        finally:
+            self.connections.discard(connection)
+            writer.close()
+
+    def __refuse(self, writer: asyncio.StreamWriter, status: str, message: str) -> None:
+        self.log(f"WebSocket upgrade refused : {message}")
+        content = json.dumps({ "message": message }).encode("utf-8")
+        writer.write(f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\nContent-Length: {len(content)}\r\n\r\n".encode("utf-8") + content)
+
+
+
+    ######################################
+    # MQTT
+    ######################################
+
+    def __dispatch(self, connection: BrokerConnection, packet_type: int, flags: int, body: bytes) -> bool:
+        """Handle a packet of a client. False once it disconnected"""
+        if packet_type == PacketType.CONNECT:
+            # Session not present, connection accepted
+            connection.send(encode_packet(PacketType.CONNACK, 0, bytes([0, 0])))
+
+        elif packet_type == PacketType.SUBSCRIBE:
+            (packet_id,) = struct.unpack_from("!H", body)
+            offset, granted = 2, []
+            while offset < len(body):
+                (length,) = struct.unpack_from("!H", body, offset)
+                topic_filter = body[offset + 2:offset + 2 + length].decode("utf-8")
+                # Like AWS IoT, QoS 2 is not supported
+                qos = min(body[offset + 2 + length], 1)
+                connection.subscriptions[topic_filter] = qos
+                granted.append(qos)
+                offset += 3 + length
+            connection.send(encode_packet(PacketType.SUBACK, 0, struct.pack("!H", packet_id) + bytes(granted)))
+
+        elif packet_type == PacketType.PUBLISH:
+            topic, packet_id, payload = decode_publish(flags, body)
+            if packet_id is not None:
+                connection.send(encode_packet(PacketType.PUBACK, 0, struct.pack("!H", packet_id)))
+            self.__handle_publish(topic, payload)
+
+        elif packet_type == PacketType.PINGREQ:
+            connection.send(encode_packet(PacketType.PINGRESP, 0))
+
+        elif packet_type == PacketType.DISCONNECT:
+            return False
+
+        return True
+
+    def __handle_publish(self, topic: str, payload: bytes) -> None:
+        shadow_topic = parse_shadow_topic(topic)
+        if shadow_topic is None or shadow_topic[2] not in ("get", "update", "delete"):
+            return self.__publish(topic, payload)
+
+        thing_name, shadow_name, operation = shadow_topic
+        if operation == "get":
+            status_code, document = self.store.get(thing_name, shadow_name)
+        elif operation == "update":
+            status_code, document = self.store.update(thing_name, payload, shadow_name)
+            if status_code == 200:
+                # Published by the listener of the store
+                return
+        else:
+            status_code, document = self.store.delete(thing_name, shadow_name)
+
+        result = "accepted" if status_code == 200 else "rejected"
+        self.__publish(get_shadow_topic(thing_name, shadow_name, f"{operation}/{result}"), json.dumps(document).encode("utf-8"))
+
+    def __on_update(self, thing_name: str, shadow_name: str | None, document: dict, response: dict) -> None:
+        """Listener of the store, called by the thread which updated it"""
+        if self.__loop is not None and not self.__loop.is_closed():
+            self.__loop.call_soon_threadsafe(self.__publish_update, thing_name, shadow_name, document, response)
+
+    def __publish_update(self, thing_name: str, shadow_name: str | None, document: dict, response: dict) -> None:
+        self.__publish(get_shadow_topic(thing_name, shadow_name, "update/accepted"), json.dumps(response).encode("utf-8"))
+
+        if "desired" not in document["state"]:
+            return
+        status_code, shadow = self.store.get(thing_name, shadow_name)
+        if status_code == 200 and "delta" in shadow["state"]:
+            delta = {
+                "state": shadow["state"]["delta"],
+                "metadata": { key: value for key, value in shadow["metadata"].get("desired", {}).items() if key in shadow["state"]["delta"] },
+                "version": shadow["version"],
+                "timestamp": shadow["timestamp"]
+            }
+            self.__publish(get_shadow_topic(thing_name, shadow_name, "update/delta"), json.dumps(delta).encode("utf-8"))
+
+    def publish(self, topic: str, payload: bytes) -> None:
+        """Deliver a message to the subscribers of its topic, from any thread"""
+        self.__loop.call_soon_threadsafe(self.__publish, topic, payload)
+
+    def __publish(self, topic: str, payload: bytes) -> None:
+        self.log(f"PUBLISH {topic}")
+        for connection in list(self.connections):
+            connection.publish(topic, payload)
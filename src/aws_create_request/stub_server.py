@@ -0,0 +1,576 @@
+#!/usr/bin/env python3
+
+import re
+import ssl
+import sys
+import copy
+import base64
+import hmac
+import json
+import time
+import random
+import hashlib
+import secrets
+import argparse
+import datetime
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable
+from urllib.parse import parse_qsl, unquote
+
+from aws_create_request.constants import SERVICE
+from aws_create_request.delta import merge_state
+from aws_create_request.presign import encode_query_string
+from aws_create_request.ratelimit import TokenBucket
+from aws_create_request.string_to_sign import derive_signing_key
+
+
+# Largest state document accepted by the service
+MAX_PAYLOAD_SIZE = 8 * 1024
+# Largest difference between the X-Amz-Date of a request and the clock of the server
+MAX_CLOCK_SKEW = 15 * 60
+# Page sizes accepted by ListNamedShadowsForThing
+MAX_PAGE_SIZE = 100
+DEFAULT_PAGE_SIZE = 25
+
+SHADOW_PATH = re.compile(r"^/things/([^/]+)/shadow$")
+LIST_NAMED_SHADOWS_PATH = re.compile(r"^/api/things/shadow/ListNamedShadowsForThing/([^/]+)$")
+# Temporary credentials, served like the container credentials endpoint
+CREDENTIALS_PATH = "/credentials"
+# The parts of an Authorization header are separated by spaces, commas, or both
+AUTHORIZATION_SEPARATOR = re.compile(r"[,\s]+")
+
+
+def compute_shadow_delta(desired: dict, reported: dict) -> dict:
+    """Desired values which are not reported yet, like the 'delta' section of a shadow"""
+    delta = {}
+
+    for key, value in desired.items():
+        if isinstance(value, dict) and isinstance(reported.get(key), dict):
+            nested_delta = compute_shadow_delta(value, reported[key])
+            if nested_delta:
+                delta[key] = nested_delta
+        elif key not in reported or value != reported[key] or type(value) is not type(reported[key]):
+            delta[key] = value
+
+    return delta
+
+
+def get_metadata(patch: dict, timestamp: int) -> dict:
+    """Metadata of the values of a patch : the timestamp of each updated leaf, null for the removed keys"""
+    return {
+        key: None if value is None else get_metadata(value, timestamp) if isinstance(value, dict) else { "timestamp": timestamp }
+        for key, value in patch.items()
+    }
+
+
+
+######################################
+# SIGNATURE VERIFICATION
+######################################
+
+class SigV4Verifier:
+    """
+        Check the SigV4 signature of a request, in its Authorization header or in its query string.
+        credentials maps the access key ids to their secret access key.
+        The temporary credentials it issued are only accepted with their session token, until they expire.
+        signed_security_token is False for the presigned URLs of /mqtt, whose session token is not signed.
+    """
+
+    def __init__(self, credentials: dict[str, str], service: str = SERVICE, max_clock_skew: int = MAX_CLOCK_SKEW, signed_security_token: bool = True) -> None:
+        self.credentials: dict[str, str] = credentials
+        self.service: str = service
+        self.max_clock_skew: int = max_clock_skew
+        self.signed_security_token: bool = signed_security_token
+        # Access key id -> (session token, expiration)
+        self.session_tokens: dict[str, tuple[str, datetime.datetime]] = {}
+
+    def issue_temporary_credentials(self, duration: int, now: datetime.datetime | None = None) -> dict:
+        if now is None:
+            now = datetime.datetime.now(tz=datetime.timezone.utc)
+
+        access_key_id = f"ASIA{secrets.token_hex(8).upper()}"
+        expiration = now + datetime.timedelta(seconds=duration)
+        self.credentials[access_key_id] = secrets.token_urlsafe(30)
+        self.session_tokens[access_key_id] = (secrets.token_urlsafe(48), expiration)
+
+        return {
+            "AccessKeyId": access_key_id,
+            "SecretAccessKey": self.credentials[access_key_id],
+            "Token": self.session_tokens[access_key_id][0],
+            "Expiration": expiration.strftime("%Y-%m-%dT%H:%M:%SZ")
+        }
+
+    def verify(self, method: str, path: str, query: str, headers, body: bytes, now: datetime.datetime | None = None) -> None:
+        """headers is a case-insensitive mapping (get_all). Raise a ValueError when the request is not signed correctly"""
+        if now is None:
+            now = datetime.datetime.now(tz=datetime.timezone.utc)
+
+        query_parameters = parse_qsl(query, keep_blank_values=True)
+        authorization = headers.get("Authorization")
+        security_token = headers.get("X-Amz-Security-Token")
+
+        if authorization is not None:
+            algorithm, _, parts = authorization.strip().partition(" ")
+            fields = dict(part.split("=", 1) for part in AUTHORIZATION_SEPARATOR.split(parts) if "=" in part)
+            request_date_time = headers.get("X-Amz-Date", "")
+            expires = None
+        elif any(key == "X-Amz-Signature" for key, _ in query_parameters):
+            presigned = dict(query_parameters)
+            algorithm = presigned.get("X-Amz-Algorithm", "")
+            fields = {
+                "Credential": presigned.get("X-Amz-Credential", ""),
+                "SignedHeaders": presigned.get("X-Amz-SignedHeaders", ""),
+                "Signature": presigned["X-Amz-Signature"]
+            }
+            request_date_time = presigned.get("X-Amz-Date", "")
+            expires = presigned.get("X-Amz-Expires", "")
+            security_token = presigned.get("X-Amz-Security-Token")
+            unsigned = ("X-Amz-Signature",) if self.signed_security_token else ("X-Amz-Signature", "X-Amz-Security-Token")
+            query_parameters = [(key, value) for key, value in query_parameters if key not in unsigned]
+        else:
+            raise ValueError("Missing Authentication Token")
+
+        if algorithm != "AWS4-HMAC-SHA256":
+            raise ValueError(f"Unsupported algorithm '{algorithm}'")
+        if not all(fields.get(name) for name in ("Credential", "SignedHeaders", "Signature")):
+            raise ValueError("Authorization should contain Credential, SignedHeaders and Signature")
+
+        scope = fields["Credential"].split("/")
+        if len(scope) != 5 or scope[4] != "aws4_request":
+            raise ValueError(f"Malformed credential scope '{fields['Credential']}'")
+        access_key_id, date, region, service, _ = scope
+        if access_key_id not in self.credentials:
+            raise ValueError("The security token included in the request is invalid")
+        if service != self.service:
+            raise ValueError(f"Credential should be scoped to correct service: '{self.service}'")
+        if access_key_id in self.session_tokens:
+            session_token, expiration = self.session_tokens[access_key_id]
+            if security_token is None or not hmac.compare_digest(security_token.encode("utf-8"), session_token.encode("utf-8")):
+                raise ValueError("The security token included in the request is invalid")
+            if now >= expiration:
+                raise ValueError("The security token included in the request is expired")
+
+        try:
+            signed_at = datetime.datetime.strptime(request_date_time, "%Y%m%dT%H%M%SZ").replace(tzinfo=datetime.timezone.utc)
+        except ValueError:
+            raise ValueError(f"Malformed X-Amz-Date '{request_date_time}'") from None
+        if not request_date_time.startswith(date):
+            raise ValueError("Date in Credential scope does not match X-Amz-Date")
+        if expires is None:
+            if abs((now - signed_at).total_seconds()) > self.max_clock_skew:
+                raise ValueError("Signature expired: X-Amz-Date is too far from the server time")
+        elif not expires.isdigit() or not -self.max_clock_skew <= (now - signed_at).total_seconds() <= int(expires):
+            raise ValueError("Signature expired")
+
+        signed_headers = fields["SignedHeaders"].split(";")
+        if "host" not in signed_headers and ":authority" not in signed_headers:
+            raise ValueError("The host header must be signed")
+        if expires is None and security_token is not None and "x-amz-security-token" not in signed_headers:
+            raise ValueError("The x-amz-security-token header must be signed")
+        canonical_headers = []
+        for name in signed_headers:
+            values = headers.get_all(name) or []
+            if name == ":authority" and not values:
+                # Signed for HTTP/2, received in the host header of HTTP/1.1
+                values = headers.get_all("host") or []
+            canonical_headers.append(f"{name}:{','.join(' '.join(value.split()) for value in values)}")
+
+        canonical_request = "\n".join([
+            method,
+            path,
+            encode_query_string(dict(query_parameters)),
+            *canonical_headers,
+            "",
+            fields["SignedHeaders"],
+            hashlib.sha256(body).hexdigest()
+        ])
+        string_to_sign = "\n".join([
+            algorithm,
+            request_date_time,
+            f"{date}/{region}/{service}/aws4_request",
+            hashlib.sha256(canonical_request.encode("utf-8")).hexdigest()
+        ])
+        signing_key = derive_signing_key(self.credentials[access_key_id], date, region, service)
+        expected = hmac.new(signing_key, string_to_sign.encode("utf-8"), hashlib.sha256).hexdigest()
+
+        if not hmac.compare_digest(expected.encode("utf-8"), fields["Signature"].encode("utf-8")):
+            raise ValueError("The request signature we calculated does not match the signature you provided")
+
+
+
+######################################
+# SHADOWS
+######################################
+
+class ShadowStore:
+    """
+        In-memory shadows with the semantics of the service : versions, merge of the desired
+        and reported states (null deletes), delta and metadata.
+        Each operation returns (status code, response document).
+        The listeners are called after each accepted update, with (thing name, shadow name, update document, response).
+    """
+
+    def __init__(self, max_payload_size: int = MAX_PAYLOAD_SIZE) -> None:
+        self.max_payload_size: int = max_payload_size
+
+        self.__shadows: dict[tuple[str, str | None], dict] = {}
+        # A deleted shadow keeps counting its versions
+        self.__versions: dict[tuple[str, str | None], int] = {}
+        self.__listeners: list[Callable[[str, str | None, dict, dict], None]] = []
+        self.__lock = threading.Lock()
+
+    def add_listener(self, listener: Callable[[str, str | None, dict, dict], None]) -> None:
+        with self.__lock:
+            self.__listeners = [*self.__listeners, listener]
+
+    def remove_listener(self, listener: Callable[[str, str | None, dict, dict], None]) -> None:
+        with self.__lock:
+            self.__listeners = [registered for registered in self.__listeners if registered is not listener]
+
+    def __not_found(self, thing_name: str, shadow_name: str | None) -> tuple[int, dict]:
+        return 404, { "code": 404, "message": f"No shadow exists with name: '{thing_name}{f'~{shadow_name}' if shadow_name else ''}'" }
+
+    def get(self, thing_name: str, shadow_name: str | None = None) -> tuple[int, dict]:
+        with self.__lock:
+            shadow = self.__shadows.get((thing_name, shadow_name))
+            if shadow is None:
+                return self.__not_found(thing_name, shadow_name)
+
+            state = { section: section_state for section, section_state in shadow["state"].items() if section_state }
+            delta = compute_shadow_delta(state.get("desired", {}), state.get("reported", {}))
+            if delta:
+                state["delta"] = delta
+
+            return 200, {
+                "state": copy.deepcopy(state),
+                "metadata": copy.deepcopy(shadow["metadata"]),
+                "version": shadow["version"],
+                "timestamp": int(time.time())
+            }
+
+    def update(self, thing_name: str, body: bytes, shadow_name: str | None = None) -> tuple[int, dict]:
+        if len(body) > self.max_payload_size:
+            return 413, { "code": 413, "message": "The payload exceeds the maximum size allowed" }
+        try:
+            document = json.loads(body)
+        except ValueError:
+            return 400, { "code": 400, "message": "Payload contains invalid json" }
+        if not isinstance(document, dict) or not isinstance(document.get("state"), dict):
+            return 400, { "code": 400, "message": "Missing required node: state" }
+
+        patch = document["state"]
+        for section, section_state in patch.items():
+            if section not in ("desired", "reported"):
+                return 400, { "code": 400, "message": f"State contains an invalid node: '{section}'" }
+            if section_state is not None and not isinstance(section_state, dict):
+                return 400, { "code": 400, "message": f"Invalid {section} state: expected an object or null" }
+
+        key = (thing_name, shadow_name)
+        with self.__lock:
+            shadow = self.__shadows.get(key)
+            version = shadow["version"] if shadow is not None else self.__versions.get(key, 0)
+
+            if "version" in document and document["version"] != version:
+                return 409, { "code": 409, "message": "Version conflict" }
+
+            if shadow is None:
+                shadow = { "state": {}, "metadata": {} }
+            timestamp = int(time.time())
+
+            shadow = {
+                "state": merge_state(shadow["state"], patch),
+                "metadata": merge_state(shadow["metadata"], get_metadata(patch, timestamp)),
+                "version": version + 1
+            }
+            self.__shadows[key] = shadow
+            self.__versions[key] = shadow["version"]
+
+            response = {
+                "state": patch,
+                "metadata": { section: section_metadata for section, section_metadata in get_metadata(patch, timestamp).items() if section_metadata is not None },
+                "version": shadow["version"],
+                "timestamp": timestamp
+            }
+            if "clientToken" in document:
+                response["clientToken"] = document["clientToken"]
+            listeners = self.__listeners
+
+        for listener in listeners:
+            listener(thing_name, shadow_name, document, response)
+        return 200, response
+
+    def delete(self, thing_name: str, shadow_name: str | None = None) -> tuple[int, dict]:
+        with self.__lock:
+            shadow = self.__shadows.pop((thing_name, shadow_name), None)
+            if shadow is None:
+                return self.__not_found(thing_name, shadow_name)
+            return 200, { "version": shadow["version"], "timestamp": int(time.time()) }
+
+    def list_named_shadows(self, thing_name: str, next_token: str | None = None, page_size: int = DEFAULT_PAGE_SIZE) -> tuple[int, dict]:
+        """One page of the named shadows of a thing, sorted by name. nextToken is the last name of the page"""
+        if not 1 <= page_size <= MAX_PAGE_SIZE:
+            return 400, { "code": 400, "message": f"pageSize must be between 1 and {MAX_PAGE_SIZE}" }
+        after = ""
+        if next_token:
+            try:
+                after = base64.urlsafe_b64decode(next_token.encode("ascii")).decode("utf-8")
+            except ValueError:
+                return 400, { "code": 400, "message": "Invalid nextToken" }
+
+        with self.__lock:
+            names = sorted(shadow_name for thing, shadow_name in self.__shadows if thing == thing_name and shadow_name is not None and shadow_name > after)
+
+        response = { "results": names[:page_size], "timestamp": int(time.time()) }
+        if len(names) > page_size:
+            response["nextToken"] = base64.urlsafe_b64encode(names[page_size - 1].encode("utf-8")).decode("ascii")
+        return 200, response
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__shadows.clear()
+            self.__versions.clear()
+
+
+
+######################################
+# SERVER
+######################################
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+
+    # Keep the connections alive like the service
+    protocol_version = "HTTP/1.1"
+    server: "StubShadowServer"
+
+    def log_message(self, format: str, *args) -> None:
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def __send_json(self, status_code: int, document: dict, headers: dict[str, str] | None = None) -> None:
+        content = json.dumps(document, separators=(",", ":")).encode("utf-8")
+        # Counted before the client can read the response
+        self.server.count(status_code)
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def __handle(self) -> None:
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        path, _, query = self.path.partition("?")
+
+        if self.server.latency > 0 or self.server.latency_jitter > 0:
+            time.sleep(self.server.latency + self.server.random.uniform(0, self.server.latency_jitter))
+
+        if self.server.throttle is not None and not self.server.throttle.try_acquire():
+            return self.__send_json(429, { "code": 429, "message": "Rate exceeded" }, { "x-amzn-ErrorType": "ThrottlingException" })
+
+        if path == CREDENTIALS_PATH and self.server.credentials_duration is not None and self.command == "GET":
+            return self.__send_json(200, self.server.verifier.issue_temporary_credentials(self.server.credentials_duration))
+
+        # Like on 8443, a thing which presented a valid certificate does not sign its requests
+        if self.server.verifier is not None and not self.__has_client_certificate():
+            try:
+                self.server.verifier.verify(self.command, path, query, self.headers, body)
+            except ValueError as v_err:
+                return self.__send_json(403, { "message": str(v_err) }, { "x-amzn-ErrorType": "ForbiddenException" })
+
+        if self.server.error_rate > 0 and self.server.random.random() < self.server.error_rate:
+            return self.__send_json(500, { "code": 500, "message": "Internal service failure" }, { "x-amzn-ErrorType": "InternalFailureException" })
+
+        match = LIST_NAMED_SHADOWS_PATH.match(path)
+        if match is not None and self.command == "GET":
+            parameters = dict(parse_qsl(query))
+            page_size = parameters.get("pageSize", str(DEFAULT_PAGE_SIZE))
+            if not page_size.isdigit():
+                return self.__send_json(400, { "code": 400, "message": "pageSize must be a number" })
+            return self.__send_json(*self.server.store.list_named_shadows(unquote(match.group(1)), parameters.get("nextToken"), int(page_size)))
+
+        match = SHADOW_PATH.match(path)
+        if match is None:
+            return self.__send_json(404, { "message": "Not Found" })
+        thing_name = unquote(match.group(1))
+        shadow_name = dict(parse_qsl(query)).get("name") or None
+
+        if self.command == "GET":
+            status_code, document = self.server.store.get(thing_name, shadow_name)
+        elif self.command == "POST":
+            status_code, document = self.server.store.update(thing_name, body, shadow_name)
+        else:
+            status_code, document = self.server.store.delete(thing_name, shadow_name)
+        self.__send_json(status_code, document)
+
+    def __has_client_certificate(self) -> bool:
+        return isinstance(self.connection, ssl.SSLSocket) and bool(self.connection.getpeercert())
+
+    def do_GET(self) -> None:
+        self.__handle()
+
+    def do_POST(self) -> None:
+        self.__handle()
+
+    def do_DELETE(self) -> None:
+        self.__handle()
+
+
+class StubShadowServer(ThreadingHTTPServer):
+    """
+        Local stand-in of the IoT data plane, to develop and test without an AWS account.
+        Requests signed with unknown credentials are rejected (403), unless credentials is None.
+        latency (+ a random latency_jitter) delays every response, error_rate is the probability
+        of an injected 500 and rate_limit the number of requests per second before a 429.
+        With credentials_duration, GET /credentials issues temporary credentials valid for that many seconds.
+        An ssl_context which verifies the client certificates (CERT_OPTIONAL) accepts the unsigned
+        requests of the things presenting one.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int] = ("127.0.0.1", 0), credentials: dict[str, str] | None = None, latency: float = 0.0, latency_jitter: float = 0.0, error_rate: float = 0.0, rate_limit: float | None = None, ssl_context: ssl.SSLContext | None = None, seed: int | None = None, verbose: bool = False, credentials_duration: int | None = None) -> None:
+        if credentials_duration is not None and credentials is None:
+            raise ValueError("Temporary credentials are only issued by a server which checks the signatures")
+        super().__init__(address, StubRequestHandler)
+
+        self.store: ShadowStore = ShadowStore()
+        self.verifier: SigV4Verifier | None = SigV4Verifier(credentials) if credentials is not None else None
+        self.latency: float = latency
+        self.latency_jitter: float = latency_jitter
+        self.error_rate: float = error_rate
+        self.throttle: TokenBucket | None = TokenBucket(rate_limit) if rate_limit else None
+        self.random: random.Random = random.Random(seed)
+        self.verbose: bool = verbose
+        self.credentials_duration: int | None = credentials_duration
+        self.use_tls: bool = ssl_context is not None
+
+        if ssl_context is not None:
+            self.socket = ssl_context.wrap_socket(self.socket, server_side=True)
+
+        self.status_codes: dict[int, int] = {}
+        self.__lock = threading.Lock()
+        self.__thread: threading.Thread | None = None
+
+    @property
+    def endpoint(self) -> str:
+        """To give to the -e/--endpoint option or the endpoint argument of the clients"""
+        address, port = self.server_address[:2]
+        return f"{'https' if self.use_tls else 'http'}://{address}:{port}"
+
+    def count(self, status_code: int) -> None:
+        with self.__lock:
+            self.status_codes[status_code] = self.status_codes.get(status_code, 0) + 1
+
+    def start(self) -> "StubShadowServer":
+        """Serve in a background thread"""
+        self.__thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.__thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+        if self.__thread is not None:
+            self.__thread.join()
+
+    def __enter__(self) -> "StubShadowServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+
+
+######################################
+# COMMAND LINE
+######################################
+
+def _init_argparse() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        "ShadowHttpApiStub",
+        description="Local stand-in of the IoT data plane shadow API, checking the SigV4 signatures",
+        add_help=True
+    )
+
+    parser.add_argument("--host", default="127.0.0.1", dest="host", help="Address to listen on. Default to 127.0.0.1")
+    parser.add_argument("-p", "--port", default=8080, type=int, dest="port", help="Port to listen on. Default to 8080")
+
+    parser.add_argument("-a", "--access-key-id", dest="aws_access_key_id", help="Access key id accepted by the server", required=True)
+    parser.add_argument("-k", "--secret-access-key", dest="aws_secret_access_key", help="Its secret access key", required=True)
+
+    parser.add_argument("--latency", default=0.0, type=float, dest="latency", help="Seconds added to every response. Default to 0")
+    parser.add_argument("--latency-jitter", default=0.0, type=float, dest="latency_jitter", help="Random seconds added to the latency. Default to 0")
+    parser.add_argument("--error-rate", default=0.0, type=float, dest="error_rate", help="Probability of an injected 500. Default to 0")
+    parser.add_argument("--rate-limit", type=float, dest="rate_limit", help="Requests per second before the server throttles (429)")
+
+    parser.add_argument("--mqtt-port", type=int, dest="mqtt_port", help="Also serve the shadow topics over MQTT over WebSocket on this port, sharing the shadows")
+    parser.add_argument("--credentials-duration", type=int, dest="credentials_duration", help="Serve temporary credentials on GET /credentials, valid for this many seconds")
+
+    parser.add_argument("--certfile", dest="certfile", help="Certificate to serve HTTPS")
+    parser.add_argument("--keyfile", dest="keyfile", help="Private key of the certificate")
+    parser.add_argument("--client-cafile", dest="client_cafile", help="CA certificates of the things : their requests authenticated with a client certificate are not signed")
+    parser.add_argument("-v", "--verbose", action="store_true", dest="verbose", help="Log every request")
+
+    return parser
+
+
+def main() -> None:
+    args = _init_argparse().parse_args()
+
+    ssl_context = None
+    if args.certfile is not None:
+        ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        ssl_context.load_cert_chain(args.certfile, args.keyfile)
+        if args.client_cafile is not None:
+            ssl_context.load_verify_locations(args.client_cafile)
+            ssl_context.verify_mode = ssl.CERT_OPTIONAL
+
+    try:
+        server = StubShadowServer(
+            address=(args.host, args.port),
+            credentials={ args.aws_access_key_id: args.aws_secret_access_key },
+            latency=args.latency,
+            latency_jitter=args.latency_jitter,
+            error_rate=args.error_rate,
+            rate_limit=args.rate_limit,
+            ssl_context=ssl_context,
+            verbose=args.verbose,
+            credentials_duration=args.credentials_duration
+        )
+    except Exception as e:
+        sys.exit(e)
+
+    broker = None
+    if args.mqtt_port is not None:
+        # Only needed with --mqtt-port
+        from aws_create_request.stub_broker import StubShadowBroker
+
+        try:
+            broker = StubShadowBroker(
+                address=(args.host, args.mqtt_port),
+                credentials=server.verifier.credentials,
+                store=server.store,
+                ssl_context=ssl_context,
+                verbose=args.verbose
+            ).start()
+        except Exception as e:
+            server.server_close()
+            sys.exit(e)
+        print(f"Serving the shadow topics on {broker.endpoint}", file=sys.stderr)
+
+    print(f"Serving the shadow API on {server.endpoint}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if broker is not None:
+            broker.stop()
+
+
+if __name__.__eq__("__main__"):
+    main()
@@ -0,0 +1,690 @@
+
+import ssl
+import json
+import time
+import select
+import socket
+import selectors
+import threading
+import http.client
+
+from collections import deque
+from urllib.parse import urlsplit
+
+from aws_create_request.constants import RESENDABLE_METHODS
+from aws_create_request.metrics import LatencyMetrics, PhaseTimer, get_region_from_host, latency_metrics
+
+
+# Port of the shadow REST API for the things authenticated with their X.509 certificate
+MTLS_PORT = 8443
+# ALPN protocol to send a client certificate on 443 instead
+MTLS_ALPN_PROTOCOL = "x-amzn-http-ca"
+
+
+class TransportResponse:
+    """Response of a shadow request, whatever the transport used to send it"""
+
+    def __init__(self, status_code: int, headers: dict[str, str], content: bytes) -> None:
+        self.status_code: int = status_code
+        self.headers: dict[str, str] = headers
+        self.content: bytes = content
+
+    @property
+    def text(self) -> str:
+        return self.content.decode("utf-8")
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class Transport:
+    """
+        Send a signed request to a host.
+        host is the signed 'host' header, path contains the query string.
+    """
+
+    # The transport authenticates the requests itself (client certificate) : they are sent without SigV4
+    authenticates: bool = False
+    # Name of the signed header carrying the host : ':authority' over HTTP/2
+    host_header: str = "host"
+    # Where the phases of the requests are recorded, signature and decoding included
+    metrics: LatencyMetrics = latency_metrics
+
+    def request(self, method: str, host: str, path: str, headers: dict[str, str], body: bytes | memoryview = b"") -> TransportResponse:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+def parse_endpoint(endpoint: str | None) -> tuple[bool, str | None, int | None]:
+    """
+        Split an endpoint override like 'http://127.0.0.1:8080' in (use_tls, address, port).
+        Without override, connect to the signed host with TLS on 443.
+    """
+    if endpoint is None:
+        return True, None, None
+
+    parts = urlsplit(endpoint)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise ValueError(f"'{endpoint}' is not an endpoint. It should look like https://<host>[:<port>]")
+
+    use_tls = parts.scheme == "https"
+    return use_tls, parts.hostname, parts.port or (443 if use_tls else 80)
+
+
+
+######################################
+# HTTP.CLIENT TRANSPORT
+######################################
+
+class PooledConnection(http.client.HTTPConnection):
+    """
+        HTTP/1.1 connection wrapped in TLS when an ssl context is given.
+        The DNS resolution, the TCP connection and the TLS handshake are timed separately,
+        labelled with the method of the request which opened the connection.
+    """
+
+    def __init__(self, address: str, port: int, timeout: float, ssl_context: ssl.SSLContext | None, server_hostname: str, metrics: LatencyMetrics | None = None, tls_session: ssl.SSLSession | None = None) -> None:
+        super().__init__(address, port, timeout=timeout)
+        self.ssl_context: ssl.SSLContext | None = ssl_context
+        self.server_hostname: str = server_hostname
+        self.tls_session: ssl.SSLSession | None = tls_session
+        self.metrics: LatencyMetrics = metrics if metrics is not None else latency_metrics
+        self.method: str = ""
+        self.released_at: float = 0.0
+
+    def connect(self) -> None:
+        timer = PhaseTimer(self.metrics, self.method, get_region_from_host(self.server_hostname))
+
+        addresses = socket.getaddrinfo(self.host, self.port, 0, socket.SOCK_STREAM)
+        timer.lap("dns")
+
+        self.sock = self.__connect_to_any(addresses)
+        timer.lap("tcp_connect")
+
+        if self.ssl_context is not None:
+            # Resumed with the session of a previous connection : no full handshake
+            self.sock = self.ssl_context.wrap_socket(self.sock, server_hostname=self.server_hostname, session=self.tls_session)
+            timer.lap("tls_handshake")
+
+    def __connect_to_any(self, addresses: list[tuple]) -> socket.socket:
+        """Same as socket.create_connection, on addresses already resolved"""
+        error: OSError | None = None
+        for family, socket_type, protocol, _, address in addresses:
+            sock = socket.socket(family, socket_type, protocol)
+            try:
+                sock.settimeout(self.timeout)
+                sock.connect(address)
+            except OSError as o_err:
+                sock.close()
+                error = o_err
+                continue
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            return sock
+
+        raise error if error is not None else OSError(f"getaddrinfo returned no address for {self.host}")
+
+    def is_healthy(self, idle_timeout: float) -> bool:
+        if self.sock is None:
+            return False
+        if time.monotonic() - self.released_at > idle_timeout:
+            return False
+        # An idle connection must have nothing to read : readable means closed by the peer
+        try:
+            readable, _, _ = select.select([self.sock], [], [], 0)
+        except (OSError, ValueError):
+            return False
+        return len(readable) == 0
+
+
+class ConnectionPool:
+    """
+        Persistent connections to one host, at most pool_size at the same time.
+        The new connections resume the TLS session of the last released one.
+    """
+
+    def __init__(self, address: str, port: int, ssl_context: ssl.SSLContext | None, server_hostname: str, pool_size: int, idle_timeout: float, timeout: float, metrics: LatencyMetrics | None = None) -> None:
+        self.address: str = address
+        self.port: int = port
+        self.ssl_context: ssl.SSLContext | None = ssl_context
+        self.server_hostname: str = server_hostname
+        self.idle_timeout: float = idle_timeout
+        self.timeout: float = timeout
+        self.metrics: LatencyMetrics | None = metrics
+
+        self.created: int = 0
+        self.reused: int = 0
+        self.resumed: int = 0
+        self.tls_session: ssl.SSLSession | None = None
+
+        self.__idle: deque[PooledConnection] = deque()
+        self.__slots = threading.BoundedSemaphore(pool_size)
+        self.__lock = threading.Lock()
+
+    def acquire(self) -> tuple[PooledConnection, bool]:
+        """Return a connection and whether it was reused"""
+        self.__slots.acquire()
+        with self.__lock:
+            while self.__idle:
+                # Most recently used first : it is the most likely to be still open
+                connection = self.__idle.pop()
+                if connection.is_healthy(self.idle_timeout):
+                    self.reused += 1
+                    return connection, True
+                connection.close()
+            self.created += 1
+
+            tls_session = self.tls_session
+
+        return PooledConnection(self.address, self.port, self.timeout, self.ssl_context, self.server_hostname, self.metrics, tls_session), False
+
+    def connected(self, connection: PooledConnection) -> None:
+        if getattr(connection.sock, "session_reused", False):
+            with self.__lock:
+                self.resumed += 1
+
+    def release(self, connection: PooledConnection, reusable: bool = True) -> None:
+        # With TLS 1.3, the session tickets arrive after the handshake : keep the session once a response was read
+        tls_session = getattr(connection.sock, "session", None)
+        if tls_session is not None:
+            with self.__lock:
+                self.tls_session = tls_session
+
+        if reusable:
+            connection.released_at = time.monotonic()
+            with self.__lock:
+                self.__idle.append(connection)
+        else:
+            connection.close()
+        self.__slots.release()
+
+    def close(self) -> None:
+        with self.__lock:
+            while self.__idle:
+                self.__idle.pop().close()
+
+
+class HTTPClientTransport(Transport):
+    """Default transport, built on http.client and ssl, with one pool of keep-alive connections per host"""
+
+    def __init__(self, pool_size: int = 10, idle_timeout: float = 60.0, timeout: float = 10.0, endpoint: str | None = None, ssl_context: ssl.SSLContext | None = None, metrics: LatencyMetrics | None = None, port: int = 443) -> None:
+        self.pool_size: int = pool_size
+        # Port of the signed host, without endpoint override
+        self.port: int = port
+        self.idle_timeout: float = idle_timeout
+        self.timeout: float = timeout
+        self.metrics: LatencyMetrics = metrics if metrics is not None else latency_metrics
+
+        self.__use_tls, self.__address, self.__port = parse_endpoint(endpoint)
+        self.__ssl_context = ssl_context
+        if self.__use_tls and self.__ssl_context is None:
+            self.__ssl_context = ssl.create_default_context()
+
+        self.__pools: dict[str, ConnectionPool] = {}
+        self.__lock = threading.Lock()
+
+    def get_pool(self, host: str) -> ConnectionPool:
+        with self.__lock:
+            pool = self.__pools.get(host)
+            if pool is None:
+                pool = ConnectionPool(
+                    address=self.__address or host,
+                    port=self.__port or self.port,
+                    ssl_context=self.__ssl_context if self.__use_tls else None,
+                    server_hostname=host,
+                    pool_size=self.pool_size,
+                    idle_timeout=self.idle_timeout,
+                    timeout=self.timeout,
+                    metrics=self.metrics
+                )
+                self.__pools[host] = pool
+            return pool
+
+    def request(self, method: str, host: str, path: str, headers: dict[str, str], body: bytes | memoryview = b"") -> TransportResponse:
+        pool = self.get_pool(host)
+        headers = { "Host": host, **headers }
+
+        while True:
+            connection, reused = pool.acquire()
+            sent = False
+            try:
+                if connection.sock is None:
+                    connection.method = method
+                    connection.connect()
+                    pool.connected(connection)
+                sent_at = time.perf_counter()
+                connection.request(method, path, body=body, headers=headers)
+                sent = True
+                response = connection.getresponse()
+                self.metrics.observe("ttfb", method, get_region_from_host(host), time.perf_counter() - sent_at)
+                content = response.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                pool.release(connection, reusable=False)
+                # The server closed a kept-alive connection : retry on a new one,
+                # unless the request was sent and resending it is not safe
+                if reused and (not sent or method in RESENDABLE_METHODS):
+                    continue
+                raise
+            except BaseException:
+                pool.release(connection, reusable=False)
+                raise
+
+            pool.release(connection, reusable=not response.will_close)
+            return TransportResponse(response.status, dict(response.getheaders()), content)
+
+    def close(self) -> None:
+        with self.__lock:
+            for pool in self.__pools.values():
+                pool.close()
+            self.__pools.clear()
+
+
+
+######################################
+# MUTUAL TLS TRANSPORT
+######################################
+
+def create_mtls_context(certfile: str, keyfile: str | None = None, cafile: str | None = None, alpn: bool = False) -> ssl.SSLContext:
+    """TLS context presenting the certificate of the thing. alpn is needed to use it on 443"""
+    ssl_context = ssl.create_default_context(cafile=cafile)
+    ssl_context.load_cert_chain(certfile, keyfile)
+    if alpn:
+        ssl_context.set_alpn_protocols([MTLS_ALPN_PROTOCOL])
+    return ssl_context
+
+
+class MutualTLSTransport(HTTPClientTransport):
+    """
+        Shadow REST API authenticated with the X.509 certificate of the thing, on port 8443 :
+        the requests are sent unsigned, so no canonical request nor string to sign is computed.
+        cafile verifies the server instead of the default CA certificates.
+    """
+
+    authenticates = True
+
+    def __init__(self, certfile: str, keyfile: str | None = None, cafile: str | None = None, port: int = MTLS_PORT, pool_size: int = 10, idle_timeout: float = 60.0, timeout: float = 10.0, endpoint: str | None = None, metrics: LatencyMetrics | None = None) -> None:
+        if not parse_endpoint(endpoint)[0]:
+            raise ValueError(f"A client certificate is only sent over TLS : '{endpoint}' should be an https endpoint")
+
+        super().__init__(
+            pool_size=pool_size,
+            idle_timeout=idle_timeout,
+            timeout=timeout,
+            endpoint=endpoint,
+            ssl_context=create_mtls_context(certfile, keyfile, cafile, alpn=port == 443),
+            metrics=metrics,
+            port=port
+        )
+
+
+
+######################################
+# HTTP/2 TRANSPORT
+######################################
+
+class RefusedStreamError(ConnectionResetError):
+    """The server did not process the stream (GOAWAY or REFUSED_STREAM) : it can be sent again on a new connection"""
+
+
+class HTTP2Stream:
+
+    __slots__ = ("method", "status_code", "headers", "data", "error", "done", "sent_at")
+
+    def __init__(self, method: str) -> None:
+        self.method: str = method
+        self.status_code: int = 0
+        self.headers: dict[str, str] = {}
+        self.data: list[bytes] = []
+        self.error: BaseException | None = None
+        self.done: threading.Event = threading.Event()
+        self.sent_at: float = time.perf_counter()
+
+
+class HTTP2Connection:
+    """
+        One HTTP/2 connection, shared by every request to its host : each request is a stream.
+        A single thread reads and writes the socket ; the requests only change the state of the
+        h2 connection under the lock, then wake it up. A request waits for a free stream when the
+        server's SETTINGS_MAX_CONCURRENT_STREAMS are in use, and for a WINDOW_UPDATE when the
+        flow control window is spent.
+    """
+
+    # Receive window of the connection : the responses of many streams arrive without waiting for a WINDOW_UPDATE
+    RECEIVE_WINDOW = 16 * 1024 * 1024
+    REFUSED_STREAM = 0x7
+
+    def __init__(self, sock: socket.socket, host: str, use_tls: bool, metrics: LatencyMetrics) -> None:
+        import h2.config
+        import h2.connection
+
+        self.sock: socket.socket = sock
+        self.host: str = host
+        self.scheme: str = "https" if use_tls else "http"
+        self.metrics: LatencyMetrics = metrics
+        # No new stream once the server sent GOAWAY or the connection failed
+        self.closed: bool = False
+
+        self.__h2 = h2.connection.H2Connection(config=h2.config.H2Configuration(client_side=True, header_encoding="utf-8"))
+        self.__condition = threading.Condition()
+        self.__streams: dict[int, HTTP2Stream] = {}
+        self.__closing: bool = False
+        self.__retiring: bool = False
+
+        self.__h2.initiate_connection()
+        self.__h2.increment_flow_control_window(self.RECEIVE_WINDOW - self.__h2.inbound_flow_control_window)
+        self.sock.setblocking(False)
+
+        self.__wakeup_receiver, self.__wakeup_sender = socket.socketpair()
+        self.__wakeup_receiver.setblocking(False)
+        self.__wakeup_sender.setblocking(False)
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+
+    def __wake_up(self) -> None:
+        try:
+            self.__wakeup_sender.send(b"\0")
+        except (BlockingIOError, OSError):
+            # Already woken up, or closed
+            pass
+
+    def __wait(self, deadline: float) -> None:
+        """Wait for the reading thread, the lock being held"""
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(f"No answer from {self.host} over HTTP/2")
+        self.__condition.wait(remaining)
+
+    def request(self, method: str, path: str, headers: dict[str, str], body: bytes | memoryview, timeout: float) -> TransportResponse:
+        deadline = time.monotonic() + timeout
+        request_headers = [(":method", method), (":scheme", self.scheme), (":authority", self.host), (":path", path)]
+        # HTTP/2 header names are lowercase, and the host is the :authority pseudo-header
+        request_headers.extend((name.lower(), value) for name, value in headers.items() if name.lower() not in ("host", "connection"))
+        body = memoryview(body)
+
+        with self.__condition:
+            while not self.closed and self.__h2.open_outbound_streams >= self.__h2.remote_settings.max_concurrent_streams:
+                self.__wait(deadline)
+            if self.closed:
+                raise RefusedStreamError(f"The HTTP/2 connection to {self.host} is closed")
+
+            stream_id = self.__h2.get_next_available_stream_id()
+            stream = HTTP2Stream(method)
+            self.__streams[stream_id] = stream
+            self.__h2.send_headers(stream_id, request_headers, end_stream=len(body) == 0)
+
+            offset = 0
+            try:
+                # Until the server resets the stream or the connection fails
+                while offset < len(body) and stream_id in self.__streams:
+                    window = min(self.__h2.local_flow_control_window(stream_id), self.__h2.max_outbound_frame_size)
+                    if window <= 0:
+                        # What is already queued has to be sent before the server opens the window again
+                        self.__wake_up()
+                        self.__wait(deadline)
+                        continue
+                    chunk = body[offset:offset + window]
+                    offset += len(chunk)
+                    self.__h2.send_data(stream_id, chunk.tobytes(), end_stream=offset == len(body))
+            except TimeoutError:
+                if self.__streams.pop(stream_id, None) is not None:
+                    self.__h2.reset_stream(stream_id)
+                self.__wake_up()
+                raise
+        self.__wake_up()
+
+        if not stream.done.wait(max(0.0, deadline - time.monotonic())):
+            with self.__condition:
+                if self.__streams.pop(stream_id, None) is not None and not self.closed:
+                    self.__h2.reset_stream(stream_id)
+            self.__wake_up()
+            raise TimeoutError(f"No answer from {self.host} over HTTP/2")
+        if stream.error is not None:
+            raise stream.error
+        return TransportResponse(stream.status_code, stream.headers, b"".join(stream.data))
+
+    def retire(self) -> None:
+        """No new stream : the connection is closed once the streams in flight are answered"""
+        with self.__condition:
+            self.__retiring = True
+            self.closed = True
+        self.__wake_up()
+
+    def close(self) -> None:
+        with self.__condition:
+            self.__closing = True
+            self.closed = True
+        self.__wake_up()
+        self.__thread.join(timeout=1.0)
+
+
+
+    ######################################
+    # READING THREAD
+    ######################################
+
+    def __run(self) -> None:
+        selector = selectors.DefaultSelector()
+        selector.register(self.sock, selectors.EVENT_READ, "socket")
+        selector.register(self.__wakeup_receiver, selectors.EVENT_READ, "wakeup")
+        outbound = b""
+        try:
+            while True:
+                with self.__condition:
+                    if self.__retiring and not self.__streams:
+                        self.__closing = True
+                    if self.__closing:
+                        self.__h2.close_connection()
+                    outbound += self.__h2.data_to_send()
+                if outbound:
+                    try:
+                        outbound = outbound[self.sock.send(outbound):]
+                    except (BlockingIOError, ssl.SSLWantWriteError, ssl.SSLWantReadError):
+                        pass
+                if self.__closing:
+                    return
+
+                selector.modify(self.sock, selectors.EVENT_READ | (selectors.EVENT_WRITE if outbound else 0), "socket")
+                for key, _ in selector.select():
+                    if key.data == "wakeup":
+                        self.__drain_wakeups()
+                    else:
+                        self.__receive()
+        except Exception as error:
+            if not isinstance(error, ConnectionError):
+                error = ConnectionResetError(f"HTTP/2 connection to {self.host} lost : {error!r}")
+            self.__fail(error)
+        finally:
+            selector.close()
+            self.__fail(ConnectionResetError(f"The HTTP/2 connection to {self.host} is closed"))
+            self.sock.close()
+            self.__wakeup_receiver.close()
+            self.__wakeup_sender.close()
+
+    def __drain_wakeups(self) -> None:
+        try:
+            while self.__wakeup_receiver.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def __receive(self) -> None:
+        import h2.events
+
+        while True:
+            try:
+                data = self.sock.recv(65536)
+            except (BlockingIOError, ssl.SSLWantReadError, ssl.SSLWantWriteError):
+                return
+            if not data:
+                raise ConnectionResetError(f"{self.host} closed the HTTP/2 connection")
+
+            with self.__condition:
+                for event in self.__h2.receive_data(data):
+                    if isinstance(event, h2.events.ResponseReceived):
+                        stream = self.__streams.get(event.stream_id)
+                        if stream is not None:
+                            headers = dict(event.headers)
+                            stream.status_code = int(headers.pop(":status"))
+                            stream.headers = headers
+                            self.metrics.observe("ttfb", stream.method, get_region_from_host(self.host), time.perf_counter() - stream.sent_at)
+                    elif isinstance(event, h2.events.DataReceived):
+                        if event.stream_id in self.__streams:
+                            self.__streams[event.stream_id].data.append(event.data)
+                        self.__h2.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+                    elif isinstance(event, h2.events.StreamEnded):
+                        stream = self.__streams.pop(event.stream_id, None)
+                        if stream is not None:
+                            stream.done.set()
+                    elif isinstance(event, h2.events.StreamReset):
+                        stream = self.__streams.pop(event.stream_id, None)
+                        if stream is not None:
+                            error_type = RefusedStreamError if event.error_code == self.REFUSED_STREAM else ConnectionResetError
+                            stream.error = error_type(f"Stream reset by {self.host}, error code {event.error_code}")
+                            stream.done.set()
+                    elif isinstance(event, h2.events.ConnectionTerminated):
+                        # GOAWAY : the streams above last_stream_id were not processed
+                        self.closed = True
+                        for stream_id in [stream_id for stream_id in self.__streams if event.last_stream_id is None or stream_id > event.last_stream_id]:
+                            stream = self.__streams.pop(stream_id)
+                            stream.error = RefusedStreamError(f"{self.host} sent GOAWAY before stream {stream_id}")
+                            stream.done.set()
+                # Streams closed, window opened or settings changed
+                self.__condition.notify_all()
+
+    def __fail(self, error: ConnectionError) -> None:
+        with self.__condition:
+            self.closed = True
+            for stream in self.__streams.values():
+                stream.error = error
+                stream.done.set()
+            self.__streams.clear()
+            self.__condition.notify_all()
+
+
+class HTTP2Transport(Transport):
+    """
+        Every request to a host multiplexed over one HTTP/2 connection, each request in its own stream :
+        thousands of concurrent requests to a region share one socket and one TLS handshake.
+        The signature covers ':authority' instead of 'host'. Needs 'pip install h2'.
+        An http:// endpoint is spoken to in HTTP/2 without TLS (prior knowledge), e.g. a local server.
+    """
+
+    def __init__(self, timeout: float = 10.0, endpoint: str | None = None, ssl_context: ssl.SSLContext | None = None, metrics: LatencyMetrics | None = None, port: int = 443, host_header: str = ":authority") -> None:
+        # Fail now rather than at the first request
+        import h2
+
+        self.timeout: float = timeout
+        self.port: int = port
+        self.host_header: str = host_header
+        self.metrics: LatencyMetrics = metrics if metrics is not None else latency_metrics
+
+        self.created: int = 0
+
+        self.__use_tls, self.__address, self.__port = parse_endpoint(endpoint)
+        self.__ssl_context = ssl_context
+        if self.__use_tls:
+            if self.__ssl_context is None:
+                self.__ssl_context = ssl.create_default_context()
+            self.__ssl_context.set_alpn_protocols(["h2"])
+
+        self.__connections: dict[str, HTTP2Connection] = {}
+        self.__lock = threading.Lock()
+
+    def get_connection(self, host: str, method: str = "", replace: HTTP2Connection | None = None) -> tuple[HTTP2Connection, bool]:
+        """
+            The connection to a host, and whether it was just opened.
+            With replace, never that connection : it is retired and a new one is opened, unless another request already did.
+        """
+        with self.__lock:
+            connection = self.__connections.get(host)
+            if connection is not None and connection is replace:
+                connection.retire()
+            elif connection is not None and not connection.closed:
+                return connection, False
+
+            # Opened under the lock : the concurrent requests to the host wait for this connection instead of opening theirs
+            connection = HTTP2Connection(self.__connect(host, method), host, self.__use_tls, self.metrics)
+            self.__connections[host] = connection
+            self.created += 1
+            return connection, True
+
+    def __connect(self, host: str, method: str) -> socket.socket:
+        timer = PhaseTimer(self.metrics, method, get_region_from_host(host))
+
+        sock = socket.create_connection((self.__address or host, self.__port or self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        timer.lap("tcp_connect")
+
+        if self.__use_tls:
+            sock = self.__ssl_context.wrap_socket(sock, server_hostname=host)
+            timer.lap("tls_handshake")
+            if sock.selected_alpn_protocol() != "h2":
+                sock.close()
+                raise ConnectionError(f"{host} does not speak HTTP/2")
+        return sock
+
+    def request(self, method: str, host: str, path: str, headers: dict[str, str], body: bytes | memoryview = b"") -> TransportResponse:
+        connection, created = self.get_connection(host, method)
+        try:
+            return connection.request(method, path, headers, body, self.timeout)
+        except RefusedStreamError:
+            # Refused by a new connection : another one would not do better
+            if created:
+                raise
+
+        # Not processed by the server : sent again once, on a connection other than the one which refused it
+        connection, _ = self.get_connection(host, method, replace=connection)
+        return connection.request(method, path, headers, body, self.timeout)
+
+    def close(self) -> None:
+        with self.__lock:
+            for connection in self.__connections.values():
+                connection.close()
+            self.__connections.clear()
+
+
+
+######################################
+# REQUESTS TRANSPORT
+######################################
+
+class RequestsTransport(Transport):
+    """Optional transport using a requests.Session. Needs 'pip install requests'"""
+
+    def __init__(self, timeout: float = 10.0, endpoint: str | None = None, metrics: LatencyMetrics | None = None) -> None:
+        import requests
+
+        self.timeout: float = timeout
+        self.metrics: LatencyMetrics = metrics if metrics is not None else latency_metrics
+        self.endpoint: str | None = endpoint.rstrip("/") if endpoint else None
+
+        parse_endpoint(endpoint)
+        self.__session = requests.Session()
+
+    def request(self, method: str, host: str, path: str, headers: dict[str, str], body: bytes | memoryview = b"") -> TransportResponse:
+        url = f"{self.endpoint or f'https://{host}'}{path}"
+        headers = { "Host": host, **headers }
+
+        if isinstance(body, memoryview):
+            body = body.tobytes()
+
+        response = self.__session.request(method, url, headers=headers, data=body, timeout=self.timeout)
+        # requests does not expose the connection phases : elapsed ends with the headers of the response
+        self.metrics.observe("ttfb", method, get_region_from_host(host), response.elapsed.total_seconds())
+        return TransportResponse(response.status_code, dict(response.headers), response.content)
+
+    def close(self) -> None:
+        self.__session.close()
+
+
+TRANSPORTS = {
+    "http.client": HTTPClientTransport,
+    "requests": RequestsTransport,
+    "http2": HTTP2Transport
+}
+
+def create_transport(name: str = "http.client", **kwargs) -> Transport:
+    if name not in TRANSPORTS:
+        raise ValueError(f"'{name}' is not a transport. It is can be either {' and '.join(TRANSPORTS)}.")
+    return TRANSPORTS[name](**kwargs)
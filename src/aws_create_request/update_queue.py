@@ -0,0 +1,183 @@
+
+import time
+import threading
+
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+
+from aws_create_request.client import ShadowClient, ShadowResponse
+from aws_create_request.delta import combine_patches
+
+
+@dataclass(frozen=True)
+class CombinedUpdate:
+    """The flush which carried an update : its id, how many updates it combined, and the response of its UPDATE"""
+    flush_id: int
+    thing_name: str
+    shadow_name: str | None
+    updates: int
+    response: ShadowResponse
+
+
+class PendingUpdate:
+    """The updates of a shadow combined so far. Sealed once full, or when the next update cannot be combined"""
+
+    __slots__ = ("state", "futures", "deadline", "sealed")
+
+    def __init__(self, state: dict, deadline: float) -> None:
+        self.state: dict = state
+        self.futures: list[Future] = []
+        self.deadline: float = deadline
+        self.sealed: bool = False
+
+
+class UpdateQueue:
+    """
+        Write-combining UPDATEs : the state documents given for a shadow within window seconds
+        (or up to max_updates of them) are combined with the shadow merge semantics, later values
+        winning and null deleting, then sent as one signed UPDATE.
+        The UPDATEs of a shadow are sent one at a time, in order ; those of different shadows concurrently,
+        on at most max_workers threads. Each caller gets a Future of the CombinedUpdate which carried its change.
+    """
+
+    def __init__(self, client: ShadowClient, window: float = 0.05, max_updates: int = 32, max_workers: int = 8) -> None:
+        if window < 0 or max_updates < 1:
+            raise ValueError("The window should be positive and max_updates at least 1")
+
+        self.client: ShadowClient = client
+        self.window: float = window
+        self.max_updates: int = max_updates
+
+        self.submitted: int = 0
+        self.flushes: int = 0
+
+        # (thing name, shadow name) -> its pending updates, the oldest first
+        self.__pending: dict[tuple[str, str | None], list[PendingUpdate]] = {}
+        self.__in_flight: set[tuple[str, str | None]] = set()
+        self.__condition = threading.Condition()
+        self.__closed: bool = False
+        self.__executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+
+    def __enter__(self) -> "UpdateQueue":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def submit(self, thing_name: str, state_document: dict, shadow_name: str | None = None) -> Future:
+        """Queue a state document. Return a Future of its CombinedUpdate"""
+        if not isinstance(state_document, dict) or not isinstance(state_document.get("state"), dict):
+            raise ValueError("A state document has a 'state' object")
+        if "version" in state_document:
+            raise ValueError("Versioned updates are not combined : send them with ShadowClient.update")
+
+        key = (thing_name, shadow_name if shadow_name else None)
+        future = Future()
+
+        with self.__condition:
+            if self.__closed:
+                raise RuntimeError("The update queue is closed")
+
+            batches = self.__pending.setdefault(key, [])
+            state = None
+            if batches and not batches[-1].sealed:
+                state = combine_patches(batches[-1].state, state_document["state"])
+                if state is None:
+                    batches[-1].sealed = True
+
+            if state is not None:
+                batch = batches[-1]
+                batch.state = state
+            else:
+                batch = PendingUpdate(combine_patches({}, state_document["state"]), time.monotonic() + self.window)
+                batches.append(batch)
+
+            batch.futures.append(future)
+            if len(batch.futures) >= self.max_updates:
+                batch.sealed = True
+            self.submitted += 1
+            self.__condition.notify()
+
+        return future
+
+    def update(self, thing_name: str, state_document: dict, shadow_name: str | None = None, timeout: float | None = None) -> CombinedUpdate:
+        """Queue a state document and wait for the flush which carried it"""
+        return self.submit(thing_name, state_document, shadow_name).result(timeout)
+
+    def flush(self) -> None:
+        """Send every pending update now, and wait for their responses"""
+        with self.__condition:
+            futures = []
+            for batches in self.__pending.values():
+                for batch in batches:
+                    batch.sealed = True
+                    futures.extend(batch.futures)
+            self.__condition.notify()
+        wait(futures)
+
+    def close(self) -> None:
+        """Send the pending updates, then stop"""
+        with self.__condition:
+            if self.__closed:
+                return
+            self.__closed = True
+            self.__condition.notify()
+        self.__thread.join()
+        self.__executor.shutdown(wait=True)
+
+    def get_stats(self) -> dict:
+        with self.__condition:
+            return {
+                "submitted": self.submitted,
+                "flushes": self.flushes,
+                "pending": sum(len(batch.futures) for batches in self.__pending.values() for batch in batches)
+            }
+
+
+
+    ######################################
+    # FLUSH
+    ######################################
+
+    def __run(self) -> None:
+        with self.__condition:
+            while True:
+                now = time.monotonic()
+                next_deadline = None
+
+                for key, batches in list(self.__pending.items()):
+                    # One UPDATE at a time per shadow : the next one keeps combining meanwhile
+                    if key in self.__in_flight:
+                        continue
+                    batch = batches[0]
+                    if batch.sealed or batch.deadline <= now or self.__closed:
+                        batches.pop(0)
+                        if not batches:
+                            del self.__pending[key]
+                        self.flushes += 1
+                        self.__in_flight.add(key)
+                        self.__executor.submit(self.__send, self.flushes, key, batch)
+                    elif next_deadline is None or batch.deadline < next_deadline:
+                        next_deadline = batch.deadline
+
+                if self.__closed and not self.__pending and not self.__in_flight:
+                    return
+                self.__condition.wait(None if next_deadline is None else next_deadline - now)
+
+    def __send(self, flush_id: int, key: tuple[str, str | None], batch: PendingUpdate) -> None:
+        thing_name, shadow_name = key
+        try:
+            response = self.client.update(thing_name, { "state": batch.state }, shadow_name)
+        except BaseException as error:
+            for future in batch.futures:
+                future.set_exception(error)
+        else:
+            combined_update = CombinedUpdate(flush_id, thing_name, shadow_name, len(batch.futures), response)
+            for future in batch.futures:
+                future.set_result(combined_update)
+        finally:
+            with self.__condition:
+                self.__in_flight.discard(key)
+                self.__condition.notify()
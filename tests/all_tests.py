@@ -1,7 +1,24 @@
 import unittest
 
-from tests.tests_credentials import TestCredentials
-from tests.tests_canonical_request import TestCanonicalRequest
+from tests.tests_credentials import TestCredentials, TestCredentialProviders, TestRefreshingCredentials, TestTemporaryCredentials
+from tests.tests_canonical_request import TestCanonicalRequest, TestCanonicalRequestTemplate
+from tests.tests_string_to_sign import TestSigningKeyCache, TestStringToSign
+from tests.tests_batch import TestManifest, TestBatchRunner
+from tests.tests_transport import TestHTTPClientTransport, TestMutualTLSTransport, TestHTTP2Transport, TestTransportFactory
+from tests.tests_async_client import TestAsyncShadowClient
+from tests.tests_client import TestSignRequest, TestShadowClient, TestNamedShadows
+from tests.tests_presign import TestPresign
+from tests.tests_payload import TestStateDocumentValidator, TestReadStateDocument, TestEncodeShadowDocument
+from tests.tests_delta import TestComputeDelta, TestDeltaUpdater
+from tests.tests_cache import TestShadowCache
+from tests.tests_stub_server import TestShadowStore, TestStubShadowServer
+from tests.tests_metrics import TestLatencyMetrics, TestInstrumentation
+from tests.tests_retry import TestTokenBucket, TestRateLimiter, TestRetryPolicy
+from tests.tests_output import TestOutputFormats
+from tests.tests_mqtt import TestMqttCodec, TestShadowSubscriber
+from tests.tests_update_queue import TestUpdateQueue
+from tests.tests_snapshot import TestFleetSnapshot
+from tests.tests_daemon import TestShadowDaemon
 
 if __name__.__eq__("__main__"):
 
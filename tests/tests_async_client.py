@@ -0,0 +1,148 @@
+import json
+import asyncio
+import threading
+import unittest
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from aws_create_request.app import Credentials
+from aws_create_request.async_client import AsyncShadowClient
+
+
+class ShadowHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    connections = 0
+    dropped = 0
+
+    def setup(self):
+        ShadowHandler.connections += 1
+        self.requests = 0
+        super().setup()
+
+    def do_request(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        self.requests += 1
+        # Close a kept-alive connection after reading the request, without answering
+        if self.path.startswith("/things/drop-") and self.requests > 1:
+            ShadowHandler.dropped += 1
+            self.close_connection = True
+            return
+        if self.path.startswith("/things/continue-"):
+            self.send_response_only(100)
+            self.end_headers()
+        if self.path.endswith("-no-content/shadow"):
+            # Kept alive without Content-Length, as a 204 has no body
+            self.send_response(204)
+            self.end_headers()
+            return
+        content = json.dumps({
+            "method": self.command,
+            "path": self.path,
+            "authorization": self.headers["Authorization"],
+            "body": body.decode("utf-8")
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    do_GET = do_POST = do_DELETE = do_request
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestAsyncShadowClient(unittest.TestCase):
+
+    def setUp(self):
+        ShadowHandler.connections = 0
+        ShadowHandler.dropped = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), ShadowHandler)
+        self.endpoint = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_shadow_methods(self):
+        """
+        Can send signed GET, UPDATE and DELETE shadow requests
+        """
+        msg = f"Should send the signed request of each shadow method"
+
+        async def run():
+            async with AsyncShadowClient(Credentials("key_id", "secret"), "eu-west-1", endpoint=self.endpoint) as client:
+                return await asyncio.gather(
+                    client.get("my-thing"),
+                    client.update("my-thing", {"state": {"reported": {"on": True}}}, shadow_name="config"),
+                    client.delete("my-thing")
+                )
+
+        get, update, delete = [response.json() for response in asyncio.run(run())]
+
+        self.assertEqual((get["method"], get["path"]), ("GET", "/things/my-thing/shadow"), msg)
+        self.assertEqual((update["method"], update["path"]), ("POST", "/things/my-thing/shadow?name=config"), msg)
+        self.assertEqual(update["body"], '{"state":{"reported":{"on":true}}}', msg)
+        self.assertEqual((delete["method"], delete["path"]), ("DELETE", "/things/my-thing/shadow"), msg)
+        self.assertTrue(get["authorization"].startswith("AWS4-HMAC-SHA256 Credential=key_id/"), msg)
+
+    def test_bounded_concurrency(self):
+        """
+        Can limit the number of requests in flight per host
+        """
+        msg = f"Should never open more connections than the concurrency limit"
+
+        async def run():
+            async with AsyncShadowClient(Credentials("key_id", "secret"), "eu-west-1", max_concurrency=4, endpoint=self.endpoint) as client:
+                return await asyncio.gather(*(client.get(f"thing-{i}") for i in range(40)))
+
+        responses = asyncio.run(run())
+
+        self.assertEqual(len(responses), 40, msg)
+        self.assertTrue(all(response.status_code == 200 for response in responses), msg)
+        self.assertLessEqual(ShadowHandler.connections, 4, msg)
+
+    def test_no_body(self):
+        """
+        Can read a response without body on a kept-alive connection
+        """
+        msg = f"Should give an empty content for a 204, skip a 100 Continue, and reuse the connection"
+
+        async def run():
+            async with AsyncShadowClient(Credentials("key_id", "secret"), "eu-west-1", timeout=2.0, endpoint=self.endpoint) as client:
+                return [await client.delete(thing_name) for thing_name in ["thing-no-content", "continue-no-content", "continue-thing"]]
+
+        no_content, continued, test = asyncio.run(run())
+
+        self.assertEqual((no_content.status_code, no_content.content), (204, b""), msg)
+        self.assertEqual((continued.status_code, continued.content), (204, b""), msg)
+        self.assertEqual(test.status_code, 200, msg)
+        self.assertEqual(test.json()["path"], "/things/continue-thing/shadow", msg)
+        self.assertEqual(ShadowHandler.connections, 1, msg)
+
+    def test_resend(self):
+        """
+        Can send a GET once again when a kept-alive connection fails, but not an UPDATE
+        """
+        msg = f"Should resend the GET on a new connection, and raise for the UPDATE the server may have applied"
+
+        async def run():
+            async with AsyncShadowClient(Credentials("key_id", "secret"), "eu-west-1", endpoint=self.endpoint) as client:
+                await client.get("my-thing")
+                get = await client.get("drop-thing")
+                await client.get("my-thing")
+                with self.assertRaises((ConnectionError, asyncio.IncompleteReadError), msg=msg):
+                    await client.update("drop-thing", { "state": { "reported": { "on": True } } })
+                return get
+
+        test = asyncio.run(run())
+
+        self.assertEqual(test.json()["path"], "/things/drop-thing/shadow", msg)
+        self.assertEqual((ShadowHandler.connections, ShadowHandler.dropped), (2, 2), msg)
+
+
+
+if __name__.__eq__("__main__"):
+    unittest.main()
+    print("All tests passed successfully")
@@ -0,0 +1,192 @@
+import io
+import os
+import sys
+import json
+import tempfile
+import unittest
+import subprocess
+
+import aws_create_request
+
+from aws_create_request.app import Credentials
+from aws_create_request.batch import BatchRunner, InvalidManifestEntry, ManifestEntry, read_manifest
+from aws_create_request.stub_server import StubShadowServer
+from aws_create_request.transport import create_transport
+
+class TestManifest(unittest.TestCase):
+
+    def test_read_jsonl_manifest(self):
+        """
+        Can read the entries of a JSONL manifest
+        """
+        msg = f"Should create one {ManifestEntry.__name__} per line"
+
+        manifest = io.StringIO(
+            '{"thing_name": "thing-1", "method": "get"}\n'
+            '\n'
+            '{"thing_name": "thing-2", "method": "update", "shadow_name": "config", "state_document": {"state": {"reported": {"on": true}}}}\n'
+        )
+
+        test = list(read_manifest(manifest, "jsonl"))
+
+        self.assertEqual(len(test), 2, msg)
+        self.assertIsNone(test[0].shadow_name, msg)
+        self.assertEqual(test[1].shadow_name, "config", msg)
+        self.assertEqual(test[1].get_payload(), '{"state":{"reported":{"on":true}}}', msg)
+
+    def test_read_csv_manifest(self):
+        """
+        Can read the entries of a CSV manifest
+        """
+        msg = f"Should create one {ManifestEntry.__name__} per row"
+
+        manifest = io.StringIO(
+            'thing_name,shadow_name,method,state_document\n'
+            'thing-1,,get,\n'
+            'thing-2,config,update,"{""state"": {""desired"": {""on"": false}}}"\n'
+        )
+
+        test = list(read_manifest(manifest, "csv"))
+
+        self.assertEqual(len(test), 2, msg)
+        self.assertIsNone(test[0].shadow_name, msg)
+        self.assertIsNone(test[0].state_document, msg)
+        self.assertEqual(test[1].state_document, {"state": {"desired": {"on": False}}}, msg)
+
+    def test_read_invalid_lines(self):
+        """
+        Can read the lines of a manifest after an invalid one
+        """
+        msg = f"Should give an {InvalidManifestEntry.__name__} with its line number for each invalid line, and read the next ones"
+
+        manifest = io.StringIO(
+            '{"thing_name": "thing-1", "method": "get"}\n'
+            'not json\n'
+            '\n'
+            '{"method": "get"}\n'
+            '["thing-2", "get"]\n'
+            '{"thing_name": "thing-3", "method": "update", "state_document": "{"}\n'
+            '{"thing_name": "thing-4", "method": "delete"}\n'
+        )
+
+        test = list(read_manifest(manifest, "jsonl"))
+
+        self.assertEqual([entry.thing_name for entry in test], ["thing-1", "", "", "", "", "thing-4"], msg)
+        self.assertEqual([entry.line_number for entry in test[1:5]], [2, 4, 5, 6], msg)
+        self.assertTrue(all(isinstance(entry, InvalidManifestEntry) for entry in test[1:5]), msg)
+
+    def test_read_unknown_format(self):
+        """
+        Can't read a manifest with an unknown format
+        """
+        msg = f"Should raise a ValueError exception"
+
+        with self.assertRaises(ValueError, msg=msg):
+            list(read_manifest(io.StringIO(""), "xml"))
+
+
+class TestBatchRunner(unittest.TestCase):
+
+    def test_failed_entries(self):
+        """
+        Can report an invalid entry without stopping the batch
+        """
+        msg = f"Should write one error line per invalid entry"
+
+        output = io.StringIO()
+        entries = [
+            ManifestEntry("thing-1", "random_value"),
+            ManifestEntry("thing-2", "update"),
+            InvalidManifestEntry(3, ValueError("not json")),
+        ]
+
+        test = BatchRunner(Credentials("key_id", "secret"), "eu-west-1", max_workers=2, output=output)
+        summary = test.run(iter(entries))
+
+        lines = [json.loads(line) for line in output.getvalue().splitlines()]
+
+        self.assertEqual(summary, { "succeeded": 0, "failed": 3 }, msg)
+        self.assertEqual(len(lines), 3, msg)
+        self.assertTrue(all("error" in line for line in lines), msg)
+        self.assertIn({ "line": 3, "error": "Invalid manifest line : ValueError('not json')" }, lines, msg)
+
+    def test_response_lines(self):
+        """
+        Can write the response of each entry in its line
+        """
+        msg = f"Should write one JSON line per entry with its status code and response"
+
+        output = io.StringIO()
+        entries = [
+            ManifestEntry("thing-1", "update", state_document={ "state": { "reported": { "on": True } } }),
+            ManifestEntry("thing-2", "get"),
+        ]
+
+        with StubShadowServer() as server:
+            runner = BatchRunner(Credentials("key_id", "secret"), "eu-west-1", max_workers=1, output=output, transport=create_transport(endpoint=server.endpoint))
+            summary = runner.run(iter(entries))
+            runner.client.close()
+
+        lines = { line["thing_name"]: line for line in map(json.loads, output.getvalue().splitlines()) }
+
+        self.assertEqual(summary, { "succeeded": 1, "failed": 1 }, msg)
+        self.assertEqual(lines["thing-1"]["response"]["state"], { "reported": { "on": True } }, msg)
+        self.assertEqual((lines["thing-2"]["status_code"], lines["thing-2"]["response"]["code"]), (404, 404), msg)
+
+    def test_result_errors(self):
+        """
+        Can write the line of an entry whose result could not be written
+        """
+        msg = f"Should write an error line instead, and count the entry once as failed"
+
+        class FailingOnceOutput(io.StringIO):
+            failures = 1
+
+            def write(self, line):
+                if self.failures > 0:
+                    self.failures -= 1
+                    raise ValueError("Cannot write the line")
+                return super().write(line)
+
+        output = FailingOnceOutput()
+        with StubShadowServer() as server:
+            runner = BatchRunner(Credentials("key_id", "secret"), "eu-west-1", max_workers=1, output=output, transport=create_transport(endpoint=server.endpoint))
+            summary = runner.run(iter([ManifestEntry("thing-1", "get")]))
+            runner.client.close()
+
+        lines = [json.loads(line) for line in output.getvalue().splitlines()]
+
+        self.assertEqual(summary, { "succeeded": 0, "failed": 1 }, msg)
+        self.assertEqual(lines, [{ "thing_name": "thing-1", "shadow_name": None, "method": "get", "error": "Cannot write the line" }], msg)
+
+    def test_command_line(self):
+        """
+        Can exit with a code telling whether every operation succeeded
+        """
+        msg = f"Should exit with 0 when every operation succeeded, 1 when one failed, and print only the JSON summary on the standard error"
+
+        def run(*lines):
+            with tempfile.NamedTemporaryFile("w", suffix=".jsonl", delete=False) as manifest:
+                manifest.write("".join(f"{json.dumps(line)}\n" for line in lines))
+            self.addCleanup(os.remove, manifest.name)
+            return subprocess.run(
+                [sys.executable, "-m", "aws_create_request.batch", "-f", manifest.name, "-a", "AKID", "-k", "SECRET", "-e", server.endpoint],
+                capture_output=True,
+                text=True,
+                env={ **os.environ, "PYTHONPATH": os.path.dirname(os.path.dirname(aws_create_request.__file__)) }
+            )
+
+        with StubShadowServer(credentials={ "AKID": "SECRET" }) as server:
+            succeeded = run({ "thing_name": "thing-1", "method": "update", "state_document": { "state": { "reported": { "on": True } } } })
+            failed = run({ "thing_name": "thing-1", "method": "get" }, "not an entry", { "thing_name": "thing-2", "method": "get" })
+
+        self.assertEqual(succeeded.returncode, 0, msg)
+        self.assertEqual(json.loads(succeeded.stderr), { "succeeded": 1, "failed": 0 }, msg)
+        self.assertEqual(failed.returncode, 1, msg)
+        self.assertEqual(json.loads(failed.stderr), { "succeeded": 1, "failed": 2 }, msg)
+
+
+
+if __name__.__eq__("__main__"):
+    unittest.main()
+    print("All tests passed successfully")
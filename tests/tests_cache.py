@@ -0,0 +1,155 @@
+import json
+import time
+import unittest
+
+from types import MappingProxyType
+
+from aws_create_request.cache import ShadowCache, find_version
+from aws_create_request.client import ShadowResponse, SignedRequest
+from aws_create_request.exceptions import ShadowResponseError
+
+
+class CountingShadowClient:
+    """Shadows in memory, in place of a ShadowClient"""
+
+    def __init__(self) -> None:
+        self.shadows: dict = {}
+        self.gets: int = 0
+
+    def __response(self, status_code: int, document: dict) -> ShadowResponse:
+        return ShadowResponse(status_code, MappingProxyType({}), json.dumps(document).encode("utf-8"), SignedRequest("", "", "", MappingProxyType({})))
+
+    def get(self, thing_name, shadow_name=None):
+        self.gets += 1
+        if thing_name not in self.shadows:
+            return self.__response(404, { "code": 404 })
+        return self.__response(200, self.shadows[thing_name])
+
+    def update(self, thing_name, state_document, shadow_name=None):
+        version = self.shadows.get(thing_name, { "version": 0 })["version"] + 1
+        self.shadows[thing_name] = { "state": state_document["state"], "metadata": {}, "version": version, "timestamp": 1673256593 }
+        return self.__response(200, self.shadows[thing_name])
+
+    def delete(self, thing_name, shadow_name=None):
+        self.shadows.pop(thing_name, None)
+        return self.__response(200, { "version": 0 })
+
+
+class TestShadowCache(unittest.TestCase):
+
+    def setUp(self):
+        self.client = CountingShadowClient()
+        self.client.update("my-thing", { "state": { "reported": { "version": 42 } } })
+
+    def test_find_version(self):
+        """
+        Can find the version of a shadow document without decoding it
+        """
+        msg = f"Should return the version of the root object, wherever it is, and not a version key of the state"
+
+        self.assertEqual(find_version(b'{"state":{"reported":{"version":42}},"metadata":{},"version":7,"timestamp":1}'), 7, msg)
+        self.assertEqual(find_version(b'{"version":7,"timestamp":1,"state":{"reported":{"version":42}},"metadata":{"reported":{"version":{"timestamp":1}}}}'), 7, msg)
+        self.assertEqual(find_version(b'{ "version" : 7, "state" : { "reported" : { "note" : "} \\\"version\\\":9 {", "version" : 42 } } }'), 7, msg)
+        self.assertEqual(find_version(b'{"state":{"reported":{"v":"' + b"x" * 300 + b'"}},"version":7}'), 7, msg)
+        self.assertIsNone(find_version(b'{"state":{"reported":{"version":42}}}'), msg)
+        self.assertIsNone(find_version(b'{"state":{}}'), msg)
+
+    def test_read_through(self):
+        """
+        Can serve the same shadow from the cache
+        """
+        msg = f"Should fetch the shadow once"
+
+        test = ShadowCache(self.client, ttl=60)
+
+        first = test.get("my-thing")
+        second = test.get("my-thing")
+
+        self.assertIs(first, second, msg)
+        self.assertEqual(self.client.gets, 1, msg)
+        self.assertEqual(test.get_stats()["hit_ratio"], 0.5, msg)
+
+    def test_unchanged_refresh(self):
+        """
+        Can refresh an expired shadow without decoding it again when its version did not change
+        """
+        msg = f"Should keep the cached document"
+
+        test = ShadowCache(self.client, ttl=0.01)
+
+        first = test.get("my-thing")
+        time.sleep(0.02)
+        second = test.get("my-thing")
+
+        self.assertIs(first, second, msg)
+        self.assertEqual(self.client.gets, 2, msg)
+        self.assertEqual(test.get_stats()["unchanged_refreshes"], 1, msg)
+
+    def test_invalidation(self):
+        """
+        Can invalidate a shadow on UPDATE and DELETE
+        """
+        msg = f"Should fetch the shadow again"
+
+        test = ShadowCache(self.client, ttl=60)
+
+        test.get("my-thing")
+        test.update("my-thing", { "state": { "reported": { "on": True } } })
+        document = test.get("my-thing")
+        test.delete("my-thing")
+
+        self.assertEqual(document["version"], 2, msg)
+        self.assertEqual(test.get_stats()["invalidations"], 2, msg)
+        with self.assertRaises(ShadowResponseError, msg=msg):
+            test.get("my-thing")
+
+    def test_invalidation_in_flight(self):
+        """
+        Can drop the response of a GET sent before the shadow was invalidated
+        """
+        msg = f"Should not store the response of the GET, and fetch the updated shadow next time"
+
+        test = ShadowCache(self.client, ttl=60)
+        get = self.client.get
+
+        def racing_get(thing_name, shadow_name=None):
+            response = get(thing_name, shadow_name)
+            # Updated while the response was on its way
+            self.client.get = get
+            test.update(thing_name, { "state": { "reported": { "on": True } } })
+            return response
+
+        self.client.get = racing_get
+        stale = test.get("my-thing")
+        document = test.get("my-thing")
+
+        self.assertEqual((stale["version"], document["version"]), (1, 2), msg)
+        self.assertEqual(self.client.gets, 2, msg)
+
+    def test_lru_eviction(self):
+        """
+        Can evict the least recently used shadows above the memory cap
+        """
+        msg = f"Should keep the cache under max_bytes"
+
+        for i in range(10):
+            self.client.update(f"thing-{i}", { "state": { "reported": { "i": i } } })
+        size = len(self.client.get("thing-0").content)
+
+        test = ShadowCache(self.client, ttl=60, max_bytes=size * 3)
+        for i in range(10):
+            test.get(f"thing-{i}")
+        test.get("thing-7")
+        test.get("thing-0")
+
+        stats = test.get_stats()
+        self.assertEqual(stats["entries"], 3, msg)
+        self.assertLessEqual(stats["size"], size * 3, msg)
+        self.assertEqual(stats["evictions"], 8, msg)
+        self.assertEqual(stats["hits"], 1, msg)
+
+
+
+if __name__.__eq__("__main__"):
+    unittest.main()
+    print("All tests passed successfully")
@@ -1,7 +1,7 @@
 import unittest
 import datetime
 
-from aws_create_request.canonical_request import CanonicalRequest
+from aws_create_request.canonical_request import CanonicalRequest, CanonicalRequestTemplate, get_canonical_request_template
 from aws_create_request.constants import HTTPMethod
 
 class TestCanonicalRequest(unittest.TestCase):
@@ -261,6 +261,81 @@ class TestCanonicalRequest(unittest.TestCase):
 
 
 
+class TestCanonicalRequestTemplate(unittest.TestCase):
+
+    # Same cases as TestCanonicalRequest
+    cases = [
+        { "shadow_method": "get", "thing_name": "", "shadow_name": "", "region": "", "payload": "" },
+        { "shadow_method": "update", "thing_name": "", "shadow_name": "", "region": "", "payload": "" },
+        { "shadow_method": "delete", "thing_name": "", "shadow_name": "", "region": "", "payload": "" },
+        { "shadow_method": "get", "thing_name": "my-thing-name", "shadow_name": "", "region": "", "payload": "" },
+        { "shadow_method": "get", "thing_name": "my-thing-name", "shadow_name": "my-shadow-name", "region": "", "payload": "" },
+        { "shadow_method": "get", "thing_name": "my-thing-name", "shadow_name": None, "region": "", "payload": "" },
+        { "shadow_method": "get", "thing_name": "my-thing-name", "shadow_name": None, "region": "eu-west-1", "payload": "" },
+        { "shadow_method": "update", "thing_name": "my-thing-name", "shadow_name": "my-shadow-name", "region": "eu-west-1", "payload": '{"state":{"reported":{"key":"value"}}}' },
+    ]
+
+    def test_byte_identical(self):
+        """
+        Can build the same canonical request as a CanonicalRequest object
+        """
+        msg = f"Should build byte-identical canonical requests"
+
+        for case in self.cases:
+            expected = CanonicalRequest()
+            expected.complete_canonical_request(**case)
+            request_date_time = expected.get_date_from_canonical_headers()
+
+            test = CanonicalRequestTemplate(case["shadow_method"], case["thing_name"], case["shadow_name"], case["region"])
+            canonical_bytes = test.build(request_date_time, expected.hashed_payload)
+
+            with self.subTest(**case):
+                self.assertEqual(bytes(canonical_bytes), expected._CanonicalRequest__generate_canonical_string().encode("utf-8"), msg)
+                self.assertEqual(test.hash_canonical_request(request_date_time, expected.hashed_payload), expected.hash_canonical_request(), msg)
+                self.assertEqual(test.signed_headers, expected.signed_headers, msg)
+                self.assertEqual(test.http_method, expected.http_method, msg)
+
+    def test_authority(self):
+        """
+        Can sign ':authority' instead of 'host' for HTTP/2
+        """
+        msg = f"Should build byte-identical canonical requests with ':authority' first, with and without session token"
+
+        for security_token in (None, "my-session-token"):
+            expected = CanonicalRequest()
+            expected.complete_canonical_request("update", "my-thing-name", "my-shadow-name", "eu-west-1", "{}", security_token=security_token, host_header=":authority")
+            request_date_time = expected.get_date_from_canonical_headers()
+
+            test = CanonicalRequestTemplate("update", "my-thing-name", "my-shadow-name", "eu-west-1", ":authority")
+
+            with self.subTest(security_token=security_token):
+                self.assertEqual(bytes(test.build(request_date_time, expected.hashed_payload, security_token)), expected._CanonicalRequest__generate_canonical_string().encode("utf-8"), msg)
+                self.assertEqual(test.get_signed_headers(security_token), expected.signed_headers, msg)
+                self.assertTrue(expected.signed_headers.startswith(":authority;x-amz-date"), msg)
+                self.assertEqual(expected.canonical_headers[0], ":authority:data-ats.iot.eu-west-1.amazonaws.com", msg)
+
+    def test_shadow_method_random(self):
+        """
+        Can't create a template with another shadow method
+        """
+        msg = f"Should raise a ValueError exception"
+
+        for method in ["random_value", ""]:
+            with self.assertRaises(ValueError, msg=msg):
+                CanonicalRequestTemplate(method, "my-thing-name", None, "eu-west-1")
+
+    def test_precomputed(self):
+        """
+        Can reuse the template of a (region, method, thing URI)
+        """
+        msg = f"Should return the same template"
+
+        test = get_canonical_request_template("get", "my-thing-name", None, "eu-west-1")
+
+        self.assertIs(get_canonical_request_template("get", "my-thing-name", None, "eu-west-1"), test, msg)
+        self.assertEqual(test.path, "/things/my-thing-name/shadow", msg)
+
+
 if __name__.__eq__("__main__"):
     unittest.main()
     print("All tests passed successfully")
\ No newline at end of file
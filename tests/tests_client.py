@@ -0,0 +1,203 @@
+import json
+import threading
+import unittest
+import dataclasses
+
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from aws_create_request.app import Credentials
+from aws_create_request.client import ShadowClient, ShadowResponse, SignedRequest, sign_request
+from aws_create_request.exceptions import ShadowResponseError
+from aws_create_request.stub_server import StubShadowServer
+
+
+class ShadowHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_request(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        status = 404 if "missing" in self.path else 200
+        content = json.dumps({ "method": self.command, "path": self.path, "body": body.decode("utf-8") }).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    do_GET = do_POST = do_DELETE = do_request
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestSignRequest(unittest.TestCase):
+
+    def test_signed_request(self):
+        """
+        Can sign a shadow request without the command line
+        """
+        msg = f"Should create a {SignedRequest.__name__} with the authorization headers"
+
+        test = sign_request(Credentials("key_id", "secret"), "eu-west-1", "update", "my-thing", "config", '{"state":{}}')
+
+        self.assertEqual(test.method, "POST", msg)
+        self.assertEqual(test.host, "data-ats.iot.eu-west-1.amazonaws.com", msg)
+        self.assertEqual(test.path, "/things/my-thing/shadow?name=config", msg)
+        self.assertEqual(test.body, b'{"state":{}}', msg)
+        self.assertEqual(test.headers["Content-Length"], "12", msg)
+        self.assertIn("SignedHeaders=host;x-amz-date", test.headers["Authorization"], msg)
+
+    def test_authority(self):
+        """
+        Can sign ':authority' instead of 'host', for HTTP/2
+        """
+        msg = f"Should sign ':authority' with the host as value"
+
+        credentials = Credentials("AKIDEXAMPLE", "secret", "my-session-token")
+
+        test = sign_request(credentials, "eu-west-1", "get", "my-thing", host_header=":authority")
+
+        self.assertIn("SignedHeaders=:authority;x-amz-date;x-amz-security-token", test.headers["Authorization"], msg)
+        with StubShadowServer(credentials={ "AKIDEXAMPLE": "secret" }) as server:
+            with ShadowClient(credentials, "eu-west-1", endpoint=server.endpoint) as client:
+                # The stub reads the host header of HTTP/1.1 for ':authority'
+                self.assertEqual(client.send(test).status_code, 404, msg)
+
+    def test_immutable(self):
+        """
+        Can't modify a signed request
+        """
+        msg = f"Should raise an exception"
+
+        test = sign_request(Credentials("key_id", "secret"), "eu-west-1", "get", "my-thing")
+
+        with self.assertRaises(dataclasses.FrozenInstanceError, msg=msg):
+            test.path = "/"
+        with self.assertRaises(TypeError, msg=msg):
+            test.headers["Authorization"] = ""
+
+    def test_bad_arguments(self):
+        """
+        Can't sign a request with an unknown shadow method or region
+        """
+        msg = f"Should raise a ValueError exception instead of exiting"
+
+        with self.assertRaises(ValueError, msg=msg):
+            sign_request(Credentials("key_id", "secret"), "eu-west-1", "random_value", "my-thing")
+        with self.assertRaises(ValueError, msg=msg):
+            ShadowClient(Credentials("key_id", "secret"), "random_value")
+
+
+class TestShadowClient(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), ShadowHandler)
+        self.client = ShadowClient(Credentials("key_id", "secret"), "eu-west-1", endpoint=f"http://127.0.0.1:{self.server.server_address[1]}")
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_shadow_methods(self):
+        """
+        Can get, update and delete a shadow
+        """
+        msg = f"Should return a {ShadowResponse.__name__} for each shadow method"
+
+        get = self.client.get("my-thing")
+        update = self.client.update("my-thing", {"state": {"reported": {"on": True}}}, shadow_name="config")
+        delete = self.client.delete("my-thing")
+
+        self.assertIsInstance(get, ShadowResponse, msg)
+        self.assertEqual(get.json()["method"], "GET", msg)
+        self.assertEqual(update.json(), { "method": "POST", "path": "/things/my-thing/shadow?name=config", "body": '{"state":{"reported":{"on":true}}}' }, msg)
+        self.assertEqual(delete.json()["method"], "DELETE", msg)
+        self.assertEqual(update.request.shadow_name, "config", msg)
+
+    def test_raise_for_status(self):
+        """
+        Can raise an exception for an error status
+        """
+        msg = f"Should raise a {ShadowResponseError.__name__} exception"
+
+        response = self.client.get("missing-thing")
+
+        self.assertFalse(response.ok, msg)
+        with self.assertRaises(ShadowResponseError, msg=msg):
+            response.raise_for_status()
+
+    def test_many_threads(self):
+        """
+        Can share one client between many threads
+        """
+        msg = f"Should answer each thread with its own response"
+
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            responses = list(executor.map(lambda i: self.client.get(f"thing-{i}"), range(100)))
+
+        self.assertEqual([response.json()["path"] for response in responses], [f"/things/thing-{i}/shadow" for i in range(100)], msg)
+
+
+class TestNamedShadows(unittest.TestCase):
+
+    credentials = Credentials("AKIDEXAMPLE", "wJalrXUtnFEMI/K7MDENG+bPxRfiCYEXAMPLEKEY")
+
+    def setUp(self):
+        self.server = StubShadowServer(credentials={ self.credentials.aws_access_key_id: self.credentials.aws_secret_access_key }).start()
+        self.client = ShadowClient(self.credentials, "eu-west-1", endpoint=self.server.endpoint)
+        for thing_name, count in (("thing-1", 7), ("thing-2", 3)):
+            for i in range(count):
+                self.client.update(thing_name, { "state": { "reported": { "i": i } } }, f"shadow-{i}").raise_for_status()
+        self.client.update("thing-1", { "state": { "reported": { "classic": True } } }).raise_for_status()
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+
+    def test_list_named_shadows(self):
+        """
+        Can list the named shadows of a thing, page by page
+        """
+        msg = f"Should follow nextToken, request the pages lazily and skip the classic shadow"
+
+        test = self.client.list_named_shadows("thing-1", page_size=3)
+
+        self.assertEqual(next(test), "shadow-0", msg)
+        self.assertEqual(self.server.status_codes[200], 11 + 1, msg)
+        self.assertEqual(list(test), [f"shadow-{i}" for i in range(1, 7)], msg)
+        self.assertEqual(self.server.status_codes[200], 11 + 3, msg)
+
+        self.assertEqual(list(self.client.list_named_shadows("thing-3")), [], msg)
+
+    def test_list_errors(self):
+        """
+        Can raise on a page answered with an error
+        """
+        msg = f"Should raise a ShadowResponseError"
+
+        with self.assertRaises(ShadowResponseError, msg=msg) as context:
+            list(self.client.list_named_shadows("thing-1", page_size=1000))
+        self.assertEqual(context.exception.status_code, 400, msg)
+
+    def test_get_named_shadows(self):
+        """
+        Can fetch every named shadow of several things concurrently
+        """
+        msg = f"Should return the response of each named shadow of each thing"
+
+        test = self.client.get_named_shadows(["thing-1", "thing-2", "thing-3"], max_workers=4)
+
+        self.assertEqual(sorted(test), ["thing-1", "thing-2", "thing-3"], msg)
+        self.assertEqual(sorted(test["thing-1"]), [f"shadow-{i}" for i in range(7)], msg)
+        self.assertEqual(test["thing-2"]["shadow-2"].json()["state"]["reported"], { "i": 2 }, msg)
+        self.assertEqual(test["thing-3"], {}, msg)
+        self.assertNotIn(403, self.server.status_codes, msg)
+
+        self.assertEqual(list(self.client.get_named_shadows("thing-2")), ["thing-2"], msg)
+
+
+if __name__.__eq__("__main__"):
+    unittest.main()
+    print("All tests passed successfully")
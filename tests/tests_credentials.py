@@ -1,6 +1,22 @@
+import os
+import time
+import datetime
+import tempfile
 import unittest
+import urllib.request
 
-from aws_create_request.app import Credentials
+from unittest import mock
+from urllib.parse import urlsplit
+
+from aws_create_request.app import Credentials, CreateRequest
+from aws_create_request.client import ShadowClient
+from aws_create_request.credentials import (
+    CredentialProvider, CredentialProviderChain, EnvironmentProvider, RefreshingCredentials,
+    SharedCredentialsProvider, StaticProvider, resolve_credentials
+)
+from aws_create_request.presign import presign_url
+from aws_create_request.stub_server import StubShadowServer
+from aws_create_request.transport import create_transport
 
 class TestCredentials(unittest.TestCase):
 
@@ -47,6 +63,200 @@ class TestCredentials(unittest.TestCase):
         self.assertEqual(test.get_aws_secret_access_key(), aws_secret_access_key, msg)
 
 
+class TestCredentialProviders(unittest.TestCase):
+
+    def test_environment(self):
+        """
+        Can read the credentials from the environment variables
+        """
+        msg = f"Should read the session token too, and nothing without the key pair"
+
+        test = EnvironmentProvider({ "AWS_ACCESS_KEY_ID": "AKID", "AWS_SECRET_ACCESS_KEY": "SECRET", "AWS_SESSION_TOKEN": "TOKEN" }).load()
+
+        self.assertEqual((test.aws_access_key_id, test.aws_secret_access_key, test.aws_session_token), ("AKID", "SECRET", "TOKEN"), msg)
+        self.assertIsNone(EnvironmentProvider({ "AWS_ACCESS_KEY_ID": "AKID" }).load(), msg)
+
+    def test_shared_credentials_file(self):
+        """
+        Can read a profile of a shared credentials file
+        """
+        msg = f"Should read the asked profile, and nothing for an unknown one"
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "credentials")
+            with open(path, "w") as credentials_file:
+                credentials_file.write("[default]\naws_access_key_id = AKID\naws_secret_access_key = SECRET\n\n[dev]\naws_access_key_id = DEVAKID\naws_secret_access_key = DEVSECRET\naws_session_token = DEVTOKEN\n")
+
+            test = SharedCredentialsProvider("dev", path).load()
+
+            self.assertEqual((test.aws_access_key_id, test.aws_secret_access_key, test.aws_session_token), ("DEVAKID", "DEVSECRET", "DEVTOKEN"), msg)
+            self.assertEqual(SharedCredentialsProvider("default", path).load().aws_session_token, "", msg)
+            self.assertIsNone(SharedCredentialsProvider("prod", path).load(), msg)
+            self.assertIsNone(SharedCredentialsProvider("default", os.path.join(directory, "missing")).load(), msg)
+
+    def test_chain(self):
+        """
+        Can take the credentials of the first provider which has some
+        """
+        msg = f"Should skip the providers without credentials"
+
+        chain = CredentialProviderChain([StaticProvider(None, None), EnvironmentProvider({}), StaticProvider("AKID", "SECRET"), StaticProvider("OTHER", "OTHER")])
+
+        self.assertEqual(chain.load().aws_access_key_id, "AKID", msg)
+        self.assertIsNone(CredentialProviderChain([EnvironmentProvider({})]).load(), msg)
+
+    def test_resolve_credentials(self):
+        """
+        Can prefer the command line to the environment
+        """
+        msg = f"Should raise a ValueError when no source has credentials"
+
+        with mock.patch.dict(os.environ, { "AWS_ACCESS_KEY_ID": "ENVAKID", "AWS_SECRET_ACCESS_KEY": "ENVSECRET" }):
+            self.assertEqual(resolve_credentials("AKID", "SECRET").aws_access_key_id, "AKID", msg)
+            self.assertEqual(resolve_credentials().aws_access_key_id, "ENVAKID", msg)
+
+        environ = { "AWS_SHARED_CREDENTIALS_FILE": os.path.join(tempfile.gettempdir(), "missing-credentials") }
+        with mock.patch.dict(os.environ, environ, clear=True):
+            with self.assertRaises(ValueError, msg=msg):
+                resolve_credentials()
+
+
+class SequenceProvider(CredentialProvider):
+    """Credentials expiring after each given number of seconds, or a failed load for None"""
+
+    name = "sequence"
+
+    def __init__(self, *lifetimes: float) -> None:
+        self.lifetimes = list(lifetimes)
+        self.loads = 0
+
+    def load(self) -> Credentials:
+        self.loads += 1
+        lifetime = self.lifetimes.pop(0)
+        if lifetime is None:
+            raise ConnectionError("The provider is not reachable")
+        expiration = datetime.datetime.now(tz=datetime.timezone.utc) + datetime.timedelta(seconds=lifetime)
+        return Credentials(f"AKID{self.loads}", f"SECRET{self.loads}", f"TOKEN{self.loads}", expiration)
+
+
+class TestRefreshingCredentials(unittest.TestCase):
+
+    def test_frozen_credentials(self):
+        """
+        Can load the credentials once while they are far from their expiration
+        """
+        msg = f"Should sign with the same key pair and token, without loading them again"
+
+        provider = SequenceProvider(3600)
+        credentials = RefreshingCredentials(provider)
+        test = [credentials.get_frozen_credentials() for _ in range(100)]
+        credentials.close()
+
+        self.assertEqual(provider.loads, 1, msg)
+        self.assertTrue(all(frozen is test[0] for frozen in test), msg)
+        self.assertEqual((test[0].aws_access_key_id, test[0].aws_session_token), ("AKID1", "TOKEN1"), msg)
+
+    def test_mandatory_refresh(self):
+        """
+        Can refresh the credentials before signing when they are about to expire
+        """
+        msg = f"Should sign with the new credentials"
+
+        credentials = RefreshingCredentials(SequenceProvider(30, 3600), advisory_refresh=300, mandatory_refresh=60)
+        test = credentials.get_frozen_credentials()
+        credentials.close()
+
+        self.assertEqual(test.aws_access_key_id, "AKID2", msg)
+        self.assertEqual(credentials.refreshes, 1, msg)
+
+    def test_background_refresh(self):
+        """
+        Can refresh the credentials in the background before their expiration
+        """
+        msg = f"Should have new credentials without a request waiting for them"
+
+        credentials = RefreshingCredentials(SequenceProvider(4, 3600), advisory_refresh=3, mandatory_refresh=0)
+        for _ in range(50):
+            if credentials.refreshes > 0:
+                break
+            time.sleep(0.05)
+        credentials.close()
+
+        self.assertEqual(credentials.refreshes, 1, msg)
+        self.assertEqual(credentials.aws_access_key_id, "AKID2", msg)
+
+    def test_failed_refresh(self):
+        """
+        Can refresh the credentials in the background again after a failed refresh
+        """
+        msg = f"Should count the failures and retry with a backoff until a refresh succeeds"
+
+        provider = SequenceProvider(4, None, None, 3600)
+        credentials = RefreshingCredentials(provider, advisory_refresh=3, mandatory_refresh=0, retry_delay=0.1)
+        for _ in range(50):
+            if credentials.refreshes > 0:
+                break
+            time.sleep(0.05)
+        credentials.close()
+
+        self.assertEqual((credentials.refreshes, credentials.refresh_errors), (1, 2), msg)
+        self.assertEqual(provider.loads, 4, msg)
+        self.assertEqual(credentials.aws_access_key_id, "AKID4", msg)
+
+
+class TestTemporaryCredentials(unittest.TestCase):
+
+    def test_session_token(self):
+        """
+        Can sign requests with temporary credentials of a credentials endpoint
+        """
+        msg = f"Should sign the X-Amz-Security-Token header, and be rejected without it"
+
+        with StubShadowServer(credentials={}, credentials_duration=3600) as server:
+            credentials = resolve_credentials(endpoint=f"{server.endpoint}/credentials")
+            frozen = credentials.get_frozen_credentials()
+
+            self.assertIsInstance(credentials, RefreshingCredentials, msg)
+            self.assertTrue(frozen.aws_session_token, msg)
+
+            with ShadowClient(credentials, "eu-west-1", endpoint=server.endpoint) as client:
+                self.assertEqual(client.update("my-thing", { "state": { "reported": { "on": True } } }).status_code, 200, msg)
+
+            request = CreateRequest()
+            request.set_context_request("my-thing", "get", credentials, "eu-west-1")
+            request.generate_authorization()
+
+            self.assertIn("x-amz-security-token", request.authorization["Authorization"], msg)
+            transport = create_transport(endpoint=server.endpoint)
+            self.assertEqual(request.execute_request(transport).status_code, 200, msg)
+            transport.close()
+
+            url = urlsplit(presign_url(credentials, "eu-west-1", "get", "my-thing"))
+            with urllib.request.urlopen(urllib.request.Request(f"{server.endpoint}{url.path}?{url.query}", headers={ "Host": url.hostname })) as response:
+                self.assertEqual(response.status, 200, msg)
+
+            with ShadowClient(Credentials(frozen.aws_access_key_id, frozen.aws_secret_access_key), "eu-west-1", endpoint=server.endpoint) as client:
+                self.assertEqual(client.get("my-thing").status_code, 403, msg)
+
+            credentials.close()
+
+    def test_expired_token(self):
+        """
+        Can reject the requests signed with expired temporary credentials
+        """
+        msg = f"Should answer 403 once the credentials expired"
+
+        with StubShadowServer(credentials={}, credentials_duration=3600) as server:
+            issued = server.verifier.issue_temporary_credentials(-1)
+            credentials = Credentials(issued["AccessKeyId"], issued["SecretAccessKey"], issued["Token"])
+
+            with ShadowClient(credentials, "eu-west-1", endpoint=server.endpoint) as client:
+                test = client.get("my-thing")
+
+            self.assertEqual(test.status_code, 403, msg)
+            self.assertIn("expired", test.json()["message"], msg)
+
+
 
 if __name__.__eq__("__main__"):
     unittest.main()
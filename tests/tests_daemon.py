@@ -0,0 +1,130 @@
+import os
+import sys
+import json
+import socket
+import tempfile
+import unittest
+import subprocess
+
+from concurrent.futures import ThreadPoolExecutor
+
+import aws_create_request.daemon_client
+
+from aws_create_request.app import Credentials
+from aws_create_request.client import ShadowClient
+from aws_create_request.daemon import ShadowDaemon
+from aws_create_request.daemon_client import DaemonClient
+from aws_create_request.stub_server import StubShadowServer
+
+
+CREDENTIALS = Credentials("AKIDEXAMPLE", "wJalrXUtnFEMI/K7MDENG+bPxRfiCYEXAMPLEKEY")
+
+
+class TestShadowDaemon(unittest.TestCase):
+
+    def setUp(self):
+        self.server = StubShadowServer(credentials={ CREDENTIALS.aws_access_key_id: CREDENTIALS.aws_secret_access_key }).start()
+        self.directory = tempfile.TemporaryDirectory()
+        self.socket_path = os.path.join(self.directory.name, "shadows.sock")
+        self.daemon = ShadowDaemon(ShadowClient(CREDENTIALS, "eu-west-1", endpoint=self.server.endpoint), self.socket_path).start()
+
+    def tearDown(self):
+        self.daemon.stop()
+        self.daemon.client.close()
+        self.directory.cleanup()
+        self.server.stop()
+
+    def test_operations(self):
+        """
+        Can run GET, UPDATE and DELETE requests on one connection
+        """
+        msg = f"Should answer one result line per request, with the status code and the response of the shadow API"
+
+        with DaemonClient(self.socket_path) as client:
+            update = client.request("update", "my-thing", state_document={ "state": { "reported": { "temperature": 20 } } })
+            get = client.request("get", "my-thing")
+            delete = client.request("delete", "my-thing")
+            test = client.request("get", "my-thing")
+
+        self.assertEqual(update["status_code"], 200, msg)
+        self.assertEqual(get["response"]["state"]["reported"], { "temperature": 20 }, msg)
+        self.assertEqual(get["thing_name"], "my-thing", msg)
+        self.assertEqual(delete["status_code"], 200, msg)
+        self.assertEqual(test["status_code"], 404, msg)
+        self.assertEqual(self.daemon.requests, 4, msg)
+        self.assertEqual(os.stat(self.socket_path).st_mode & 0o777, 0o600, msg)
+
+    def test_errors(self):
+        """
+        Can answer an error for a bad request and keep the connection open
+        """
+        msg = f"Should write an error line for an invalid line or document, and echo the id of a request"
+
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+            connection.connect(self.socket_path)
+            connection.sendall(b'not json\n{"thing_name": "my-thing", "method": "update"}\n{"id": 7, "thing_name": "my-thing", "method": "get"}\n')
+            lines = connection.makefile("rb")
+            test = [json.loads(lines.readline()) for _ in range(3)]
+            lines.close()
+
+        self.assertIn("error", test[0], msg)
+        self.assertIn("state document", test[1]["error"], msg)
+        self.assertEqual((test[2]["id"], test[2]["status_code"]), (7, 404), msg)
+
+    def test_concurrent(self):
+        """
+        Can serve several connections at the same time
+        """
+        msg = f"Should answer each client its own results"
+
+        def call(i):
+            with DaemonClient(self.socket_path) as client:
+                client.request("update", f"thing-{i}", state_document=json.dumps({ "state": { "reported": { "i": i } } }))
+                return client.request("get", f"thing-{i}")["response"]["state"]["reported"]["i"]
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            test = list(executor.map(call, range(16)))
+
+        self.assertEqual(test, list(range(16)), msg)
+
+    def test_socket(self):
+        """
+        Can replace the socket of a stopped daemon, but not the one of a running daemon
+        """
+        msg = f"Should remove a stale socket, and raise FileExistsError for a live one"
+
+        with self.assertRaises(FileExistsError, msg=msg):
+            ShadowDaemon(self.daemon.client, self.socket_path)
+
+        stale_path = os.path.join(self.directory.name, "stale.sock")
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(stale_path)
+        stale.close()
+
+        test = ShadowDaemon(self.daemon.client, stale_path)
+        test.server_close()
+
+        self.assertFalse(os.path.exists(stale_path), msg)
+
+    def test_command_line(self):
+        """
+        Can run the thin client as a file, without the package nor the site modules
+        """
+        msg = f"Should write the response of the shadow like the command line of the application"
+
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as state_document:
+            json.dump({ "state": { "desired": { "color": "red" } } }, state_document)
+        self.addCleanup(os.remove, state_document.name)
+
+        client_path = aws_create_request.daemon_client.__file__
+        run = lambda *args: subprocess.run([sys.executable, "-S", client_path, "--socket", self.socket_path, *args], capture_output=True, text=True, cwd=self.directory.name, env={})
+
+        update = run("-t", "my-thing", "-m", "UPDATE", "-d", state_document.name, "-o", "compact")
+        test = run("-t", "my-thing", "-m", "GET")
+        usage = run("-t", "my-thing")
+
+        self.assertEqual(update.returncode, 0, msg)
+        self.assertEqual(json.loads(test.stdout)["state"]["desired"], { "color": "red" }, msg)
+        self.assertTrue(test.stdout.startswith("{\n  "), msg)
+        self.assertNotEqual(usage.returncode, 0, msg)
+        self.assertIn("Usage", usage.stderr, msg)
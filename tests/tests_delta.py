@@ -0,0 +1,139 @@
+import json
+import tempfile
+import unittest
+
+from types import MappingProxyType
+
+from aws_create_request.client import ShadowResponse, SignedRequest
+from aws_create_request.delta import DeltaUpdater, FileShadowStateStore, MemoryShadowStateStore, combine_patches, compute_delta, merge_state
+
+
+class VersionedShadowClient:
+    """In-memory shadow with versions, in place of a ShadowClient"""
+
+    def __init__(self) -> None:
+        self.state: dict = {}
+        self.version: int = 0
+        self.payloads: list[dict] = []
+
+    def __response(self, status_code: int, document: dict) -> ShadowResponse:
+        return ShadowResponse(status_code, MappingProxyType({}), json.dumps(document).encode("utf-8"), SignedRequest("", "", "", MappingProxyType({})))
+
+    def get(self, thing_name, shadow_name=None):
+        if self.version == 0:
+            return self.__response(404, { "code": 404, "message": "No shadow exists with name: 'my-thing'" })
+        return self.__response(200, { "state": self.state, "version": self.version })
+
+    def update(self, thing_name, state_document, shadow_name=None):
+        document = json.loads(state_document)
+        self.payloads.append(document)
+        if "version" in document and document["version"] != self.version:
+            return self.__response(409, { "code": 409, "message": "Version conflict" })
+        self.state = merge_state(self.state, document["state"])
+        self.version += 1
+        return self.__response(200, { "state": document["state"], "version": self.version })
+
+
+class TestComputeDelta(unittest.TestCase):
+
+    def test_compute_delta(self):
+        """
+        Can compute the minimal delta between two states
+        """
+        msg = f"Should keep only the changed values, and null for the removed keys"
+
+        previous = { "temperature": 21, "led": { "on": True, "color": "red" }, "tags": [1, 2], "old": 1 }
+        current = { "temperature": 21, "led": { "on": True, "color": "blue" }, "tags": [1, 2, 3], "new": None, "added": { "a": 1 } }
+
+        test = compute_delta(previous, current)
+
+        self.assertEqual(test, { "led": { "color": "blue" }, "tags": [1, 2, 3], "old": None, "added": { "a": 1 } }, msg)
+        self.assertEqual(merge_state(previous, test), { key: value for key, value in current.items() if value is not None }, msg)
+
+    def test_no_change(self):
+        """
+        Can compute an empty delta between equal states
+        """
+        msg = f"Should be empty"
+
+        self.assertEqual(compute_delta({ "a": { "b": 1 } }, { "a": { "b": 1 } }), {}, msg)
+        self.assertEqual(compute_delta({ "a": 1 }, { "a": True }), { "a": True }, msg)
+
+    def test_combine_patches(self):
+        """
+        Can combine two patches in one
+        """
+        msg = f"Should apply like the two patches one after the other, or be None"
+
+        state = { "led": { "on": True, "color": "red" }, "fan": 1, "tags": [1] }
+        first = { "led": { "color": None }, "fan": None, "new": { "a": 1 } }
+        second = { "led": { "on": False }, "fan": 2, "new": { "b": None } }
+
+        test = combine_patches(first, second)
+
+        self.assertEqual(test, { "led": { "color": None, "on": False }, "fan": 2, "new": { "a": 1, "b": None } }, msg)
+        self.assertEqual(merge_state(state, test), merge_state(merge_state(state, first), second), msg)
+        self.assertIsNone(combine_patches({ "led": None }, { "led": { "on": True } }), msg)
+        self.assertIsNone(combine_patches({ "tags": [2] }, { "tags": { "a": 1 } }), msg)
+
+
+class TestDeltaUpdater(unittest.TestCase):
+
+    def setUp(self):
+        self.client = VersionedShadowClient()
+        self.test = DeltaUpdater(self.client, MemoryShadowStateStore())
+
+    def test_delta_update(self):
+        """
+        Can send only the changes since the last acknowledged state
+        """
+        msg = f"Should send the full document, then only the deltas with the version"
+
+        self.test.update("my-thing", { "state": { "reported": { "temperature": 21, "humidity": 40 } } })
+        self.test.update("my-thing", { "state": { "reported": { "temperature": 22 } } })
+        response = self.test.update("my-thing", { "state": { "reported": { "temperature": 22 } } })
+
+        self.assertIsNone(response, msg)
+        self.assertEqual(self.client.payloads[0], { "state": { "reported": { "temperature": 21, "humidity": 40 } } }, msg)
+        self.assertEqual(self.client.payloads[1], { "state": { "reported": { "temperature": 22, "humidity": None } }, "version": 1 }, msg)
+        self.assertEqual(len(self.client.payloads), 2, msg)
+        self.assertEqual(self.client.state, { "reported": { "temperature": 22 } }, msg)
+
+    def test_version_conflict(self):
+        """
+        Can resynchronize after a version conflict
+        """
+        msg = f"Should fetch the shadow and send the delta against it"
+
+        self.test.update("my-thing", { "state": { "reported": { "temperature": 21 } } })
+        # Another writer
+        self.client.state = { "reported": { "temperature": 21, "humidity": 50 } }
+        self.client.version = 5
+
+        response = self.test.update("my-thing", { "state": { "reported": { "temperature": 23, "humidity": 50 } } })
+
+        self.assertEqual(response.status_code, 200, msg)
+        self.assertEqual(self.client.payloads[-1], { "state": { "reported": { "temperature": 23 } }, "version": 5 }, msg)
+        self.assertEqual(self.test.store.load("my-thing", None), { "state": { "reported": { "temperature": 23, "humidity": 50 } }, "version": 6 }, msg)
+
+    def test_file_store(self):
+        """
+        Can keep the acknowledged states in a directory
+        """
+        msg = f"Should load the saved state"
+
+        with tempfile.TemporaryDirectory() as directory:
+            test = FileShadowStateStore(directory)
+            test.save("my-thing", "config", { "reported": { "on": True } }, 3)
+
+            self.assertEqual(FileShadowStateStore(directory).load("my-thing", "config"), { "state": { "reported": { "on": True } }, "version": 3 }, msg)
+            self.assertIsNone(test.load("my-thing", None), msg)
+
+            test.delete("my-thing", "config")
+            self.assertIsNone(test.load("my-thing", "config"), msg)
+
+
+
+if __name__.__eq__("__main__"):
+    unittest.main()
+    print("All tests passed successfully")
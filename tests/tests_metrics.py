@@ -0,0 +1,133 @@
+import json
+import asyncio
+import unittest
+
+from aws_create_request.app import CreateRequest, Credentials
+from aws_create_request.async_client import AsyncShadowClient
+from aws_create_request.client import ShadowClient
+from aws_create_request.metrics import LatencyMetrics, latency_metrics
+from aws_create_request.stub_server import StubShadowServer
+from aws_create_request.transport import HTTPClientTransport
+
+
+CREDENTIALS = Credentials("AKIDEXAMPLE", "wJalrXUtnFEMI/K7MDENG+bPxRfiCYEXAMPLEKEY")
+
+
+class TestLatencyMetrics(unittest.TestCase):
+
+    def test_histograms(self):
+        """
+        Can aggregate the observations per phase, method and region
+        """
+        msg = f"Should count the observations in cumulative buckets"
+
+        metrics = LatencyMetrics(buckets=(0.01, 0.1))
+        for seconds in (0.005, 0.05, 0.5):
+            metrics.observe("ttfb", "GET", "eu-west-1", seconds)
+        metrics.observe("ttfb", "POST", "eu-west-1", 0.005)
+
+        test = metrics.to_dict()["phases"]
+
+        self.assertEqual(len(test), 2, msg)
+        self.assertEqual((test[0]["method"], test[0]["count"], test[0]["counts"]), ("GET", 3, [1, 2, 3]), msg)
+        self.assertAlmostEqual(test[0]["sum"], 0.555, msg=msg)
+        self.assertEqual(test[0]["max"], 0.5, msg)
+
+    def test_prometheus(self):
+        """
+        Can export the histograms in the Prometheus text format
+        """
+        msg = f"Should write the buckets, the sum and the count of each histogram"
+
+        metrics = LatencyMetrics(buckets=(0.01, 0.1))
+        metrics.observe("dns", "GET", "eu-west-1", 0.05)
+
+        test = metrics.to_prometheus().splitlines()
+
+        self.assertEqual(test[1], "# TYPE aws_shadows_phase_seconds histogram", msg)
+        self.assertIn('aws_shadows_phase_seconds_bucket{phase="dns",method="GET",region="eu-west-1",le="0.01"} 0', test, msg)
+        self.assertIn('aws_shadows_phase_seconds_bucket{phase="dns",method="GET",region="eu-west-1",le="0.1"} 1', test, msg)
+        self.assertIn('aws_shadows_phase_seconds_bucket{phase="dns",method="GET",region="eu-west-1",le="+Inf"} 1', test, msg)
+        self.assertIn('aws_shadows_phase_seconds_count{phase="dns",method="GET",region="eu-west-1"} 1', test, msg)
+
+    def test_callbacks(self):
+        """
+        Can give every observation to the callbacks
+        """
+        msg = f"Should call the callbacks, even when one of them fails"
+
+        metrics = LatencyMetrics()
+        test = []
+
+        def failing_callback(*observation):
+            raise RuntimeError("telemetry is down")
+
+        metrics.add_callback(failing_callback)
+        metrics.add_callback(lambda *observation: test.append(observation))
+        metrics.observe("sign", "GET", "eu-west-1", 0.001)
+        metrics.remove_callback(failing_callback)
+        metrics.observe("sign", "GET", "eu-west-1", 0.002)
+
+        self.assertEqual(test, [("sign", "GET", "eu-west-1", 0.001), ("sign", "GET", "eu-west-1", 0.002)], msg)
+        self.assertEqual(metrics.callback_errors, 1, msg)
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def setUp(self):
+        latency_metrics.reset()
+
+    def test_generate_authorization(self):
+        """
+        Can time the five steps of the signature
+        """
+        msg = f"Should observe each step for the method and the region"
+
+        create_request = CreateRequest()
+        create_request.set_context_request("my-thing", "update", CREDENTIALS, "eu-west-2", payload='{"state":{}}')
+        create_request.generate_authorization()
+
+        for phase in ("canonical_request", "hash_canonical_request", "string_to_sign", "signature", "authorization_header"):
+            self.assertEqual(latency_metrics.get_histogram(phase, "POST", "eu-west-2").count, 1, msg)
+
+    def test_request_phases(self):
+        """
+        Can time the connection, the first byte and the decoding of a shadow request
+        """
+        msg = f"Should observe the network phases once per connection and once per request, in the metrics given to the transport"
+
+        metrics = LatencyMetrics()
+
+        with StubShadowServer() as server:
+            transport = HTTPClientTransport(endpoint=server.endpoint, metrics=metrics)
+            with ShadowClient(CREDENTIALS, "eu-west-1", transport=transport) as client:
+                for _ in range(3):
+                    client.update("my-thing", { "state": { "reported": { "on": True } } }).json()
+
+        for phase, count in (("dns", 1), ("tcp_connect", 1), ("ttfb", 3)):
+            self.assertEqual(metrics.get_histogram(phase, "POST", "eu-west-1").count, count, msg)
+        self.assertIsNone(metrics.get_histogram("tls_handshake", "POST", "eu-west-1"), msg)
+        # The signature and the decoding too, in the metrics of the transport of the client
+        self.assertEqual(metrics.get_histogram("sign", "POST", "eu-west-1").count, 3, msg)
+        self.assertEqual(metrics.get_histogram("json_decode", "POST", "eu-west-1").count, 3, msg)
+        self.assertIsNone(latency_metrics.get_histogram("sign", "POST", "eu-west-1"), msg)
+        self.assertEqual(json.loads(metrics.to_json())["phases"][0]["region"], "eu-west-1", msg)
+
+    def test_async_request_phases(self):
+        """
+        Can time every phase of a request of the asyncio client in its own metrics
+        """
+        msg = f"Should observe the connection, the signature, the first byte and the decoding in the metrics given to the client"
+
+        metrics = LatencyMetrics()
+
+        async def run():
+            async with AsyncShadowClient(CREDENTIALS, "eu-west-1", endpoint=server.endpoint, metrics=metrics) as client:
+                (await client.update("my-thing", { "state": { "reported": { "on": True } } })).json()
+
+        with StubShadowServer() as server:
+            asyncio.run(run())
+
+        for phase in ("connect", "sign", "ttfb", "json_decode"):
+            self.assertEqual(metrics.get_histogram(phase, "POST", "eu-west-1").count, 1, msg)
+        self.assertIsNone(latency_metrics.get_histogram("sign", "POST", "eu-west-1"), msg)
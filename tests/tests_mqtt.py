@@ -0,0 +1,159 @@
+import asyncio
+import unittest
+
+from urllib.parse import parse_qs, urlsplit
+
+from aws_create_request.app import Credentials
+from aws_create_request.client import ShadowClient
+from aws_create_request.exceptions import ShadowSubscriptionError
+from aws_create_request.mqtt import (
+    PacketParser, PacketType, ShadowSubscriber, decode_publish, encode_publish,
+    encode_remaining_length, encode_subscribe, get_shadow_topic, parse_shadow_topic, presign_mqtt_url
+)
+from aws_create_request.stub_broker import StubShadowBroker, match_topic
+from aws_create_request.stub_server import StubShadowServer
+
+
+CREDENTIALS = Credentials("AKIDEXAMPLE", "wJalrXUtnFEMI/K7MDENG+bPxRfiCYEXAMPLEKEY")
+
+
+class TestMqttCodec(unittest.TestCase):
+
+    def test_remaining_length(self):
+        """
+        Can encode the variable length integers of MQTT
+        """
+        msg = f"Should use 7 bits per byte with a continuation bit"
+
+        self.assertEqual(encode_remaining_length(0), b"\x00", msg)
+        self.assertEqual(encode_remaining_length(127), b"\x7f", msg)
+        self.assertEqual(encode_remaining_length(128), b"\x80\x01", msg)
+        self.assertEqual(encode_remaining_length(268435455), b"\xff\xff\xff\x7f", msg)
+
+    def test_packet_parser(self):
+        """
+        Can parse packets split across several WebSocket messages
+        """
+        msg = f"Should return each packet once it is complete"
+
+        payload = b"x" * 300
+        data = encode_publish("$aws/things/my-thing/shadow/update/delta", payload, 1, 7) + encode_subscribe(8, ["a/b"])
+        parser = PacketParser()
+
+        test = parser.feed(data[:5]) + parser.feed(data[5:200]) + parser.feed(data[200:])
+
+        self.assertEqual([packet[0] for packet in test], [PacketType.PUBLISH, PacketType.SUBSCRIBE], msg)
+        self.assertEqual(decode_publish(test[0][1], test[0][2]), ("$aws/things/my-thing/shadow/update/delta", 7, payload), msg)
+        self.assertEqual(test[1][1], 0x2, msg)
+
+    def test_topics(self):
+        """
+        Can build and parse the topics of classic and named shadows
+        """
+        msg = f"Should round trip the thing name, the shadow name and the operation"
+
+        self.assertEqual(get_shadow_topic("my-thing", None, "get"), "$aws/things/my-thing/shadow/get", msg)
+        self.assertEqual(parse_shadow_topic(get_shadow_topic("my-thing", "config", "update/delta")), ("my-thing", "config", "update/delta"), msg)
+        self.assertIsNone(parse_shadow_topic("my/topic"), msg)
+        self.assertTrue(match_topic("$aws/things/+/shadow/#", "$aws/things/my-thing/shadow/update/delta"), msg)
+        self.assertFalse(match_topic("$aws/things/+/shadow/get", "$aws/things/my-thing/shadow/get/accepted"), msg)
+
+    def test_presign_mqtt_url(self):
+        """
+        Can presign the URL of the broker with the session token out of the signature
+        """
+        msg = f"Should append X-Amz-Security-Token after X-Amz-Signature"
+
+        credentials = Credentials(CREDENTIALS.aws_access_key_id, CREDENTIALS.aws_secret_access_key, "my/session+token")
+
+        test = urlsplit(presign_mqtt_url(credentials, "eu-west-1", request_date_time="20260101T000000Z"))
+        query = parse_qs(test.query)
+
+        self.assertEqual((test.scheme, test.hostname, test.path), ("wss", "data-ats.iot.eu-west-1.amazonaws.com", "/mqtt"), msg)
+        self.assertIn("/iotdevicegateway/aws4_request", query["X-Amz-Credential"][0], msg)
+        self.assertTrue(test.query.endswith("&X-Amz-Security-Token=my%2Fsession%2Btoken"), msg)
+        self.assertEqual(query["X-Amz-Security-Token"], ["my/session+token"], msg)
+
+
+class TestShadowSubscriber(unittest.TestCase):
+
+    def setUp(self):
+        self.server = StubShadowServer(credentials={ CREDENTIALS.aws_access_key_id: CREDENTIALS.aws_secret_access_key }).start()
+        self.broker = StubShadowBroker(credentials=self.server.verifier.credentials, store=self.server.store).start()
+
+    def tearDown(self):
+        self.broker.stop()
+        self.server.stop()
+
+    def update(self, document, shadow_name=None):
+        with ShadowClient(CREDENTIALS, "eu-west-1", endpoint=self.server.endpoint) as client:
+            return client.update("my-thing", document, shadow_name)
+
+    def test_iterator(self):
+        """
+        Can receive the current document then the deltas of the updates made over HTTP
+        """
+        msg = f"Should deliver get/accepted on subscribe, then update/delta"
+
+        self.update({ "state": { "reported": { "color": "red" } } })
+
+        async def subscribe():
+            async with ShadowSubscriber(CREDENTIALS, endpoint=self.broker.endpoint, timeout=5) as subscriber:
+                await subscriber.subscribe("my-thing")
+                events = subscriber.__aiter__()
+                current = await asyncio.wait_for(events.__anext__(), 5)
+                await asyncio.to_thread(self.update, { "state": { "reported": { "size": 1 } } })
+                await asyncio.to_thread(self.update, { "state": { "desired": { "color": "blue" } } })
+                delta = await asyncio.wait_for(events.__anext__(), 5)
+                return current, delta
+
+        current, delta = asyncio.run(subscribe())
+
+        self.assertEqual(current.operation, "get/accepted", msg)
+        self.assertEqual(current.document["state"]["reported"], { "color": "red" }, msg)
+        self.assertEqual((delta.thing_name, delta.shadow_name, delta.operation), ("my-thing", None, "update/delta"), msg)
+        self.assertEqual(delta.document["state"], { "color": "blue" }, msg)
+        self.assertEqual(delta.document["version"], 3, msg)
+
+    def test_callback(self):
+        """
+        Can give the events of a named shadow to a callback
+        """
+        msg = f"Should call the callback for each delta, and survive a broken callback"
+
+        events = []
+
+        def callback(event):
+            events.append(event)
+            if len(events) == 1:
+                raise RuntimeError("Broken callback")
+
+        async def subscribe():
+            async with ShadowSubscriber(CREDENTIALS, endpoint=self.broker.endpoint, timeout=5, callback=callback) as subscriber:
+                await subscriber.subscribe("my-thing", "config", get_current=False)
+                for i in range(2):
+                    await asyncio.to_thread(self.update, { "state": { "desired": { "i": i } } }, "config")
+                for _ in range(50):
+                    if len(events) == 2:
+                        break
+                    await asyncio.sleep(0.05)
+                return subscriber.callback_errors
+
+        test = asyncio.run(subscribe())
+
+        self.assertEqual([event.document["state"] for event in events], [{ "i": 0 }, { "i": 1 }], msg)
+        self.assertEqual({ event.shadow_name for event in events }, { "config" }, msg)
+        self.assertEqual(test, 1, msg)
+
+    def test_wrong_credentials(self):
+        """
+        Can refuse a WebSocket whose URL is not signed with known credentials
+        """
+        msg = f"Should raise a ShadowSubscriptionError"
+
+        async def subscribe():
+            async with ShadowSubscriber(Credentials(CREDENTIALS.aws_access_key_id, "wrong"), endpoint=self.broker.endpoint, timeout=5):
+                pass
+
+        with self.assertRaises(ShadowSubscriptionError, msg=msg):
+            asyncio.run(subscribe())
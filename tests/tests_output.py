@@ -0,0 +1,120 @@
+import os
+import sys
+import gzip
+import json
+import tempfile
+import unittest
+import subprocess
+
+import aws_create_request
+
+from aws_create_request.output import ResponseOutput, format_response, format_result_line, is_single_line_json
+from aws_create_request.stub_server import StubShadowServer
+
+
+CONTENT = b'{"state":{"reported":{"name":"caf\\u00e9 \\"1\\"","tags":[1,2]}},"version":3}'
+
+
+class TestOutputFormats(unittest.TestCase):
+
+    def test_raw(self):
+        """
+        Can write the response unchanged
+        """
+        msg = f"Should return the same bytes"
+
+        self.assertIs(format_response(CONTENT, "raw"), CONTENT, msg)
+
+    def test_pretty_and_compact(self):
+        """
+        Can indent the response or write it on one line
+        """
+        msg = f"Should write the same document"
+
+        pretty = format_response(CONTENT, "pretty")
+        compact = format_response(b'{ "version" : 3 }', "compact")
+
+        self.assertIn(b'\n  "state": {', pretty, msg)
+        self.assertEqual(json.loads(pretty), json.loads(CONTENT), msg)
+        self.assertEqual(compact, b'{"version":3}\n', msg)
+        with self.assertRaises(ValueError, msg=msg):
+            format_response(CONTENT, "xml")
+
+    def test_ndjson(self):
+        """
+        Can write one line per response without decoding it
+        """
+        msg = f"Should append a new line, or compact a multi-line response"
+
+        self.assertEqual(format_response(CONTENT, "ndjson"), CONTENT + b"\n", msg)
+        self.assertEqual(format_response(b'{\n  "version": 3\n}', "ndjson"), b'{"version":3}\n', msg)
+
+    def test_is_single_line_json(self):
+        """
+        Can tell a JSON line from anything else without decoding it
+        """
+        msg = f"Should only accept one complete JSON object on one line"
+
+        self.assertTrue(is_single_line_json(CONTENT), msg)
+        self.assertFalse(is_single_line_json(b'{"a":1'), msg)
+        self.assertFalse(is_single_line_json(b'{"a":\n1}'), msg)
+        self.assertFalse(is_single_line_json(b'<html></html>'), msg)
+        self.assertFalse(is_single_line_json(b'{"a":tru}'), msg)
+        self.assertFalse(is_single_line_json(b'{"a":1,}'), msg)
+        self.assertFalse(is_single_line_json(b'{"a":NaN}'), msg)
+
+    def test_result_line(self):
+        """
+        Can insert the response in the line of a result
+        """
+        msg = f"Should write a valid JSON line with the response"
+
+        result = { "thing_name": "my-thing", "status_code": 200 }
+
+        test = json.loads(format_result_line(result, CONTENT))
+        not_json = json.loads(format_result_line(result, b"Internal error"))
+
+        self.assertEqual(test, { **result, "response": json.loads(CONTENT) }, msg)
+        self.assertEqual(not_json["response"], "Internal error", msg)
+
+        # Structurally balanced but invalid, or not UTF-8 : still a valid line, the response as a string
+        for content in (b'{"a":tru}', b'{"a":1,}', b'{"a":"\xff"}'):
+            invalid = json.loads(format_result_line(result, content))
+            self.assertEqual(invalid["response"], content.decode("utf-8", errors="replace"), msg)
+        self.assertEqual(format_result_line(result), json.dumps(result, separators=(",", ":")) + "\n", msg)
+
+    def test_gzip(self):
+        """
+        Can write the responses in a gzip file
+        """
+        msg = f"Should compress the bytes written"
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "responses.ndjson.gz")
+            with ResponseOutput(path) as output:
+                output.write(format_response(CONTENT, "ndjson"))
+                output.write(format_response(CONTENT, "ndjson"))
+
+            with gzip.open(path, "rb") as responses:
+                test = responses.read()
+
+        self.assertEqual(test, (CONTENT + b"\n") * 2, msg)
+
+    def test_command_line(self):
+        """
+        Can run the console script of the command line
+        """
+        msg = f"Should write the response on the standard output only, and exit with the code 0"
+
+        with StubShadowServer(credentials={ "AKID": "SECRET" }) as server:
+            # As the wrapper of the 'aws_shadows' console script
+            test = subprocess.run(
+                [sys.executable, "-c", "import sys; from aws_create_request import main; sys.exit(main())",
+                 "-t", "my-thing", "-m", "GET", "-a", "AKID", "-k", "SECRET", "-e", server.endpoint, "-o", "compact"],
+                capture_output=True,
+                env={ **os.environ, "PYTHONPATH": os.path.dirname(os.path.dirname(aws_create_request.__file__)) }
+            )
+
+        self.assertEqual(test.returncode, 0, msg)
+        self.assertEqual(test.stderr, b"", msg)
+        self.assertIn("message", json.loads(test.stdout), msg)
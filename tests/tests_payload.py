@@ -0,0 +1,192 @@
+import io
+import os
+import json
+import hashlib
+import tempfile
+import unittest
+
+from aws_create_request.app import CreateRequest, Credentials
+from aws_create_request.payload import StateDocumentValidator, StatePayload, check_state_payload, encode_shadow_document, read_state_document
+
+
+class TestStateDocumentValidator(unittest.TestCase):
+
+    def feed(self, document: bytes, chunk_size: int) -> StateDocumentValidator:
+        validator = StateDocumentValidator()
+        for offset in range(0, len(document), chunk_size):
+            validator.feed(memoryview(document)[offset:offset + chunk_size])
+        validator.close()
+        return validator
+
+    def test_valid_documents(self):
+        """
+        Can validate state documents whatever the size of the chunks
+        """
+        msg = f"Should accept the document and measure its depth"
+
+        documents = [
+            (b'{}', 1),
+            (b' \n{"state": {"reported": {"on": true}}}\n', 3),
+            (b'{"state": {"desired": {"list": [1, [2, {"a": null}]]}}}', 6),
+            (b'{"state": {"reported": {"quote": "a \\" }", "backslash": "\\\\", "brace": "{["}}}', 3),
+        ]
+
+        for document, depth in documents:
+            for chunk_size in [1, 2, 3, 7, 64]:
+                with self.subTest(document=document, chunk_size=chunk_size):
+                    self.assertEqual(self.feed(document, chunk_size).max_depth, depth, msg)
+
+    def test_invalid_documents(self):
+        """
+        Can't validate a malformed state document
+        """
+        msg = f"Should raise a ValueError exception"
+
+        documents = [
+            b'',
+            b'[]',
+            b'"state"',
+            b'{"state": {"reported": {}}',
+            b'{"state": {"reported": {]}}',
+            b'{"state": "not terminated}',
+            b'{} {}',
+            b'{}x',
+            b'{"a": \\n}',
+        ]
+
+        for document in documents:
+            for chunk_size in [1, 3, 64]:
+                with self.subTest(document=document, chunk_size=chunk_size):
+                    with self.assertRaises(ValueError, msg=msg):
+                        self.feed(document, chunk_size)
+
+
+class TestReadStateDocument(unittest.TestCase):
+
+    document = b'{"state": {"reported": {"temperature": 21.5, "name": "caf\\u00e9"}}}'
+
+    def test_read_file(self):
+        """
+        Can read and hash a state document from a path
+        """
+        msg = f"Should memory-map the file and hash it while reading it"
+
+        with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as state_document:
+            state_document.write(self.document)
+
+        try:
+            test = read_state_document(state_document.name, chunk_size=8)
+
+            self.assertIsInstance(test, StatePayload, msg)
+            self.assertEqual(bytes(test.body), self.document, msg)
+            self.assertEqual(test.hashed_payload, hashlib.sha256(self.document).hexdigest(), msg)
+            test.close()
+        finally:
+            os.remove(state_document.name)
+
+    def test_read_pipe(self):
+        """
+        Can read and hash a state document from a stream
+        """
+        msg = f"Should read the stream chunk by chunk"
+
+        test = read_state_document(io.BufferedReader(io.BytesIO(self.document)), chunk_size=8)
+
+        self.assertEqual(bytes(test.body), self.document, msg)
+        self.assertEqual(test.hashed_payload, hashlib.sha256(self.document).hexdigest(), msg)
+        self.assertEqual(test.max_depth, 3, msg)
+
+    def test_read_missing_file(self):
+        """
+        Can't read a state document which does not exist
+        """
+        msg = f"Should raise a FileNotFoundError exception"
+
+        with self.assertRaises(FileNotFoundError, msg=msg):
+            read_state_document("missing_state_document.json")
+
+    def test_sign_streamed_payload(self):
+        """
+        Can sign a streamed state document like the same string payload
+        """
+        msg = f"Should use the hash computed while reading"
+
+        streamed = CreateRequest()
+        streamed.set_context_request("my-thing", "update", Credentials("key_id", "secret"), "eu-west-1", payload=read_state_document(io.BytesIO(self.document)))
+        streamed.generate_authorization()
+
+        expected = CreateRequest()
+        expected.set_context_request("my-thing", "update", Credentials("key_id", "secret"), "eu-west-1", payload=self.document.decode("utf-8"))
+        expected.generate_authorization()
+
+        self.assertEqual(streamed.canonical_request.hashed_payload, expected.canonical_request.hashed_payload, msg)
+        self.assertEqual(bytes(streamed.prepare_request()[4]), self.document, msg)
+
+
+
+if __name__.__eq__("__main__"):
+    unittest.main()
+    print("All tests passed successfully")
+
+
+class TestEncodeShadowDocument(unittest.TestCase):
+
+    def test_encode(self):
+        """
+        Can encode a state document in compact canonical JSON
+        """
+        msg = f"Should sort the keys, drop the whitespace and keep apostrophes and UTF-8 as they are"
+
+        document = { "version": 3, "state": { "reported": { "name": "l'atelier", "b": [1, None], "a": "é" }, "desired": None } }
+
+        test = encode_shadow_document(document)
+
+        self.assertEqual(test, '{"state":{"desired":null,"reported":{"a":"é","b":[1,null],"name":"l\'atelier"}},"version":3}', msg)
+        self.assertEqual(json.loads(test), document, msg)
+        self.assertEqual(encode_shadow_document(json.loads(test)), test, msg)
+
+    def test_limits(self):
+        """
+        Can refuse a document which breaks the quotas of the shadow service
+        """
+        msg = f"Should raise ValueError before the document is signed"
+
+        deep = { "a": 1 }
+        for _ in range(8):
+            deep = { "a": deep }
+        invalid_documents = [
+            [],
+            { "reported": {} },
+            { "state": { "delta": {} } },
+            { "state": { "reported": [] } },
+            { "state": {}, "version": "3" },
+            { "state": {}, "clientToken": "x" * 65 },
+            { "state": { "reported": deep } },
+            { "state": { "reported": { "a": float("nan") } } },
+            { "state": { "reported": { "a": "x" * 8192 } } },
+        ]
+
+        for document in invalid_documents:
+            with self.subTest(document=str(document)[:40]):
+                with self.assertRaises(ValueError, msg=msg):
+                    encode_shadow_document(document)
+
+        self.assertEqual(encode_shadow_document({ "state": { "reported": deep["a"] } }).count("{"), 10, msg)
+        self.assertEqual(encode_shadow_document({ "state": None }), '{"state":null}', msg)
+
+    def test_check_file(self):
+        """
+        Can check a state document read from a file, measured without its whitespace
+        """
+        msg = f"Should accept an indented document whose compact form fits, refuse a deep one without decoding it, and check the keys of a small or large one"
+
+        indented = json.dumps({ "state": { "reported": { f"key-{i}": i for i in range(400) } } }, indent=8).encode("utf-8")
+        self.assertGreater(len(indented), 8192, msg)
+        check_state_payload(read_state_document(io.BytesIO(indented)))
+
+        with self.assertRaises(ValueError, msg=msg):
+            check_state_payload(read_state_document(io.BytesIO(b'{"state":{"reported":' + b'[' * 9 + b']' * 9 + b'}}')))
+        check_state_payload(read_state_document(io.BytesIO(b'{"state":{"reported":' + b'{"a":' * 7 + b'[]' + b'}' * 7 + b'}}')))
+        for invalid in (b'{"state":{"delta":{}}}', b'{"foo":1,"state":{"bogus":[1]},"version":"x"}', b'{"state":{"reported":[1]}}', indented.replace(b'"reported"', b'"delta"')):
+            with self.assertRaises(ValueError, msg=msg):
+                check_state_payload(read_state_document(io.BytesIO(invalid)))
@@ -0,0 +1,111 @@
+import hmac
+import json
+import hashlib
+import unittest
+
+from urllib.parse import urlsplit, parse_qsl, quote
+
+from aws_create_request.app import Credentials
+from aws_create_request.presign import presign_url, presign_urls
+from aws_create_request.string_to_sign import SigningKeyCache, derive_signing_key
+
+
+class TestPresign(unittest.TestCase):
+
+    credentials = Credentials("AKIDEXAMPLE", "wJalrXUtnFEMI/K7MDENG+bPxRfiCYEXAMPLEKEY")
+
+    def verify(self, url: str, method: str, hashed_payload: str = hashlib.sha256(b"").hexdigest()) -> bool:
+        parts = urlsplit(url)
+        query = dict(parse_qsl(parts.query))
+        signature = query.pop("X-Amz-Signature")
+
+        canonical_query_string = "&".join(f"{quote(key, safe='-_.~')}={quote(value, safe='-_.~')}" for key, value in sorted(query.items()))
+        canonical_request = "\n".join([method, parts.path, canonical_query_string, f"host:{parts.hostname}", "", "host", hashed_payload])
+        date, region, service, _ = query["X-Amz-Credential"].split("/", 1)[1].split("/")
+        string_to_sign = "\n".join([
+            "AWS4-HMAC-SHA256",
+            query["X-Amz-Date"],
+            f"{date}/{region}/{service}/aws4_request",
+            hashlib.sha256(canonical_request.encode("utf-8")).hexdigest()
+        ])
+        expected = hmac.new(derive_signing_key(self.credentials.aws_secret_access_key, date, region, service), string_to_sign.encode("utf-8"), hashlib.sha256).hexdigest()
+
+        return hmac.compare_digest(signature, expected)
+
+    def test_presign_get(self):
+        """
+        Can presign the URL of a shadow GET
+        """
+        msg = f"Should sign the URL in its query string"
+
+        test = presign_url(self.credentials, "eu-west-1", "get", "my-thing", "config", expires=60, request_date_time="20230109T092953Z")
+        query = dict(parse_qsl(urlsplit(test).query))
+
+        self.assertTrue(test.startswith("https://data-ats.iot.eu-west-1.amazonaws.com/things/my-thing/shadow?"), msg)
+        self.assertEqual(query["name"], "config", msg)
+        self.assertEqual(query["X-Amz-Credential"], "AKIDEXAMPLE/20230109/eu-west-1/iotdata/aws4_request", msg)
+        self.assertEqual(query["X-Amz-Expires"], "60", msg)
+        self.assertEqual(query["X-Amz-SignedHeaders"], "host", msg)
+        self.assertTrue(self.verify(test, "GET"), msg)
+
+    def test_presign_update(self):
+        """
+        Can presign the URL of a shadow UPDATE for one payload
+        """
+        msg = f"Should sign the hash of the payload"
+
+        payload = '{"state":{"reported":{"on":true}}}'
+
+        test = presign_url(self.credentials, "eu-west-1", "update", "my-thing", payload=payload)
+
+        self.assertTrue(self.verify(test, "POST", hashlib.sha256(payload.encode("utf-8")).hexdigest()), msg)
+        self.assertFalse(self.verify(test, "POST"), msg)
+
+    def test_bad_expires(self):
+        """
+        Can't presign a URL valid for more than 7 days
+        """
+        msg = f"Should raise a ValueError exception"
+
+        with self.assertRaises(ValueError, msg=msg):
+            presign_url(self.credentials, "eu-west-1", "get", "my-thing", expires=7 * 24 * 60 * 60 + 1)
+
+    def test_bulk(self):
+        """
+        Can presign the URLs of many things deriving the signing key once
+        """
+        msg = f"Should return one valid URL per thing, in order"
+
+        key_cache = SigningKeyCache()
+        things = [f"thing-{i}" for i in range(50)] + [("thing-50", "config")]
+
+        test = presign_urls(self.credentials, "eu-west-1", "delete", things, key_cache=key_cache)
+
+        self.assertEqual(len(test), 51, msg)
+        self.assertIn("/things/thing-3/shadow?", test[3], msg)
+        self.assertIn("name=config", test[50], msg)
+        self.assertTrue(all(self.verify(url, "DELETE") for url in test), msg)
+        self.assertEqual(key_cache.get_stats()["misses"], 1, msg)
+
+    def test_bulk_update(self):
+        """
+        Can presign the UPDATE URLs of many things, each with its payload
+        """
+        msg = f"Should sign each URL with the hash of its payload, and refuse an UPDATE without payload"
+
+        payloads = [json.dumps({ "state": { "desired": { "i": i } } }) for i in range(3)]
+
+        test = presign_urls(self.credentials, "eu-west-1", "update", [(f"thing-{i}", None, payload) for i, payload in enumerate(payloads)])
+
+        self.assertTrue(all(self.verify(url, "POST", hashlib.sha256(payload.encode("utf-8")).hexdigest()) for url, payload in zip(test, payloads)), msg)
+        self.assertFalse(self.verify(test[0], "POST", hashlib.sha256(payloads[1].encode("utf-8")).hexdigest()), msg)
+        with self.assertRaises(ValueError, msg=msg):
+            presign_urls(self.credentials, "eu-west-1", "update", ["thing-1"])
+        with self.assertRaises(ValueError, msg=msg):
+            presign_urls(self.credentials, "eu-west-1", "update", [("thing-1", "config")])
+
+
+
+if __name__.__eq__("__main__"):
+    unittest.main()
+    print("All tests passed successfully")
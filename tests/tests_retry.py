@@ -0,0 +1,195 @@
+import ssl
+import time
+import unittest
+
+from aws_create_request.app import Credentials
+from aws_create_request.client import ShadowClient
+from aws_create_request.ratelimit import RateLimiter, TokenBucket
+from aws_create_request.retry import RetryPolicy
+from aws_create_request.stub_server import StubShadowServer
+from aws_create_request.transport import Transport, TransportResponse
+
+
+CREDENTIALS = Credentials("AKIDEXAMPLE", "wJalrXUtnFEMI/K7MDENG+bPxRfiCYEXAMPLEKEY")
+
+
+class ScriptedTransport(Transport):
+    """Answer each request with the next status of a script, or raise it if it is an exception"""
+
+    def __init__(self, script: list) -> None:
+        self.script = list(script)
+        self.requests = []
+
+    def request(self, method, host, path, headers, body=b""):
+        self.requests.append(headers)
+        answer = self.script.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        if isinstance(answer, TransportResponse):
+            return answer
+        return TransportResponse(answer, { "Retry-After": "0" } if answer == 429 else {}, b"{}")
+
+
+class CountingShadowClient(ShadowClient):
+
+    signatures = 0
+
+    def sign(self, *args, **kwargs):
+        self.signatures += 1
+        return super().sign(*args, **kwargs)
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    def test_rate(self):
+        """
+        Can pace the requests at the rate of the bucket once the burst is spent
+        """
+        msg = f"Should wait 1 / rate between two requests"
+
+        bucket = TokenBucket(rate=50, burst=5)
+        start = time.monotonic()
+        waits = [bucket.acquire() for _ in range(15)]
+        test = time.monotonic() - start
+
+        self.assertEqual(waits[:5], [0.0] * 5, msg)
+        self.assertGreater(test, 0.18, msg)
+        self.assertLess(test, 0.5, msg)
+
+    def test_try_acquire(self):
+        """
+        Can refuse a request without waiting
+        """
+        msg = f"Should refuse once the burst is spent, and stop bursting after drain"
+
+        bucket = TokenBucket(rate=1, burst=2)
+
+        self.assertEqual([bucket.try_acquire() for _ in range(3)], [True, True, False], msg)
+
+        bucket = TokenBucket(rate=1, burst=2)
+        bucket.drain()
+
+        self.assertFalse(bucket.try_acquire(), msg)
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def test_per_thing(self):
+        """
+        Can limit each thing apart from the others
+        """
+        msg = f"Should only make the busy thing wait"
+
+        limiter = RateLimiter(thing_rate=10, thing_burst=1, max_things=2)
+
+        self.assertEqual(limiter.reserve("thing-1"), 0.0, msg)
+        self.assertGreater(limiter.reserve("thing-1"), 0.05, msg)
+        self.assertEqual(limiter.reserve("thing-2"), 0.0, msg)
+
+        limiter.reserve("thing-3")
+        self.assertEqual(limiter.reserve("thing-1"), 0.0, msg)
+
+
+class TestRetryPolicy(unittest.TestCase):
+
+    def test_delays(self):
+        """
+        Can draw the delays with decorrelated jitter
+        """
+        msg = f"Should draw max_attempts - 1 delays between base_delay and max_delay"
+
+        test = list(RetryPolicy(max_attempts=50, base_delay=0.01, max_delay=1.0, seed=1).get_delays())
+
+        self.assertEqual(len(test), 49, msg)
+        self.assertTrue(all(0.01 <= delay <= 1.0 for delay in test), msg)
+        self.assertEqual(max(test), 1.0, msg)
+
+    def test_retry_statuses_and_errors(self):
+        """
+        Can retry the throttled requests, the server errors and the connection errors
+        """
+        msg = f"Should sign each attempt again and return the first final response"
+
+        transport = ScriptedTransport([429, ConnectionResetError(), 503, 404])
+        limiter = RateLimiter(rate=1000)
+        client = CountingShadowClient(CREDENTIALS, "eu-west-1", transport=transport, rate_limiter=limiter, retry_policy=RetryPolicy(base_delay=0.001, seed=1))
+
+        test = client.get("my-thing")
+
+        self.assertEqual(test.status_code, 404, msg)
+        self.assertEqual(client.signatures, 4, msg)
+        self.assertEqual(client.retry_policy.retries, 3, msg)
+        self.assertTrue(all("X-Amz-Date" in headers for headers in transport.requests), msg)
+
+    def test_give_up(self):
+        """
+        Can give up after max_attempts
+        """
+        msg = f"Should return the last response, or raise the last error"
+
+        client = ShadowClient(CREDENTIALS, "eu-west-1", transport=ScriptedTransport([500, 500]), retry_policy=RetryPolicy(max_attempts=2, base_delay=0.001))
+        self.assertEqual(client.get("my-thing").status_code, 500, msg)
+        self.assertEqual(client.retry_policy.exhausted, 1, msg)
+
+        client = ShadowClient(CREDENTIALS, "eu-west-1", transport=ScriptedTransport([TimeoutError(), TimeoutError()]), retry_policy=RetryPolicy(max_attempts=2, base_delay=0.001))
+        with self.assertRaises(TimeoutError, msg=msg):
+            client.get("my-thing")
+
+        client = ShadowClient(CREDENTIALS, "eu-west-1", transport=ScriptedTransport([503, 200]), retry_policy=RetryPolicy(base_delay=1.0, timeout=0.5))
+        self.assertEqual(client.get("my-thing").status_code, 503, msg)
+
+    def test_unsafe_errors(self):
+        """
+        Can retry an UPDATE only when its request was never sent, and never a certificate error
+        """
+        msg = f"Should raise the error of an UPDATE which may have been applied, and of a certificate, without a second attempt"
+
+        update = { "state": { "reported": { "on": True } } }
+        policy = RetryPolicy(base_delay=0.001)
+
+        transport = ScriptedTransport([ConnectionResetError(), 200])
+        with self.assertRaises(ConnectionResetError, msg=msg):
+            ShadowClient(CREDENTIALS, "eu-west-1", transport=transport, retry_policy=policy).update("my-thing", update)
+        self.assertEqual(len(transport.requests), 1, msg)
+
+        transport = ScriptedTransport([ConnectionRefusedError(), 200])
+        self.assertEqual(ShadowClient(CREDENTIALS, "eu-west-1", transport=transport, retry_policy=policy).update("my-thing", update).status_code, 200, msg)
+
+        transport = ScriptedTransport([ConnectionResetError(), 200])
+        self.assertEqual(ShadowClient(CREDENTIALS, "eu-west-1", transport=transport, retry_policy=policy).delete("my-thing").status_code, 200, msg)
+
+        transport = ScriptedTransport([ssl.SSLCertVerificationError(), 200])
+        with self.assertRaises(ssl.SSLCertVerificationError, msg=msg):
+            ShadowClient(CREDENTIALS, "eu-west-1", transport=transport, retry_policy=policy).get("my-thing")
+        self.assertEqual(len(transport.requests), 1, msg)
+
+    def test_retry_after(self):
+        """
+        Can wait as long as the server asks, or give up when it asks for more than max_delay
+        """
+        msg = f"Should wait the Retry-After of the server, and return the throttled response when it is too long"
+
+        transport = ScriptedTransport([TransportResponse(429, { "Retry-After": "0.2" }, b"{}"), 200])
+        client = ShadowClient(CREDENTIALS, "eu-west-1", transport=transport, retry_policy=RetryPolicy(base_delay=0.001, max_delay=1.0))
+        started_at = time.monotonic()
+        self.assertEqual(client.get("my-thing").status_code, 200, msg)
+        self.assertGreaterEqual(time.monotonic() - started_at, 0.2, msg)
+
+        transport = ScriptedTransport([TransportResponse(429, { "Retry-After": "30" }, b"{}"), 200])
+        client = ShadowClient(CREDENTIALS, "eu-west-1", transport=transport, retry_policy=RetryPolicy(base_delay=0.001, max_delay=1.0))
+        self.assertEqual(client.get("my-thing").status_code, 429, msg)
+        self.assertEqual((len(transport.requests), client.retry_policy.exhausted), (1, 1), msg)
+
+    def test_against_faulty_server(self):
+        """
+        Can get through a server which fails one request out of two
+        """
+        msg = f"Should succeed with valid signatures on every retry"
+
+        with StubShadowServer(credentials={ CREDENTIALS.aws_access_key_id: CREDENTIALS.aws_secret_access_key }, error_rate=0.5, seed=3) as server:
+            with ShadowClient(CREDENTIALS, "eu-west-1", endpoint=server.endpoint, retry_policy=RetryPolicy(max_attempts=20, base_delay=0.001, max_delay=0.01)) as client:
+                test = [client.update(f"thing-{i}", { "state": { "reported": { "i": i } } }).status_code for i in range(10)]
+
+            self.assertEqual(test, [200] * 10, msg)
+            self.assertGreater(server.status_codes.get(500, 0), 0, msg)
+            self.assertNotIn(403, server.status_codes, msg)
@@ -0,0 +1,154 @@
+import os
+import sys
+import json
+import tempfile
+import unittest
+import subprocess
+
+import aws_create_request
+
+from aws_create_request.app import Credentials
+from aws_create_request.client import ShadowClient
+from aws_create_request.snapshot import FleetSnapshot
+from aws_create_request.stub_server import StubShadowServer
+from aws_create_request.transport import Transport
+
+
+CREDENTIALS = Credentials("AKIDEXAMPLE", "wJalrXUtnFEMI/K7MDENG+bPxRfiCYEXAMPLEKEY")
+
+
+class FailingTransport(Transport):
+
+    def request(self, method, host, path, headers, body=b""):
+        raise ConnectionResetError()
+
+
+class TestFleetSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.server = StubShadowServer(credentials={ CREDENTIALS.aws_access_key_id: CREDENTIALS.aws_secret_access_key }).start()
+        self.client = ShadowClient(CREDENTIALS, "eu-west-1", endpoint=self.server.endpoint)
+        self.directory = tempfile.TemporaryDirectory()
+        self.snapshot = FleetSnapshot(self.directory.name)
+
+        self.thing_names = [f"thing-{i}" for i in range(20)]
+        for thing_name in self.thing_names:
+            self.client.update(thing_name, { "state": { "reported": { "temperature": 20 } } })
+        self.client.update("thing-0", { "state": { "desired": { "color": "red" } } }, "config")
+
+    def tearDown(self):
+        self.snapshot.close()
+        self.directory.cleanup()
+        self.client.close()
+        self.server.stop()
+
+    def test_incremental(self):
+        """
+        Can store only the shadows whose version changed since the last snapshot
+        """
+        msg = f"Should store every shadow at first, then append only the changed ones to the data file"
+
+        first = self.snapshot.update(self.client, self.thing_names, named=True, max_workers=4)
+        size = os.path.getsize(self.snapshot.data_path)
+
+        self.client.update("thing-3", { "state": { "reported": { "temperature": 21 } } })
+        test = self.snapshot.update(self.client, self.thing_names, named=True, max_workers=4)
+
+        self.assertEqual(first, { "stored": 21, "unchanged": 0, "missing": 0, "failed": 0, "shadows": 21 }, msg)
+        self.assertEqual(test, { "stored": 1, "unchanged": 20, "missing": 0, "failed": 0, "shadows": 21 }, msg)
+        self.assertEqual(os.path.getsize(self.snapshot.data_path), size + len(self.snapshot.get_line("thing-3")), msg)
+        self.assertEqual(len(self.snapshot), 21, msg)
+
+    def test_lookup(self):
+        """
+        Can read a stored document through the index
+        """
+        msg = f"Should give the last stored document and its version, and None for an unknown shadow"
+
+        self.snapshot.update(self.client, self.thing_names, named=True)
+        self.client.update("thing-5", { "state": { "reported": { "temperature": 25 } } })
+        self.snapshot.update(self.client, self.thing_names, named=True)
+
+        test = self.snapshot.get("thing-5")
+
+        self.assertEqual(test["state"]["reported"], { "temperature": 25 }, msg)
+        self.assertEqual(self.snapshot.get_version("thing-5"), 2, msg)
+        self.assertEqual(self.snapshot.get("thing-0", "config")["state"]["desired"], { "color": "red" }, msg)
+        self.assertIsNone(self.snapshot.get("thing-0", "unknown"), msg)
+        self.assertIsNone(self.snapshot.get_version("unknown-thing"), msg)
+
+        # Lookups of another process only read the files
+        with FleetSnapshot(self.directory.name) as other:
+            self.assertEqual(other.get("thing-5"), test, msg)
+
+    def test_missing_and_failed(self):
+        """
+        Can drop a deleted shadow from the index and keep the document of a failed one
+        """
+        msg = f"Should count the deleted shadow as missing, and the failed GETs as failed without changing the index"
+
+        self.snapshot.update(self.client, self.thing_names)
+        self.client.delete("thing-1")
+        test = self.snapshot.update(self.client, self.thing_names)
+
+        self.assertEqual(test["missing"], 1, msg)
+        self.assertIsNone(self.snapshot.get("thing-1"), msg)
+
+        with ShadowClient(CREDENTIALS, "eu-west-1", transport=FailingTransport()) as failing_client:
+            test = self.snapshot.update(failing_client, ["thing-2", "thing-3"])
+
+        self.assertEqual(test, { "stored": 0, "unchanged": 0, "missing": 0, "failed": 2, "shadows": 2 }, msg)
+        self.assertEqual(self.snapshot.get_version("thing-2"), 1, msg)
+
+    def test_removed(self):
+        """
+        Can drop the shadows which are no longer listed, and keep those of a thing whose listing failed
+        """
+        msg = f"Should only index the shadows of the run, and the previous named shadows of a thing which could not be listed"
+
+        self.client.update("thing-0", { "state": { "desired": { "color": "blue" } } }, "lights")
+        self.snapshot.update(self.client, self.thing_names, named=True)
+
+        self.client.delete("thing-0", "config")
+        test = self.snapshot.update(self.client, self.thing_names[:10], named=True)
+
+        self.assertEqual(test["shadows"], 11, msg)
+        self.assertIsNone(self.snapshot.get("thing-0", "config"), msg)
+        self.assertIsNone(self.snapshot.get("thing-15"), msg)
+        self.assertEqual(self.snapshot.get("thing-0", "lights")["state"]["desired"], { "color": "blue" }, msg)
+
+        class UnlistingShadowClient(ShadowClient):
+            def list_named_shadows(self, thing_name, page_size=None):
+                raise ConnectionResetError()
+
+        with UnlistingShadowClient(CREDENTIALS, "eu-west-1", endpoint=self.server.endpoint) as unlisting_client:
+            test = self.snapshot.update(unlisting_client, ["thing-0"], named=True)
+
+        self.assertEqual(test, { "stored": 0, "unchanged": 1, "missing": 0, "failed": 1, "shadows": 2 }, msg)
+        self.assertEqual(self.snapshot.get_version("thing-0", "lights"), 1, msg)
+
+    def test_command_line(self):
+        """
+        Can take a snapshot and look up a shadow from the command line
+        """
+        msg = f"Should exit with the code 0, with the JSON summary on the standard error and the document on the standard output"
+
+        things_path = os.path.join(self.directory.name, "things.txt")
+        with open(things_path, "w") as things:
+            things.write("\n".join(self.thing_names[:3]) + "\n")
+
+        # As the wrapper of the 'aws_shadows_snapshot' console script
+        run = lambda *args: subprocess.run(
+            [sys.executable, "-c", "import sys; from aws_create_request.snapshot import main; sys.exit(main())", "-d", os.path.join(self.directory.name, "cli"), *args],
+            capture_output=True,
+            text=True,
+            env={ **os.environ, "PYTHONPATH": os.path.dirname(os.path.dirname(aws_create_request.__file__)) }
+        )
+
+        snapshot = run("-f", things_path, "-a", CREDENTIALS.aws_access_key_id, "-k", CREDENTIALS.aws_secret_access_key, "-e", self.server.endpoint)
+        lookup = run("-l", "thing-1")
+
+        self.assertEqual(snapshot.returncode, 0, msg)
+        self.assertEqual(json.loads(snapshot.stderr)["stored"], 3, msg)
+        self.assertEqual(lookup.returncode, 0, msg)
+        self.assertEqual(json.loads(lookup.stdout)["state"]["reported"], { "temperature": 20 }, msg)
@@ -0,0 +1,114 @@
+import unittest
+import hmac
+import hashlib
+import datetime
+
+from aws_create_request.string_to_sign import StringToSign, SigningKeyCache, derive_signing_key
+
+class TestSigningKeyCache(unittest.TestCase):
+
+    def test_derive_signing_key(self):
+        """
+        Can derive the signing key following the AWS documentation example
+        """
+        msg = f"Should match the signing key of the AWS documentation"
+
+        # https://docs.aws.amazon.com/general/latest/gr/sigv4-calculate-signature.html
+        expected_result = "c4afb1cc5771d871763a393e44b703571b55cc28424d1a5e86da6ed3c154a4b9"
+
+        test = derive_signing_key("wJalrXUtnFEMI/K7MDENG+bPxRfiCYEXAMPLEKEY", "20150830", "us-east-1", "iam")
+
+        self.assertEqual(test.hex(), expected_result, msg)
+
+    def test_hit_and_miss(self):
+        """
+        Can count hits and misses of the signing key cache
+        """
+        msg = f"Should derive the key once and then serve it from the cache"
+
+        test = SigningKeyCache()
+
+        first_key = test.get_signing_key("secret", "20230109", "eu-west-1", "iotdata")
+        second_key = test.get_signing_key("secret", "20230109", "eu-west-1", "iotdata")
+
+        self.assertEqual(first_key, second_key, msg)
+        self.assertEqual(test.get_stats()["misses"], 1, msg)
+        self.assertEqual(test.get_stats()["hits"], 1, msg)
+
+    def test_keyed_per_credential_region_service(self):
+        """
+        Can keep one signing key per credential, region and service
+        """
+        msg = f"Should not share a key between credentials, regions or services"
+
+        test = SigningKeyCache()
+
+        keys = {
+            test.get_signing_key("secret", "20230109", "eu-west-1", "iotdata"),
+            test.get_signing_key("other_secret", "20230109", "eu-west-1", "iotdata"),
+            test.get_signing_key("secret", "20230109", "us-east-1", "iotdata"),
+            test.get_signing_key("secret", "20230109", "eu-west-1", "iotdevicegateway"),
+        }
+
+        self.assertEqual(len(keys), 4, msg)
+        self.assertEqual(test.get_stats()["size"], 4, msg)
+        self.assertEqual(test.get_stats()["hits"], 0, msg)
+
+    def test_expire_at_utc_midnight(self):
+        """
+        Can evict the keys of the previous UTC day
+        """
+        msg = f"Should derive a new key and evict the old one once the day changes"
+
+        test = SigningKeyCache()
+
+        old_key = test.get_signing_key("secret", "20230109", "eu-west-1", "iotdata")
+        new_key = test.get_signing_key("secret", "20230110", "eu-west-1", "iotdata")
+
+        self.assertNotEqual(old_key, new_key, msg)
+        self.assertEqual(test.get_stats()["misses"], 2, msg)
+        self.assertEqual(test.get_stats()["size"], 1, msg)
+
+    def test_purge_expired(self):
+        """
+        Can purge the keys of a previous UTC day without a new request
+        """
+        msg = f"Should empty the cache after UTC midnight"
+
+        test = SigningKeyCache()
+        test.get_signing_key("secret", "20230109", "eu-west-1", "iotdata")
+        test.purge_expired(datetime.datetime(2023, 1, 10, 0, 0, 1, tzinfo=datetime.timezone.utc))
+
+        self.assertEqual(test.get_stats()["size"], 0, msg)
+        self.assertEqual(test.get_stats()["evictions"], 1, msg)
+
+
+class TestStringToSign(unittest.TestCase):
+
+    def test_cached_signature(self):
+        """
+        Can calculate the same signature with or without a cached signing key
+        """
+        msg = f"Should give the signature of the complete HMAC chain"
+
+        test = StringToSign()
+        test.algorithm = "AWS4-HMAC-SHA256"
+        test.request_date_time = "20230109T092953Z"
+        test.credential_scope = "20230109/eu-west-1/iotdata/aws4_request"
+        test.hashed_canonical_request = "bf90448c05591761ce8f87bcd848604e6ccd81a7b7b8d4df0dd02b4db7b158d7"
+
+        string_to_sign = "\n".join([test.algorithm, test.request_date_time, test.credential_scope, test.hashed_canonical_request])
+        k_signing = derive_signing_key("secret", "20230109", "eu-west-1", "iotdata")
+        expected_result = hmac.new(k_signing, string_to_sign.encode("utf-8"), hashlib.sha256).hexdigest()
+
+        key_cache = SigningKeyCache()
+
+        self.assertEqual(test.calculate_signature("secret", key_cache), expected_result, msg)
+        self.assertEqual(test.calculate_signature("secret", key_cache), expected_result, msg)
+        self.assertEqual(key_cache.get_stats()["hits"], 1, msg)
+
+
+
+if __name__.__eq__("__main__"):
+    unittest.main()
+    print("All tests passed successfully")
@@ -0,0 +1,170 @@
+import json
+import unittest
+import urllib.request
+import urllib.error
+
+from urllib.parse import urlsplit
+
+from aws_create_request.app import Credentials
+from aws_create_request.client import ShadowClient, sign_request
+from aws_create_request.presign import presign_url
+from aws_create_request.stub_server import ShadowStore, StubShadowServer, compute_shadow_delta
+
+
+CREDENTIALS = Credentials("AKIDEXAMPLE", "wJalrXUtnFEMI/K7MDENG+bPxRfiCYEXAMPLEKEY")
+
+
+class TestShadowStore(unittest.TestCase):
+
+    def test_shadow_semantics(self):
+        """
+        Can merge the states of a shadow like the service
+        """
+        msg = f"Should merge the states, count the versions and compute the delta"
+
+        store = ShadowStore()
+
+        self.assertEqual(store.get("my-thing")[0], 404, msg)
+
+        status_code, test = store.update("my-thing", b'{"state":{"desired":{"led":{"on":true,"color":"red"}},"reported":{"led":{"on":false,"color":"red"}}}}')
+        self.assertEqual((status_code, test["version"]), (200, 1), msg)
+
+        store.update("my-thing", b'{"state":{"desired":{"led":{"color":null}},"reported":{"temperature":21}}}')
+        status_code, test = store.get("my-thing")
+
+        self.assertEqual(test["version"], 2, msg)
+        self.assertEqual(test["state"]["desired"], { "led": { "on": True } }, msg)
+        self.assertEqual(test["state"]["reported"], { "led": { "on": False, "color": "red" }, "temperature": 21 }, msg)
+        self.assertEqual(test["state"]["delta"], { "led": { "on": True } }, msg)
+        self.assertIn("timestamp", test["metadata"]["reported"]["temperature"], msg)
+
+    def test_version_conflict(self):
+        """
+        Can reject an UPDATE of an old version
+        """
+        msg = f"Should answer 409, and keep the versions after a DELETE"
+
+        store = ShadowStore()
+        store.update("my-thing", b'{"state":{"reported":{"a":1}}}')
+
+        self.assertEqual(store.update("my-thing", b'{"state":{"reported":{"a":2}},"version":0}')[0], 409, msg)
+        self.assertEqual(store.update("my-thing", b'{"state":{"reported":{"a":2}},"version":1}')[0], 200, msg)
+        status_code, test = store.delete("my-thing")
+
+        self.assertEqual((status_code, test["version"]), (200, 2), msg)
+        self.assertEqual(store.get("my-thing")[0], 404, msg)
+        self.assertEqual(store.update("my-thing", b'{"state":{"reported":{"a":3}}}')[1]["version"], 3, msg)
+
+    def test_bad_document(self):
+        """
+        Can reject a document which is not a state document
+        """
+        msg = f"Should answer 400 or 413"
+
+        store = ShadowStore(max_payload_size=64)
+
+        self.assertEqual(store.update("my-thing", b'not json')[0], 400, msg)
+        self.assertEqual(store.update("my-thing", b'{"desired":{}}')[0], 400, msg)
+        self.assertEqual(store.update("my-thing", b'{"state":{"other":{}}}')[0], 400, msg)
+        self.assertEqual(store.update("my-thing", b'{"state":{"reported":{"data":"' + b"x" * 64 + b'"}}}')[0], 413, msg)
+
+    def test_compute_shadow_delta(self):
+        """
+        Can compute the delta between the desired and reported states
+        """
+        msg = f"Should keep the desired values which are not reported"
+
+        test = compute_shadow_delta({ "a": 1, "b": { "c": 2, "d": 3 }, "e": [1] }, { "a": 1, "b": { "c": 2 }, "e": [2], "f": 4 })
+
+        self.assertEqual(test, { "b": { "d": 3 }, "e": [1] }, msg)
+
+
+class TestStubShadowServer(unittest.TestCase):
+
+    def test_signed_requests(self):
+        """
+        Can serve the shadow API to a client signing its requests
+        """
+        msg = f"Should accept the signed requests"
+
+        with StubShadowServer(credentials={ CREDENTIALS.aws_access_key_id: CREDENTIALS.aws_secret_access_key }) as server:
+            with ShadowClient(CREDENTIALS, "eu-west-1", endpoint=server.endpoint) as client:
+                self.assertEqual(client.get("my-thing").status_code, 404, msg)
+                self.assertEqual(client.update("my-thing", { "state": { "desired": { "on": True } } }, "config").status_code, 200, msg)
+
+                test = client.get("my-thing", "config").raise_for_status().json()
+
+                self.assertEqual(test["state"], { "desired": { "on": True }, "delta": { "on": True } }, msg)
+                self.assertEqual(client.delete("my-thing", "config").json()["version"], 1, msg)
+
+    def test_bad_signature(self):
+        """
+        Can reject the requests signed with another secret or without signature
+        """
+        msg = f"Should answer 403"
+
+        with StubShadowServer(credentials={ CREDENTIALS.aws_access_key_id: "another secret" }) as server:
+            with ShadowClient(CREDENTIALS, "eu-west-1", endpoint=server.endpoint) as client:
+                test = client.get("my-thing")
+
+                self.assertEqual(test.status_code, 403, msg)
+                self.assertIn("signature", test.json()["message"], msg)
+
+                with self.assertRaises(urllib.error.HTTPError, msg=msg) as context:
+                    urllib.request.urlopen(f"{server.endpoint}/things/my-thing/shadow")
+                self.assertEqual(context.exception.code, 403, msg)
+
+    def test_comma_separated_authorization(self):
+        """
+        Can verify an Authorization header separated by commas
+        """
+        msg = f"Should accept the signature"
+
+        signed_request = sign_request(CREDENTIALS, "eu-west-1", "get", "my-thing")
+        headers = dict(signed_request.headers)
+        headers["Authorization"] = headers["Authorization"].replace(" Signed", ", Signed").replace(" Signature", ", Signature")
+
+        with StubShadowServer(credentials={ CREDENTIALS.aws_access_key_id: CREDENTIALS.aws_secret_access_key }) as server:
+            request = urllib.request.Request(f"{server.endpoint}{signed_request.path}", headers={ **headers, "Host": signed_request.host })
+            with self.assertRaises(urllib.error.HTTPError, msg=msg) as context:
+                urllib.request.urlopen(request)
+
+            self.assertEqual(context.exception.code, 404, msg)
+
+    def test_presigned_url(self):
+        """
+        Can verify a presigned URL
+        """
+        msg = f"Should accept the signature in the query string"
+
+        url = urlsplit(presign_url(CREDENTIALS, "eu-west-1", "update", "my-thing", payload='{"state":{"reported":{"on":true}}}'))
+
+        with StubShadowServer(credentials={ CREDENTIALS.aws_access_key_id: CREDENTIALS.aws_secret_access_key }) as server:
+            request = urllib.request.Request(f"{server.endpoint}{url.path}?{url.query}", data=b'{"state":{"reported":{"on":true}}}', headers={ "Host": url.hostname })
+            with urllib.request.urlopen(request) as response:
+                test = json.load(response)
+
+            self.assertEqual(test["version"], 1, msg)
+
+            request = urllib.request.Request(f"{server.endpoint}{url.path}?{url.query}", data=b'{"state":{"reported":{"on":false}}}', headers={ "Host": url.hostname })
+            with self.assertRaises(urllib.error.HTTPError, msg=msg) as context:
+                urllib.request.urlopen(request)
+            self.assertEqual(context.exception.code, 403, msg)
+
+    def test_fault_injection(self):
+        """
+        Can throttle the requests and inject errors
+        """
+        msg = f"Should answer 429 above the rate limit and 500 at the error rate"
+
+        with StubShadowServer(rate_limit=2) as server:
+            with ShadowClient(CREDENTIALS, "eu-west-1", endpoint=server.endpoint) as client:
+                test = [client.get("my-thing").status_code for _ in range(5)]
+
+            self.assertEqual(test[:2], [404, 404], msg)
+            self.assertIn(429, test, msg)
+
+        with StubShadowServer(error_rate=1.0) as server:
+            with ShadowClient(CREDENTIALS, "eu-west-1", endpoint=server.endpoint) as client:
+                self.assertEqual(client.get("my-thing").status_code, 500, msg)
+            self.assertEqual(server.status_codes, { 500: 1 }, msg)
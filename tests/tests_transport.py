@@ -0,0 +1,484 @@
+import os
+import re
+import ssl
+import json
+import time
+import shutil
+import socket
+import importlib.util
+import tempfile
+import threading
+import unittest
+import subprocess
+import http.client
+
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from aws_create_request.app import Credentials
+from aws_create_request.client import ShadowClient
+from aws_create_request.stub_server import ShadowStore, SigV4Verifier, StubShadowServer
+from aws_create_request.transport import HTTP2Transport, HTTPClientTransport, MutualTLSTransport, RefusedStreamError, TransportResponse, create_transport, parse_endpoint
+
+
+class EchoHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    connections = 0
+    dropped = 0
+
+    def setup(self):
+        EchoHandler.connections += 1
+        self.requests = 0
+        super().setup()
+
+    def do_GET(self):
+        self.requests += 1
+        # Close a kept-alive connection after reading the request, without answering
+        if self.path == "/drop" and self.requests > 1:
+            self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            EchoHandler.dropped += 1
+            self.close_connection = True
+            return
+        content = json.dumps({ "path": self.path, "host": self.headers["Host"] }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+        # Close without telling the client
+        if self.path == "/close":
+            self.close_connection = True
+
+    do_POST = do_GET
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestHTTPClientTransport(unittest.TestCase):
+
+    def setUp(self):
+        EchoHandler.connections = 0
+        EchoHandler.dropped = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), EchoHandler)
+        self.endpoint = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_signed_host(self):
+        """
+        Can send the signed host while connecting to another endpoint
+        """
+        msg = f"Should send the request with the signed host header"
+
+        test = HTTPClientTransport(endpoint=self.endpoint)
+        response = test.request("GET", "data-ats.iot.eu-west-1.amazonaws.com", "/things/my-thing/shadow?name=config", {})
+        test.close()
+
+        self.assertIsInstance(response, TransportResponse, msg)
+        self.assertEqual(response.status_code, 200, msg)
+        self.assertEqual(response.json(), { "path": "/things/my-thing/shadow?name=config", "host": "data-ats.iot.eu-west-1.amazonaws.com" }, msg)
+
+    def test_keep_alive(self):
+        """
+        Can reuse a persistent connection between requests
+        """
+        msg = f"Should open only one connection for successive requests"
+
+        test = HTTPClientTransport(endpoint=self.endpoint)
+        for _ in range(5):
+            test.request("GET", "data-ats.iot.eu-west-1.amazonaws.com", "/", {})
+        pool = test.get_pool("data-ats.iot.eu-west-1.amazonaws.com")
+        test.close()
+
+        self.assertEqual(EchoHandler.connections, 1, msg)
+        self.assertEqual(pool.created, 1, msg)
+        self.assertEqual(pool.reused, 4, msg)
+
+    def test_idle_timeout(self):
+        """
+        Can drop a connection idle for too long
+        """
+        msg = f"Should open a new connection after the idle timeout"
+
+        test = HTTPClientTransport(endpoint=self.endpoint, idle_timeout=0.01)
+        test.request("GET", "data-ats.iot.eu-west-1.amazonaws.com", "/", {})
+        time.sleep(0.05)
+        test.request("GET", "data-ats.iot.eu-west-1.amazonaws.com", "/", {})
+        test.close()
+
+        self.assertEqual(EchoHandler.connections, 2, msg)
+
+    def test_closed_by_server(self):
+        """
+        Can detect a connection closed by the server before reusing it
+        """
+        msg = f"Should open a new connection instead of failing"
+
+        test = HTTPClientTransport(endpoint=self.endpoint)
+        test.request("GET", "data-ats.iot.eu-west-1.amazonaws.com", "/close", {})
+        time.sleep(0.05)
+        response = test.request("GET", "data-ats.iot.eu-west-1.amazonaws.com", "/", {})
+        pool = test.get_pool("data-ats.iot.eu-west-1.amazonaws.com")
+        test.close()
+
+        self.assertEqual(response.status_code, 200, msg)
+        self.assertEqual(EchoHandler.connections, 2, msg)
+        self.assertEqual(pool.reused, 0, msg)
+
+    def test_resend(self):
+        """
+        Can send a GET once again when a kept-alive connection fails, but not an UPDATE
+        """
+        msg = f"Should resend the GET on a new connection, and raise for the POST the server may have applied"
+
+        test = HTTPClientTransport(endpoint=self.endpoint)
+        test.request("GET", "data-ats.iot.eu-west-1.amazonaws.com", "/", {})
+        response = test.request("GET", "data-ats.iot.eu-west-1.amazonaws.com", "/drop", {})
+
+        self.assertEqual(response.status_code, 200, msg)
+        self.assertEqual((EchoHandler.connections, EchoHandler.dropped), (2, 1), msg)
+
+        test.request("GET", "data-ats.iot.eu-west-1.amazonaws.com", "/", {})
+        with self.assertRaises(http.client.RemoteDisconnected, msg=msg):
+            test.request("POST", "data-ats.iot.eu-west-1.amazonaws.com", "/drop", {}, b'{"state":{}}')
+        test.close()
+
+        self.assertEqual((EchoHandler.connections, EchoHandler.dropped), (2, 2), msg)
+
+
+def create_certificates(directory: str) -> None:
+    """A CA, the certificate of the server signed by it, and the certificate of a thing signed by it"""
+    def openssl(*args: str) -> None:
+        subprocess.run(["openssl", *args], cwd=directory, check=True, capture_output=True)
+
+    ec_key = ["-newkey", "ec", "-pkeyopt", "ec_paramgen_curve:prime256v1", "-nodes"]
+    openssl("req", "-x509", *ec_key, "-keyout", "ca.key", "-out", "ca.pem", "-days", "1", "-subj", "/CN=Test CA", "-addext", "basicConstraints=critical,CA:TRUE", "-addext", "keyUsage=critical,keyCertSign")
+
+    with open(os.path.join(directory, "server.ext"), "w") as extensions:
+        extensions.write("subjectAltName=DNS:data-ats.iot.eu-west-1.amazonaws.com\n")
+    for name, extensions in (("server", ["-extfile", "server.ext"]), ("thing", [])):
+        openssl("req", *ec_key, "-keyout", f"{name}.key", "-out", f"{name}.csr", "-subj", f"/CN={name}")
+        openssl("x509", "-req", "-in", f"{name}.csr", "-CA", "ca.pem", "-CAkey", "ca.key", "-CAcreateserial", "-out", f"{name}.pem", "-days", "1", *extensions)
+
+
+@unittest.skipIf(shutil.which("openssl") is None, "openssl is needed to create the certificates")
+class TestMutualTLSTransport(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        create_certificates(cls.directory.name)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory.name, name)
+
+    def create_server(self) -> StubShadowServer:
+        ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        ssl_context.load_cert_chain(self.path("server.pem"), self.path("server.key"))
+        ssl_context.load_verify_locations(self.path("ca.pem"))
+        ssl_context.verify_mode = ssl.CERT_OPTIONAL
+        return StubShadowServer(credentials={ "AKIDEXAMPLE": "secret" }, ssl_context=ssl_context)
+
+    def test_client_certificate(self):
+        """
+        Can send unsigned requests authenticated with the certificate of the thing
+        """
+        msg = f"Should be accepted without Authorization header, unlike an unsigned request without certificate"
+
+        with self.create_server() as server:
+            transport = MutualTLSTransport(self.path("thing.pem"), self.path("thing.key"), self.path("ca.pem"), endpoint=server.endpoint)
+            with ShadowClient(None, "eu-west-1", transport=transport) as client:
+                self.assertEqual(client.update("my-thing", { "state": { "reported": { "on": True } } }).status_code, 200, msg)
+
+                test = client.get("my-thing")
+
+                self.assertEqual(test.status_code, 200, msg)
+                self.assertNotIn("Authorization", test.request.headers, msg)
+
+            ssl_context = ssl.create_default_context(cafile=self.path("ca.pem"))
+            transport = HTTPClientTransport(endpoint=server.endpoint, ssl_context=ssl_context)
+            test = transport.request("GET", "data-ats.iot.eu-west-1.amazonaws.com", "/things/my-thing/shadow", {})
+            transport.close()
+
+            self.assertEqual(test.status_code, 403, msg)
+
+    def test_session_resumption(self):
+        """
+        Can resume the TLS session on the new connections
+        """
+        msg = f"Should skip the full handshake of the next connections"
+
+        with self.create_server() as server:
+            transport = MutualTLSTransport(self.path("thing.pem"), self.path("thing.key"), self.path("ca.pem"), endpoint=server.endpoint, idle_timeout=0)
+            with ShadowClient(None, "eu-west-1", transport=transport) as client:
+                test = [client.get("my-thing").status_code for _ in range(3)]
+                pool = transport.get_pool("data-ats.iot.eu-west-1.amazonaws.com")
+
+            self.assertEqual(test, [404] * 3, msg)
+            self.assertEqual(pool.created, 3, msg)
+            self.assertEqual(pool.resumed, 2, msg)
+
+    def test_arguments(self):
+        """
+        Can refuse a client without credentials nor certificate, and a plain HTTP endpoint
+        """
+        msg = f"Should raise a ValueError"
+
+        with self.assertRaises(ValueError, msg=msg):
+            ShadowClient(None, "eu-west-1")
+        with self.assertRaises(ValueError, msg=msg):
+            MutualTLSTransport(self.path("thing.pem"), self.path("thing.key"), endpoint="http://127.0.0.1:8443")
+
+        self.assertFalse(ShadowClient(Credentials("AKID", "SECRET"), "eu-west-1").transport.authenticates, msg)
+
+
+class HTTP2ShadowServer:
+    """
+        HTTP/2 server answering the classic shadow requests from a ShadowStore once their signature is checked.
+        Prior knowledge without ssl_context, ALPN h2 with it. One thread per connection
+    """
+
+    SHADOW_PATH = re.compile(r"^/things/([^/]+)/shadow$")
+
+    def __init__(self, credentials: dict[str, str], ssl_context: ssl.SSLContext | None = None, refuse_after: int | None = None) -> None:
+        import h2.config
+
+        self.verifier = SigV4Verifier(credentials)
+        self.store = ShadowStore()
+        self.ssl_context = ssl_context
+        # Streams answered per connection before the next ones are refused (REFUSED_STREAM)
+        self.refuse_after = refuse_after
+        self.config = h2.config.H2Configuration(client_side=False, header_encoding="utf-8")
+        self.connections = []
+        self.signed_headers = set()
+        self.listener = socket.create_server(("127.0.0.1", 0))
+        self.endpoint = f"{'https' if ssl_context is not None else 'http'}://127.0.0.1:{self.listener.getsockname()[1]}"
+        threading.Thread(target=self.accept, daemon=True).start()
+
+    def accept(self):
+        while True:
+            try:
+                sock, _ = self.listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=self.serve, args=(sock,), daemon=True).start()
+
+    def serve(self, sock):
+        import h2.connection
+        import h2.events
+
+        try:
+            if self.ssl_context is not None:
+                sock = self.ssl_context.wrap_socket(sock, server_side=True)
+            self.connections.append(sock)
+            connection = h2.connection.H2Connection(config=self.config)
+            connection.initiate_connection()
+            sock.sendall(connection.data_to_send())
+            requests = {}
+            received = 0
+            while True:
+                data = sock.recv(65536)
+                if not data:
+                    return
+                for event in connection.receive_data(data):
+                    if isinstance(event, h2.events.RequestReceived):
+                        received += 1
+                        if self.refuse_after is not None and received > self.refuse_after:
+                            connection.reset_stream(event.stream_id, error_code=0x7)
+                        else:
+                            requests[event.stream_id] = (event.headers, bytearray())
+                    elif isinstance(event, h2.events.DataReceived):
+                        if event.stream_id in requests:
+                            requests[event.stream_id][1].extend(event.data)
+                        connection.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+                    elif isinstance(event, h2.events.StreamEnded) and event.stream_id in requests:
+                        status_code, document = self.answer(*requests.pop(event.stream_id))
+                        content = json.dumps(document).encode("utf-8")
+                        connection.send_headers(event.stream_id, [(":status", str(status_code)), ("content-length", str(len(content)))])
+                        connection.send_data(event.stream_id, content, end_stream=True)
+                sock.sendall(connection.data_to_send())
+        except OSError:
+            pass
+        finally:
+            sock.close()
+
+    def answer(self, header_list, body):
+        headers = http.client.HTTPMessage()
+        for name, value in header_list:
+            headers[name] = value
+        path, _, query = headers[":path"].partition("?")
+        try:
+            self.verifier.verify(headers[":method"], path, query, headers, bytes(body))
+        except ValueError as v_err:
+            return 403, { "message": str(v_err) }
+        self.signed_headers.add(headers["authorization"].split("SignedHeaders=")[1].split(" ")[0])
+
+        match = self.SHADOW_PATH.match(path)
+        if match is None:
+            return 404, { "message": "Not Found" }
+        shadow_name = dict(pair.split("=", 1) for pair in query.split("&") if "=" in pair).get("name")
+        if headers[":method"] == "POST":
+            return self.store.update(match.group(1), bytes(body), shadow_name)
+        return self.store.get(match.group(1), shadow_name)
+
+    def drop_connections(self):
+        for sock in self.connections:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                # Already closed
+                pass
+
+    def close(self):
+        self.listener.close()
+        self.drop_connections()
+
+
+@unittest.skipIf(importlib.util.find_spec("h2") is None, "h2 is needed by the HTTP/2 transport")
+class TestHTTP2Transport(unittest.TestCase):
+
+    CREDENTIALS = Credentials("AKIDEXAMPLE", "wJalrXUtnFEMI/K7MDENG+bPxRfiCYEXAMPLEKEY")
+
+    def setUp(self):
+        self.server = HTTP2ShadowServer({ self.CREDENTIALS.aws_access_key_id: self.CREDENTIALS.aws_secret_access_key })
+
+    def tearDown(self):
+        self.server.close()
+
+    def test_multiplexing(self):
+        """
+        Can send many concurrent signed requests over one connection
+        """
+        msg = f"Should open one connection, sign ':authority' and get every answer"
+
+        transport = HTTP2Transport(endpoint=self.server.endpoint)
+        with ShadowClient(self.CREDENTIALS, "eu-west-1", transport=transport) as client:
+            with ThreadPoolExecutor(max_workers=150) as executor:
+                test = list(executor.map(lambda i: client.update(f"thing-{i % 10}", { "state": { "reported": { "i": i } } }, "config").status_code, range(500)))
+
+            shadow = client.get("thing-3", "config")
+
+        self.assertEqual(test, [200] * 500, msg)
+        self.assertEqual(shadow.json()["version"], 50, msg)
+        self.assertEqual(len(self.server.connections), 1, msg)
+        self.assertEqual(self.server.signed_headers, { ":authority;x-amz-date" }, msg)
+
+    def test_flow_control(self):
+        """
+        Can send a body larger than the flow control window
+        """
+        msg = f"Should wait for the window to open again instead of failing"
+
+        transport = HTTP2Transport(endpoint=self.server.endpoint)
+        body = b"x" * 300000
+        test = transport.request("POST", "data-ats.iot.eu-west-1.amazonaws.com", "/unknown", { "Content-Length": str(len(body)) }, body)
+        transport.close()
+
+        # Answered once every byte was received
+        self.assertEqual(test.status_code, 403, msg)
+
+    def test_reconnect(self):
+        """
+        Can open a new connection once the server closed the previous one
+        """
+        msg = f"Should reconnect instead of failing"
+
+        transport = HTTP2Transport(endpoint=self.server.endpoint)
+        with ShadowClient(self.CREDENTIALS, "eu-west-1", transport=transport) as client:
+            client.get("my-thing")
+            self.server.drop_connections()
+            time.sleep(0.05)
+
+            test = client.get("my-thing")
+
+        self.assertEqual(test.status_code, 404, msg)
+        self.assertEqual(transport.created, 2, msg)
+
+    def test_refused_stream(self):
+        """
+        Can send a stream refused on a reused connection once again, on a new connection
+        """
+        msg = f"Should retry a refused stream exactly once on a new connection, and give up when the new one refuses it too"
+
+        self.server.close()
+        self.server = HTTP2ShadowServer({ self.CREDENTIALS.aws_access_key_id: self.CREDENTIALS.aws_secret_access_key }, refuse_after=1)
+        transport = HTTP2Transport(endpoint=self.server.endpoint, timeout=2.0)
+        with ShadowClient(self.CREDENTIALS, "eu-west-1", transport=transport) as client:
+            test = [client.get("my-thing").status_code for _ in range(3)]
+        self.assertEqual(test, [404] * 3, msg)
+        self.assertEqual(transport.created, 3, msg)
+
+        self.server.close()
+        self.server = HTTP2ShadowServer({ self.CREDENTIALS.aws_access_key_id: self.CREDENTIALS.aws_secret_access_key }, refuse_after=0)
+        transport = HTTP2Transport(endpoint=self.server.endpoint, timeout=2.0)
+        with ShadowClient(self.CREDENTIALS, "eu-west-1", transport=transport) as client:
+            with self.assertRaises(RefusedStreamError, msg=msg):
+                client.get("my-thing")
+        self.assertEqual(transport.created, 1, msg)
+
+    @unittest.skipIf(shutil.which("openssl") is None, "openssl is needed to create the certificates")
+    def test_tls(self):
+        """
+        Can negotiate HTTP/2 with ALPN over TLS
+        """
+        msg = f"Should answer over TLS, and refuse a server without h2"
+
+        with tempfile.TemporaryDirectory() as directory:
+            create_certificates(directory)
+            ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            ssl_context.load_cert_chain(os.path.join(directory, "server.pem"), os.path.join(directory, "server.key"))
+            ssl_context.set_alpn_protocols(["h2"])
+            server = HTTP2ShadowServer({ self.CREDENTIALS.aws_access_key_id: self.CREDENTIALS.aws_secret_access_key }, ssl_context)
+
+            transport = HTTP2Transport(endpoint=server.endpoint, ssl_context=ssl.create_default_context(cafile=os.path.join(directory, "ca.pem")))
+            with ShadowClient(self.CREDENTIALS, "eu-west-1", transport=transport) as client:
+                test = client.get("my-thing")
+            server.close()
+
+            self.assertEqual(test.status_code, 404, msg)
+
+            ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            ssl_context.load_cert_chain(os.path.join(directory, "server.pem"), os.path.join(directory, "server.key"))
+            with StubShadowServer(ssl_context=ssl_context) as server:
+                transport = HTTP2Transport(endpoint=server.endpoint, ssl_context=ssl.create_default_context(cafile=os.path.join(directory, "ca.pem")))
+                with self.assertRaises(ConnectionError, msg=msg):
+                    transport.request("GET", "data-ats.iot.eu-west-1.amazonaws.com", "/things/my-thing/shadow", {})
+
+
+class TestTransportFactory(unittest.TestCase):
+
+    def test_parse_endpoint(self):
+        """
+        Can parse an endpoint override
+        """
+        msg = f"Should split the endpoint in scheme, address and port"
+
+        self.assertEqual(parse_endpoint(None), (True, None, None), msg)
+        self.assertEqual(parse_endpoint("http://127.0.0.1:8080"), (False, "127.0.0.1", 8080), msg)
+        self.assertEqual(parse_endpoint("https://localhost"), (True, "localhost", 443), msg)
+
+        with self.assertRaises(ValueError, msg=msg):
+            parse_endpoint("ftp://localhost")
+
+    def test_unknown_transport(self):
+        """
+        Can't create an unknown transport
+        """
+        msg = f"Should raise a ValueError exception"
+
+        with self.assertRaises(ValueError, msg=msg):
+            create_transport("random_value")
+
+
+
+if __name__.__eq__("__main__"):
+    unittest.main()
+    print("All tests passed successfully")
@@ -0,0 +1,104 @@
+import unittest
+
+from aws_create_request.app import Credentials
+from aws_create_request.client import ShadowClient
+from aws_create_request.stub_server import StubShadowServer
+from aws_create_request.transport import Transport
+from aws_create_request.update_queue import UpdateQueue
+
+
+CREDENTIALS = Credentials("AKIDEXAMPLE", "wJalrXUtnFEMI/K7MDENG+bPxRfiCYEXAMPLEKEY")
+
+
+class FailingTransport(Transport):
+
+    def request(self, method, host, path, headers, body=b""):
+        raise ConnectionResetError()
+
+
+class TestUpdateQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.server = StubShadowServer(credentials={ CREDENTIALS.aws_access_key_id: CREDENTIALS.aws_secret_access_key }).start()
+        self.client = ShadowClient(CREDENTIALS, "eu-west-1", endpoint=self.server.endpoint)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+
+    def get_state(self, thing_name, shadow_name=None):
+        return self.client.get(thing_name, shadow_name).json()
+
+    def test_burst(self):
+        """
+        Can combine a burst of updates of a shadow in one UPDATE
+        """
+        msg = f"Should send one UPDATE, later values winning and null deleting, and give its flush to every caller"
+
+        with UpdateQueue(self.client, window=0.2) as queue:
+            futures = [queue.submit("my-thing", { "state": { "reported": { "temperature": i, "humidity": 40 } } }) for i in range(10)]
+            futures.append(queue.submit("my-thing", { "state": { "reported": { "humidity": None }, "desired": { "fan": "on" } } }))
+            test = [future.result(5) for future in futures]
+
+        shadow = self.get_state("my-thing")
+
+        self.assertEqual({ combined_update.flush_id for combined_update in test }, { 1 }, msg)
+        self.assertEqual(test[0].updates, 11, msg)
+        self.assertEqual(test[0].response.status_code, 200, msg)
+        self.assertEqual(shadow["state"]["reported"], { "temperature": 9 }, msg)
+        self.assertEqual(shadow["state"]["desired"], { "fan": "on" }, msg)
+        self.assertEqual(shadow["version"], 1, msg)
+
+    def test_limits(self):
+        """
+        Can flush a shadow once max_updates are combined, apart from the other shadows
+        """
+        msg = f"Should send one UPDATE per max_updates, and one per shadow"
+
+        with UpdateQueue(self.client, window=5.0, max_updates=2) as queue:
+            test = [queue.submit("my-thing", { "state": { "reported": { "i": i } } }) for i in range(3)]
+            other = queue.submit("my-other-thing", { "state": { "reported": { "i": 3 } } })
+            # Sent at once : the first two fill max_updates
+            self.assertEqual(test[0].result(1).flush_id, test[1].result(1).flush_id, msg)
+            queue.flush()
+
+            self.assertNotEqual(test[2].result().flush_id, other.result().flush_id, msg)
+            self.assertEqual(queue.get_stats(), { "submitted": 4, "flushes": 3, "pending": 0 }, msg)
+
+        self.assertEqual(self.get_state("my-thing")["version"], 2, msg)
+
+    def test_uncombinable(self):
+        """
+        Can keep the order of updates which cannot be written as one document
+        """
+        msg = f"Should send a deleted object set again in a second UPDATE"
+
+        self.client.update("my-thing", { "state": { "desired": { "light": { "color": "red", "level": 3 } } } }, "config")
+
+        with UpdateQueue(self.client, window=0.2) as queue:
+            first = queue.submit("my-thing", { "state": { "desired": { "light": None } } }, "config")
+            second = queue.submit("my-thing", { "state": { "desired": { "light": { "color": "blue" } } } }, "config")
+            test = (first.result(5).flush_id, second.result(5).flush_id)
+
+        self.assertEqual(test, (1, 2), msg)
+        self.assertEqual(self.get_state("my-thing", "config")["state"]["desired"], { "light": { "color": "blue" } }, msg)
+
+    def test_errors(self):
+        """
+        Can refuse a bad document and give a failed UPDATE to its callers
+        """
+        msg = f"Should raise ValueError, then the error of the transport from every Future"
+
+        with UpdateQueue(ShadowClient(CREDENTIALS, "eu-west-1", transport=FailingTransport()), window=0.01) as queue:
+            with self.assertRaises(ValueError, msg=msg):
+                queue.submit("my-thing", { "reported": {} })
+            with self.assertRaises(ValueError, msg=msg):
+                queue.submit("my-thing", { "state": {}, "version": 3 })
+
+            futures = [queue.submit("my-thing", { "state": { "reported": { "i": i } } }) for i in range(2)]
+            for future in futures:
+                with self.assertRaises(ConnectionResetError, msg=msg):
+                    future.result(5)
+
+        with self.assertRaises(RuntimeError, msg=msg):
+            queue.submit("my-thing", { "state": {} })